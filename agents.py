@@ -1,22 +1,39 @@
 """
 Sistema de agentes usando LangGraph para criação e revisão de conteúdos
 """
-from typing import TypedDict, Annotated, Literal
+from typing import TypedDict, Annotated, Literal, Callable, Iterator, NamedTuple
 from langgraph.graph import StateGraph, END
 from langchain_anthropic import ChatAnthropic
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
-from models import ConteudoGerado, AvaliacaoRevisor, ConfigGerador
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.utils.json import parse_partial_json
+from pydantic import BaseModel, ValidationError, create_model
+from models import ConteudoGerado, AvaliacaoRevisor, AvaliacaoComparativa, ConfigGerador, VeredictoCampo
+import resiliencia
+import telemetria
+from limites import limitador, Reserva
+import validadores
+from mocks import ChatMock
 import operator
 import json
 import os
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
 
-MAX_TOKENS_ = 16000
+# Versão dos templates de prompt: incrementar ao alterá-los (invalida o cache de resultados)
+VERSAO_PROMPT = "3"
+INTERVALO_PARCIAL_ = 0.15  # segundos entre envios de campos parciais
 
 # Estado compartilhado entre os nós
 class AgentState(TypedDict):
@@ -26,198 +43,975 @@ class AgentState(TypedDict):
     iteracao_atual: Annotated[int, operator.add]
     logs: Annotated[list[str], operator.add]
     timestamp: str
+    # Problemas encontrados pela validação determinística do último rascunho
+    problemas_validacao: list[VeredictoCampo]
+    # Rascunhos gerados em paralelo na rodada atual (modo best-of-N)
+    candidatos: list[ConteudoGerado]
+    # Trajetória das notas e melhor versão já revisada (a final, se as seguintes piorarem)
+    historico_notas: Annotated[list[float], operator.add]
+    melhor_conteudo: ConteudoGerado | None
+    melhor_avaliacao: AvaliacaoRevisor | None
+    # Consumo para o orçamento do job
+    inicio: float
+    uso_tokens: Annotated[int, operator.add]
+    # Tokens de cada chamada ao LLM (provedor, modelo, nó), para o custo do job
+    uso_chamadas: Annotated[list[dict], operator.add]
+    # Falha do revisor em todos os provedores (encerra o loop sem inventar uma nota)
+    erro_revisao: str | None
+
+
+# Modelos de cada provedor: (principal, rápido). O rápido é o padrão do revisor.
+# A ordem também é a da cadeia de failover padrão
+MODELOS = {
+    "anthropic": ("claude-sonnet-4-5", "claude-haiku-4-5"),  # Claude Sonnet 4.5 / Haiku 4.5
+    "openai": ("gpt-5", "gpt-5-mini"),  # GPT-5 / GPT-5 mini
+    "google": ("gemini-2.5-pro", "gemini-2.5-flash"),  # Gemini 2.5 Plus / Flash
+    "deepseek": ("deepseek-chat", "deepseek-chat"),  # DeepSeek v3
+    "grok": ("grok-2.0", "grok-3-mini"),  # Grok 2.0 / Grok 3 mini
+    "qwen": ("qwq-32b-preview", "qwen-turbo"),  # Qwen QwQ-32B-Preview / Qwen Turbo
+    "mock": ("mock-criador", "mock-revisor"),  # Simulado, sem API (mocks.py)
+}
+
+VARIAVEIS_API = {
+    "anthropic": "ANTHROPIC_API_KEY",
+    "openai": "OPENAI_API_KEY",
+    "google": "GOOGLE_API_KEY",
+    "deepseek": "DEEPSEEK_API_KEY",
+    "grok": "XAI_API_KEY",
+    "qwen": "DASHSCOPE_API_KEY",
+}
+
+# Modelos conhecidos; os demais (modelo_criador/modelo_revisor livres) aparecem como "outro" nas métricas
+MODELOS_CONHECIDOS = {modelo for modelos in MODELOS.values() for modelo in modelos}
+
+# Folga do timeout do próprio cliente sobre timeout_llm_segundos: a camada de resiliência desiste
+# da tentativa no prazo, e o cliente encerra logo depois a requisição abandonada (e a thread dela)
+MARGEM_TIMEOUT_CLIENTE = 30
+# Clientes e runnables mantidos em cache: modelo, temperatura e max_tokens vêm do pedido
+TAMANHO_CACHE_LLM = 64
+
+
+class PerfilLLM(NamedTuple):
+    """Provedor e parâmetros do modelo usado por um papel (criador ou revisor)"""
+    provider: str
+    modelo: str
+    max_tokens: int
+    temperatura: float
+    timeout: float
+
+
+def _timeout_cliente(config: ConfigGerador) -> float:
+    return config.timeout_llm_segundos + MARGEM_TIMEOUT_CLIENTE
+
+
+def perfil_criador(config: ConfigGerador, provider: str | None = None) -> PerfilLLM:
+    """Modelo principal do provedor, com limite de tokens para o conteúdo completo"""
+    provider = provider or config.llm_provider
+    # modelo_criador se refere ao provedor principal; os demais usam o modelo padrão
+    modelo = config.modelo_criador if provider == config.llm_provider else None
+    provider = provider if provider in MODELOS else "anthropic"
+    return PerfilLLM(
+        provider,
+        modelo or MODELOS[provider][0],
+        config.max_tokens_criador,
+        config.temperatura_criador,
+        _timeout_cliente(config)
+    )
+
+
+def perfil_revisor(config: ConfigGerador) -> PerfilLLM:
+    """Modelo rápido (do provedor do revisor ou do criador), com limite de tokens curto"""
+    provider = config.revisor_provider or config.llm_provider
+    provider = provider if provider in MODELOS else "anthropic"
+    return PerfilLLM(
+        provider,
+        config.modelo_revisor or MODELOS[provider][1],
+        config.max_tokens_revisor,
+        config.temperatura_revisor,
+        _timeout_cliente(config)
+    )
+
+
+def _fallbacks(config: ConfigGerador, principal: PerfilLLM, indice_modelo: int) -> list[PerfilLLM]:
+    """Perfis equivalentes nos demais provedores, na ordem de failover"""
+    if config.provedores_fallback is None:
+        # O provedor simulado só entra no failover se pedido explicitamente
+        provedores = [p for p in MODELOS if p in VARIAVEIS_API and os.getenv(VARIAVEIS_API[p])]
+    else:
+        provedores = [p for p in config.provedores_fallback if p in MODELOS]
+    return [
+        principal._replace(provider=p, modelo=MODELOS[p][indice_modelo])
+        for p in dict.fromkeys(provedores) if p != principal.provider
+    ]
+
+
+def cadeia_criador(config: ConfigGerador, provider: str | None = None) -> list[PerfilLLM]:
+    """Perfil do criador seguido dos provedores de failover (modelos principais)"""
+    principal = perfil_criador(config, provider)
+    return [principal] + _fallbacks(config, principal, 0)
+
+
+def cadeia_revisor(config: ConfigGerador) -> list[PerfilLLM]:
+    """Perfil do revisor seguido dos provedores de failover (modelos rápidos)"""
+    principal = perfil_revisor(config)
+    return [principal] + _fallbacks(config, principal, 1)
+
+
+# Registro de runnables compartilhados entre todas as requisições (os menos usados saem do cache)
+@lru_cache(maxsize=TAMANHO_CACHE_LLM)
+def _get_llm(perfil: PerfilLLM):
+    """Retorna o cliente LLM do perfil (um por processo, reaproveitando conexões HTTP)"""
+    provider, modelo, max_tokens, temperatura, timeout = perfil
+    if provider == "openai":
+        return ChatOpenAI(
+            model=modelo,
+            temperature=temperatura,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=0,  # novas tentativas ficam a cargo de resiliencia.py
+            stream_usage=True  # uso de tokens também no streaming (custos, orçamento e limitador)
+        )
+    elif provider == "google":
+        return ChatGoogleGenerativeAI(
+            model=modelo,
+            temperature=temperatura,
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=0
+        )
+    elif provider == "deepseek":
+        return ChatOpenAI(
+            base_url="https://api.deepseek.com",
+            model=modelo,
+            temperature=temperatura,
+            api_key=os.getenv("DEEPSEEK_API_KEY"),
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=0,
+            stream_usage=True
+        )
+    elif provider == "grok":
+        return ChatOpenAI(
+            base_url="https://api.x.ai/v1",
+            model=modelo,
+            temperature=temperatura,
+            api_key=os.getenv("XAI_API_KEY"),
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=0,
+            stream_usage=True
+        )
+    elif provider == "mock":
+        return ChatMock(modelo=modelo, max_tokens=max_tokens)
+    elif provider == "qwen":
+        return ChatOpenAI(
+            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            model=modelo,
+            temperature=temperatura,
+            api_key=os.getenv("DASHSCOPE_API_KEY"),
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=0,
+            stream_usage=True
+        )
+    else:
+        # Anthropic (também o padrão para provedores desconhecidos)
+        return ChatAnthropic(
+            model=modelo,
+            temperature=temperatura,
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=0
+        )
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_LLM)
+def _get_llm_estruturado(perfil: PerfilLLM, schema: type[BaseModel]):
+    """Retorna o runnable de saída estruturada (com a resposta bruta, para reparos)"""
+    return _get_llm(perfil).with_structured_output(schema, include_raw=True)
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_LLM)
+def _get_llm_tool(perfil: PerfilLLM, schema: type[BaseModel]):
+    """Retorna o LLM com o schema forçado como tool (usado no streaming parcial)"""
+    return _get_llm(perfil).bind_tools([schema], tool_choice=schema.__name__)
+
+
+@lru_cache(maxsize=None)
+def _schema_parcial(schema: type[BaseModel], campos: tuple[str, ...]) -> type[BaseModel]:
+    """Schema com apenas alguns campos (mesmas validações do schema original)"""
+    return create_model(
+        f"{schema.__name__}Parcial",
+        __doc__=f"Campos de {schema.__name__} a serem gerados novamente",
+        **{campo: (schema.model_fields[campo].annotation, schema.model_fields[campo]) for campo in campos}
+    )
+
+
+def _dados_brutos(raw) -> dict:
+    """Extrai os argumentos da resposta bruta do LLM quando o parsing falhou"""
+    if getattr(raw, "tool_calls", None):
+        return raw.tool_calls[0]["args"]
+    conteudo = raw.content if isinstance(raw.content, str) else "".join(
+        parte.get("text", "") for parte in raw.content if isinstance(parte, dict)
+    )
+    dados = parse_partial_json(conteudo.strip().removeprefix("```json").removesuffix("```"))
+    return dados if isinstance(dados, dict) else {}
+
+
+# Partes fixas dos prompts: enviadas como bloco de sistema para aproveitar o cache de prefixo
+PROMPT_SISTEMA_CRIADOR = """Você é um especialista em marketing digital e copywriting para produtos educacionais brasileiros.
+
+TAREFA: Gere conteúdos persuasivos, modernos e otimizados para conversão, sempre mantendo tom descontraído mas profissional.
+
+DIRETRIZES:
+1. **Tipo de Material**: Classifique entre "Baralhos Anki", "Mapas Mentais", "Músicas" ou "Podcasts" baseado nos insumos
+2. **Descrição Hotmart**: Texto atrativo e instigante (máximo 1.800 caracteres). Foque nos benefícios e transformação
+3. **Artigo Blog**: HTML completo com estrutura moderna (<article>, <section>, <h1-h3>, <p>, <strong>, <ul>). Narrativa de venda engajadora com:
+   - Introdução que prende atenção
+   - Desenvolvimento mostrando benefícios
+   - Call-to-action forte
+4. **Legenda Instagram**: Texto curto, envolvente, com emojis estratégicos e hashtags relevantes
+5. **Nome Criativo**: Máximo 5 palavras impactantes que vendam o produto
+6. **Descrição Página de Vendas**: Máximo 25 palavras ultra-persuasivas
+
+PÚBLICO-ALVO: Estudantes brasileiros de concursos públicos e OAB que buscam aprovação
+
+ESTILO: 
+- Tom: Motivacional, acessível, brasileiro
+- Evite jargões excessivos
+- Use linguagem que conecta e inspira
+- Destaque transformação e resultados"""
+
+PROMPT_SISTEMA_REVISOR = """Você é um revisor especializado em conteúdos de marketing digital para educação.
+
+CRITÉRIOS DE AVALIAÇÃO (Total: 10 pontos):
+1. **Clareza** (2 pontos): Mensagem clara e objetiva?
+2. **Persuasão** (2 pontos): Convincente e envolvente?
+3. **Criatividade** (2 pontos): Original e memorável?
+4. **Adequação ao Público** (2 pontos): Conecta com estudantes brasileiros?
+5. **Potencial de Conversão** (2 pontos): Leva à ação de compra?
+
+INSTRUÇÕES:
+- Avalie cada critério de 0 a 2 pontos
+- Nota >= 8: aprovar (aprovado=true)
+- Nota < 8: reprovar (aprovado=false) e dar feedback específico e acionável
+- No feedback, seja direto sobre o que precisa melhorar
+- Preencha "veredictos" com um item por campo avaliado (tipo_material, nome_criativo, desc_hotmart, legenda, desc_pv, artigo): aprovado=true se o campo pode ser mantido, ou aprovado=false com feedback específico do campo
+- Reprove apenas os campos que realmente precisam mudar; os aprovados serão mantidos como estão
+
+ANÁLISE:
+Considere se o conteúdo:
+- Desperta interesse imediato
+- Comunica benefícios claros
+- Usa linguagem adequada ao público brasileiro
+- Tem call-to-action efetivo
+- É profissional mas descontraído"""
+
+
+def _rotulo_modelo(perfil: PerfilLLM) -> str:
+    """Modelo como rótulo de métrica ou chave interna, com cardinalidade limitada aos modelos conhecidos"""
+    return perfil.modelo if perfil.modelo in MODELOS_CONHECIDOS else "outro"
+
+
+def _chave_limite(perfil: PerfilLLM) -> str:
+    # Modelos livres compartilham o limite "provedor/outro"
+    return f"{perfil.provider}/{_rotulo_modelo(perfil)}"
+
+
+def _nome_chamada(perfil: PerfilLLM) -> str:
+    """Nome da chamada nos logs e no histórico de latência (p95 do hedge)"""
+    return f"{perfil.provider} ({_rotulo_modelo(perfil)})"
+
+
+def _estimar_tokens(perfil: PerfilLLM, sistema: str, prompt: str) -> int:
+    """Reserva de TPM: entrada estimada (~4 caracteres por token) + máximo de saída; o excedente é devolvido"""
+    return (len(sistema) + len(prompt)) // 4 + perfil.max_tokens
+
+
+def _mensagens(perfil: PerfilLLM, sistema: str, usuario: str) -> list[BaseMessage]:
+    """Monta as mensagens com o bloco fixo primeiro, marcando-o para cache quando suportado"""
+    if isinstance(_get_llm(perfil), ChatAnthropic):
+        # Cache explícito da Anthropic: tools + sistema viram um prefixo reaproveitado entre chamadas
+        # (só tem efeito quando o prefixo passa do mínimo cacheável do modelo)
+        conteudo_sistema = [{"type": "text", "text": sistema, "cache_control": {"type": "ephemeral"}}]
+        return [SystemMessage(content=conteudo_sistema), HumanMessage(content=usuario)]
+    # OpenAI, DeepSeek, Grok, Gemini e Qwen fazem cache automático de prefixos idênticos
+    return [SystemMessage(content=sistema), HumanMessage(content=usuario)]
 
 
 class MarketingAgents:
     """Sistema de agentes para geração de conteúdos de marketing"""
     
-    def __init__(self, config: ConfigGerador):
+    def __init__(
+        self,
+        config: ConfigGerador,
+        on_evento: Callable[[dict], None] | None = None,
+        cancelado: threading.Event | None = None
+    ):
         self.config = config
-        self.llm = self._get_llm(config.llm_provider)
-        
-    def _get_llm(self, provider: str):
-        """Retorna o LLM configurado baseado no provedor"""
-        if provider == "anthropic":
-            return ChatAnthropic(
-                model="claude-sonnet-4-5",  # Claude Sonnet 4.5 (mais recente)
-                temperature=0.7,
-                api_key=os.getenv("ANTHROPIC_API_KEY"),
-                max_tokens = MAX_TOKENS_
-            )
-        elif provider == "openai":
-            return ChatOpenAI(
-                model="gpt-5",  # GPT-5 (mais recente)
-                temperature=0.7,
-                api_key=os.getenv("OPENAI_API_KEY"),
-                max_tokens = MAX_TOKENS_
-            )
-        elif provider == "google":
-            return ChatGoogleGenerativeAI(
-                model="gemini-2.5-pro",  # Gemini 2.5 Plus (mais recente)
-                temperature=0.7,
-                google_api_key=os.getenv("GOOGLE_API_KEY"),
-                max_tokens = MAX_TOKENS_
-            )
-        elif provider == "deepseek":
-            return ChatOpenAI(
-                base_url="https://api.deepseek.com",
-                model="deepseek-chat",  # DeepSeek v3
-                temperature=0.7,
-                api_key=os.getenv("DEEPSEEK_API_KEY"),
-                max_tokens = MAX_TOKENS_
-            )
-        elif provider == "grok":
-            return ChatOpenAI(
-                base_url="https://api.x.ai/v1",
-                model="grok-2.0",  # Grok 2.0
-                temperature=0.7,
-                api_key=os.getenv("XAI_API_KEY"),
-                max_tokens = MAX_TOKENS_
-            )
-        elif provider == "qwen":
-            return ChatOpenAI(
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-                model="qwq-32b-preview",  # Qwen QwQ-32B-Preview
-                temperature=0.7,
-                api_key=os.getenv("DASHSCOPE_API_KEY"),
-                max_tokens = MAX_TOKENS_
-            )
-        else:
-            # Default para Anthropic Claude Sonnet 4.5
-            return ChatAnthropic(
-                model="claude-sonnet-4-5",
-                temperature=0.7,
-                api_key=os.getenv("ANTHROPIC_API_KEY"),
-                max_tokens = MAX_TOKENS_
-            )
+        # Receptor opcional de eventos (logs, nós, notas) emitidos durante a execução
+        self.on_evento = on_evento
+        # Sinalizado por quem iniciou o job para interrompê-lo entre nós e chamadas
+        self.cancelado = cancelado or threading.Event()
+        # Tokens consumidos por esta instância (candidatos rodam em threads paralelas)
+        self.tokens_usados = 0
+        # Consumo de cada tentativa de chamada ao LLM, na ordem em que terminaram
+        self.chamadas: list[dict] = []
+        self._lock_tokens = threading.Lock()
+    
+    def _emitir(self, tipo: str, **dados):
+        """Envia um evento ao receptor, se houver"""
+        if self.on_evento:
+            try:
+                self.on_evento({"type": tipo, **dados})
+            except Exception:
+                pass
     
+    def _registrar_uso(self, mensagem, reserva: Reserva | None = None):
+        """Soma os tokens informados na resposta (ou chunk) do LLM, também na reserva do limitador"""
+        uso = getattr(mensagem, "usage_metadata", None)
+        if uso:
+            total = uso.get("total_tokens", 0)
+            with self._lock_tokens:
+                self.tokens_usados += total
+            if reserva:
+                reserva.consumidos = (reserva.consumidos or 0) + total
+            span = telemetria.span_atual()
+            if span:
+                for atributo, chave in (("tokens_entrada", "input_tokens"), ("tokens_saida", "output_tokens")):
+                    span.atributos[atributo] = span.atributos.get(atributo, 0) + uso.get(chave, 0)
+    
+    def _log(self, logs: list[str], mensagem: str):
+        """Registra uma linha de log no estado e a emite imediatamente"""
+        linha = f"[{datetime.now().strftime('%H:%M:%S')}] {mensagem}"
+        logs.append(linha)
+        self._emitir("log", message=linha)
+    
+    @staticmethod
+    def _no(nome: str, metodo: Callable[["MarketingAgents", AgentState], dict]):
+        """Envolve um nó do grafo: resolve a instância da requisição e emite início e fim"""
+        def executar_no(state: AgentState, config: RunnableConfig) -> dict:
+            agentes: MarketingAgents = config["configurable"]["agentes"]
+            if agentes.cancelado.is_set():
+                raise resiliencia.Cancelado()
+            agentes._emitir("node", node=nome, status="inicio", iteracao=state.get("iteracao_atual", 0))
+            inicio = time.perf_counter()
+            tokens_antes = agentes.tokens_usados
+            chamadas_antes = len(agentes.chamadas)
+            try:
+                with telemetria.span("no", no=nome, iteracao=state.get("iteracao_atual", 0)) as span:
+                    atualizacao = metodo(agentes, state)
+                    uso = agentes.tokens_usados - tokens_antes
+                    span.atributos["tokens"] = uso
+                chamadas = [{**chamada, "etapa": nome} for chamada in agentes.chamadas[chamadas_antes:]]
+                if chamadas:
+                    atualizacao = {**atualizacao, "uso_chamadas": chamadas}
+                return {**atualizacao, "uso_tokens": uso} if uso else atualizacao
+            finally:
+                agentes._emitir("node", node=nome, status="fim", duracao=round(time.perf_counter() - inicio, 2))
+        return executar_no
+        
     def criar_conteudo(self, state: AgentState) -> dict:
         """Nó criador: gera conteúdos usando resposta estruturada"""
-        logs = [f"[{datetime.now().strftime('%H:%M:%S')}] Iniciando criação de conteúdo..."]
+        logs = []
+        self._log(logs, "Iniciando criação de conteúdo...")
         
         # Construir prompt baseado no checklist
         prompt = self._construir_prompt_criador(state)
         
         try:
-            # Usar structured output com Pydantic
-            llm_estruturado = self.llm.with_structured_output(ConteudoGerado)
+            cadeia = cadeia_criador(state["config"])
             
-            # Se já existe conteúdo e avaliação, incluir feedback
-            if state.get("conteudo") and state.get("avaliacao"):
-                prompt += f"\n\nFEEDBACK DA REVISÃO ANTERIOR:\n{state['avaliacao'].feedback}\n"
-                prompt += f"Nota anterior: {state['avaliacao'].nota}/10\n"
-                prompt += "Por favor, melhore o conteúdo considerando este feedback."
-                logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Melhorando conteúdo com base no feedback...")
+            anterior = state.get("conteudo")
+            avaliacao = state.get("avaliacao")
+            # Problemas da validação automática têm prioridade sobre a revisão anterior
+            problemas = state.get("problemas_validacao") or []
+            veredictos = problemas or (avaliacao.veredictos if avaliacao else [])
+            campos = self._campos_a_refazer(anterior, veredictos, state["config"])
+            nota_anterior = avaliacao.nota if avaliacao and not problemas else None
             
-            conteudo = llm_estruturado.invoke(prompt)
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Conteúdo gerado com sucesso!")
+            if campos:
+                # Revisão incremental: regenerar só os campos reprovados
+                prompt += self._construir_prompt_campos(anterior, veredictos, campos, nota_anterior)
+                self._log(logs, f"Refazendo apenas os campos reprovados: {', '.join(campos)}")
+                schema = _schema_parcial(ConteudoGerado, tuple(campos))
+                parcial = self._invocar(cadeia, prompt, schema, state["config"].stream_parcial, logs, PROMPT_SISTEMA_CRIADOR)
+                conteudo = ConteudoGerado.model_validate({**anterior.model_dump(), **parcial.model_dump()})
+            else:
+                if anterior and problemas:
+                    prompt += "\n\nPROBLEMAS DETECTADOS NA VALIDAÇÃO AUTOMÁTICA:\n"
+                    prompt += "\n".join(f"- {p.campo}: {p.feedback}" for p in problemas)
+                    prompt += "\nCorrija todos estes problemas."
+                    self._log(logs, "Corrigindo problemas da validação automática...")
+                # Se já existe conteúdo e avaliação, incluir feedback
+                elif anterior and avaliacao:
+                    prompt += f"\n\nFEEDBACK DA REVISÃO ANTERIOR:\n{avaliacao.feedback}\n"
+                    prompt += f"Nota anterior: {avaliacao.nota}/10\n"
+                    prompt += "Por favor, melhore o conteúdo considerando este feedback."
+                    self._log(logs, "Melhorando conteúdo com base no feedback...")
+                
+                if state["config"].candidatos > 1:
+                    candidatos = self._gerar_candidatos(prompt, state["config"], logs)
+                    self._log(logs, f"{len(candidatos)} candidato(s) gerado(s) com sucesso!")
+                    return {
+                        "conteudo": candidatos[0],
+                        "candidatos": candidatos,
+                        "iteracao_atual": 1,
+                        "logs": logs
+                    }
+                
+                conteudo = self._invocar(cadeia, prompt, ConteudoGerado, state["config"].stream_parcial, logs, PROMPT_SISTEMA_CRIADOR)
+            self._log(logs, "Conteúdo gerado com sucesso!")
+            self._emitir(
+                "rascunho",
+                nome_criativo=conteudo.nome_criativo,
+                tipo_material=conteudo.tipo_material,
+                iteracao=state.get("iteracao_atual", 0) + 1
+            )
             
             return {
                 "conteudo": conteudo,
+                "candidatos": [],
                 "iteracao_atual": 1,
                 "logs": logs
             }
             
+        except resiliencia.Cancelado:
+            raise
         except Exception as e:
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] ERRO ao gerar conteúdo: {str(e)}")
+            self._log(logs, f"ERRO ao gerar conteúdo: {str(e)}")
             return {
                 "conteudo": None,
+                "candidatos": [],
                 "iteracao_atual": 1,
                 "logs": logs
             }
     
+    def _gerar_candidatos(self, prompt: str, config: ConfigGerador, logs: list[str]) -> list[ConteudoGerado]:
+        """Gera os rascunhos candidatos em paralelo, alternando entre os provedores configurados"""
+        provedores = config.provedores_candidatos or [config.llm_provider]
+        cadeias = [cadeia_criador(config, provedores[i % len(provedores)]) for i in range(config.candidatos)]
+        self._log(logs, f"Gerando {len(cadeias)} candidatos em paralelo: " + ", ".join(
+            f"{cadeia[0].provider} ({cadeia[0].modelo})" for cadeia in cadeias
+        ))
+        
+        # Sem streaming parcial: os campos dos vários candidatos se misturariam na pré-visualização
+        with ThreadPoolExecutor(max_workers=len(cadeias), thread_name_prefix="candidato") as pool:
+            futuros = [
+                pool.submit(
+                    contextvars.copy_context().run,
+                    self._invocar, cadeia, prompt, ConteudoGerado, False, logs, PROMPT_SISTEMA_CRIADOR
+                )
+                for cadeia in cadeias
+            ]
+        
+        if self.cancelado.is_set():
+            raise resiliencia.Cancelado()
+        candidatos = []
+        for i, futuro in enumerate(futuros):
+            try:
+                candidatos.append(futuro.result())
+            except Exception as e:
+                self._log(logs, f"⚠️ Candidato {i + 1} falhou: {str(e)}")
+        if not candidatos:
+            raise ValueError("Nenhum candidato foi gerado")
+        return candidatos
+    
+    def _invocar(
+        self,
+        cadeia: list[PerfilLLM],
+        prompt: str,
+        schema: type[BaseModel],
+        stream_parcial: bool,
+        logs: list[str],
+        sistema: str
+    ) -> BaseModel:
+        """Chama o LLM com saída estruturada, com failover entre os perfis, e repara respostas inválidas"""
+        def chamada(perfil: PerfilLLM, principal: bool) -> Callable[[resiliencia.Tentativa], object]:
+            # Só o provedor principal faz streaming; failover e hedge não disputam a pré-visualização
+            return lambda cancelado: self._chamar(perfil, prompt, schema, stream_parcial and principal, sistema, cancelado)
+        
+        indice, resposta = self._com_resiliencia(
+            [(perfil, chamada(perfil, i == 0)) for i, perfil in enumerate(cadeia)], schema.__name__, logs
+        )
+        if isinstance(resposta, BaseModel):
+            return resposta
+        return self._validar_com_reparo(cadeia[indice], prompt, schema, resposta, logs, sistema)
+    
+    def _com_resiliencia(
+        self,
+        chamadas: list[tuple[PerfilLLM, Callable[[resiliencia.Tentativa], object]]],
+        categoria: str,
+        logs: list[str]
+    ):
+        """Executa as chamadas (perfil, função) com timeout, novas tentativas, failover e hedge conforme a configuração"""
+        feitas = []
+        
+        def contar(fn: Callable[[resiliencia.Tentativa], object]) -> Callable[[resiliencia.Tentativa], object]:
+            def tentativa(descartada: resiliencia.Tentativa):
+                feitas.append(1)
+                return fn(descartada)
+            return tentativa
+        
+        with telemetria.span("llm", categoria=categoria) as span:
+            try:
+                indice, resposta = resiliencia.executar_com_failover(
+                    [resiliencia.Chamada(_nome_chamada(perfil), contar(fn)) for perfil, fn in chamadas],
+                    timeout=self.config.timeout_llm_segundos,
+                    tentativas=self.config.tentativas_llm,
+                    hedge=self.config.hedge_llm,
+                    categoria=categoria,
+                    avisar=lambda mensagem: self._log(logs, f"⚠️ {mensagem}"),
+                    cancelado=self.cancelado
+                )
+            finally:
+                span.atributos["tentativas"] = len(feitas)
+                telemetria.TENTATIVAS_LLM.observar(len(feitas), categoria=categoria)
+            span.atributos["provedor"] = chamadas[indice][0].provider
+            return indice, resposta
+    
+    @contextmanager
+    def _reservar(self, perfil: PerfilLLM, tokens_estimados: int, tentativa: resiliencia.Tentativa) -> Iterator[Reserva]:
+        """Vaga no limitador do provedor para uma tentativa, medida como span (espera, duração e tokens)
+
+        A espera na fila não conta para o timeout da tentativa; se ela for descartada enquanto
+        espera, sai da fila sem gastar o saldo do provedor.
+        """
+        rotulos = {"provedor": perfil.provider, "modelo": _rotulo_modelo(perfil)}
+        inicio = time.perf_counter()
+        tentativa.aguardar_vaga()
+        with limitador.reservar(_chave_limite(perfil), tokens_estimados, tentativa) as reserva:
+            tentativa.iniciar()
+            telemetria.ESPERA_LIMITE.observar(time.perf_counter() - inicio, **rotulos)
+            with telemetria.span("llm.tentativa", **rotulos) as span:
+                try:
+                    yield reserva
+                finally:
+                    for tipo in ("entrada", "saida"):
+                        if f"tokens_{tipo}" in span.atributos:
+                            telemetria.TOKENS_LLM.observar(span.atributos[f"tokens_{tipo}"], **rotulos, tipo=tipo)
+                    # Tentativas que falharam ou foram descartadas também contam, se o provedor informou o uso
+                    if "tokens_entrada" in span.atributos or "tokens_saida" in span.atributos:
+                        with self._lock_tokens:
+                            self.chamadas.append({
+                                "provedor": perfil.provider,
+                                "modelo": perfil.modelo,
+                                "tokens_entrada": span.atributos.get("tokens_entrada", 0),
+                                "tokens_saida": span.atributos.get("tokens_saida", 0)
+                            })
+    
+    def _chamar(
+        self,
+        perfil: PerfilLLM,
+        prompt: str,
+        schema: type[BaseModel],
+        stream_parcial: bool,
+        sistema: str,
+        cancelado: resiliencia.Tentativa
+    ) -> BaseModel | dict:
+        """Uma chamada ao provedor: o objeto validado ou, se o parsing falhou, os dados brutos"""
+        llm_tool = None
+        if stream_parcial:
+            try:
+                llm_tool = _get_llm_tool(perfil, schema)
+            except (NotImplementedError, TypeError, ValueError):
+                # Provedor sem suporte a tool calling em streaming
+                pass
+        
+        mensagens = _mensagens(perfil, sistema, prompt)
+        with self._reservar(perfil, _estimar_tokens(perfil, sistema, prompt), cancelado) as reserva:
+            if llm_tool:
+                dados = self._invocar_com_parciais(llm_tool, list(schema.model_fields), mensagens, cancelado, reserva)
+            else:
+                resposta = _get_llm_estruturado(perfil, schema).invoke(mensagens)
+                self._registrar_uso(resposta["raw"], reserva)
+                if resposta["parsed"] is not None:
+                    return resposta["parsed"]
+                dados = _dados_brutos(resposta["raw"])
+        
+        if not dados:
+            # Erro não transitório: passa direto ao próximo provedor da cadeia
+            raise ValueError("LLM não retornou dados estruturados")
+        return dados
+    
+    def _validar_com_reparo(
+        self,
+        perfil: PerfilLLM,
+        prompt: str,
+        schema: type[BaseModel],
+        dados: dict,
+        logs: list[str],
+        sistema: str
+    ) -> BaseModel:
+        """Valida a resposta; se inválida, tenta reparo local e depois pede só os campos com erro"""
+        if not dados:
+            raise ValueError("LLM não retornou dados estruturados")
+        
+        try:
+            return schema.model_validate(dados)
+        except ValidationError:
+            pass
+        
+        # 1. Reparo local (truncar, limitar, normalizar) sem nova chamada
+        dados, reparos = validadores.normalizar(dados, schema)
+        for reparo in reparos:
+            self._log(logs, f"🔧 Reparo da resposta: {reparo}")
+        try:
+            return schema.model_validate(dados)
+        except ValidationError as e:
+            erro = e
+        
+        # 2. Pedir novamente apenas os campos que continuam inválidos
+        campos = tuple(dict.fromkeys(
+            err["loc"][0] for err in erro.errors() if err["loc"] and err["loc"][0] in schema.model_fields
+        ))
+        if not campos:
+            raise erro
+        
+        self._log(logs, f"Pedindo novamente apenas os campos inválidos: {', '.join(campos)}")
+        detalhes = "\n".join(f"- {'.'.join(map(str, err['loc']))}: {err['msg']}" for err in erro.errors())
+        prompt_reparo = (
+            f"{prompt}\n\nSUA RESPOSTA ANTERIOR TEVE CAMPOS INVÁLIDOS:\n{detalhes}\n"
+            f"Gere novamente APENAS os campos: {', '.join(campos)}, respeitando os limites."
+        )
+        schema_parcial = _schema_parcial(schema, campos)
+        
+        def pedir_campos(cancelado: resiliencia.Tentativa):
+            with self._reservar(perfil, _estimar_tokens(perfil, sistema, prompt_reparo), cancelado) as reserva:
+                resposta = _get_llm_estruturado(perfil, schema_parcial).invoke(_mensagens(perfil, sistema, prompt_reparo))
+                self._registrar_uso(resposta["raw"], reserva)
+                return resposta
+        
+        _, resposta = self._com_resiliencia(
+            [(perfil, pedir_campos)], schema_parcial.__name__, logs
+        )
+        parcial = resposta["parsed"]
+        if parcial is None:
+            dados_parciais, _ = validadores.normalizar(_dados_brutos(resposta["raw"]), schema_parcial)
+            parcial = schema_parcial.model_validate(dados_parciais)
+        
+        return schema.model_validate({**dados, **parcial.model_dump()})
+    
+    @staticmethod
+    def _campos_a_refazer(
+        anterior: ConteudoGerado | None,
+        veredictos: list[VeredictoCampo],
+        config: ConfigGerador
+    ) -> list[str] | None:
+        """Campos reprovados, ou None quando for preciso regenerar tudo"""
+        if not anterior or not veredictos:
+            return None
+        
+        campos_validos = set(ConteudoGerado.model_fields) - ({"extra"} if not config.gerar_extra else set())
+        reprovados = [v.campo for v in veredictos if not v.aprovado and v.campo in campos_validos]
+        
+        # Sem campo específico reprovado, ou todos reprovados: refazer o conteúdo inteiro
+        if not reprovados or len(set(reprovados)) == len(campos_validos):
+            return None
+        return list(dict.fromkeys(reprovados))
+    
+    @staticmethod
+    def _construir_prompt_campos(
+        anterior: ConteudoGerado,
+        veredictos: list[VeredictoCampo],
+        campos: list[str],
+        nota_anterior: float | None
+    ) -> str:
+        """Complemento do prompt do criador para refazer apenas alguns campos"""
+        mantidos = [c for c in ConteudoGerado.model_fields if c not in campos and getattr(anterior, c)]
+        atuais = "\n".join(
+            f"- {c}: " + ("(artigo aprovado, mantido)" if c == "artigo" else str(getattr(anterior, c)))
+            for c in mantidos
+        )
+        feedbacks = "\n".join(
+            f"- {v.campo}: {v.feedback or 'melhorar'}" for v in veredictos if v.campo in campos
+        )
+        prompt = f"""
+
+CONTEÚDO JÁ APROVADO (mantenha a coerência com ele):
+{atuais}
+
+REFAÇA APENAS OS CAMPOS: {', '.join(campos)}
+FEEDBACK POR CAMPO:
+{feedbacks}"""
+        if nota_anterior is not None:
+            prompt += f"\nNota anterior: {nota_anterior}/10"
+        return prompt
+    
+    def _invocar_com_parciais(
+        self,
+        llm_tool,
+        campos: list[str],
+        mensagens: list[BaseMessage],
+        cancelado: threading.Event,
+        reserva: Reserva | None = None
+    ) -> dict:
+        """Gera a resposta estruturada via streaming, emitindo cada campo parcial"""
+        # Só os campos pedidos são recomeçados: numa regeneração parcial, os demais seguem visíveis
+        self._emitir("partial", reset=True, campos=campos)
+        args = ""
+        enviados: dict[str, str] = {}
+        ultimo_envio = 0.0
+        
+        for chunk in llm_tool.stream(mensagens):
+            if cancelado.is_set():
+                # Chamada descartada (timeout ou outro provedor respondeu antes): encerrar o stream
+                return {}
+            self._registrar_uso(chunk, reserva)
+            for tool_chunk in chunk.tool_call_chunks:
+                args += tool_chunk.get("args") or ""
+            
+            # Limitar a frequência do parsing incremental (custo cresce com o tamanho)
+            if args and time.monotonic() - ultimo_envio >= INTERVALO_PARCIAL_:
+                self._emitir_parciais(parse_partial_json(args), enviados)
+                ultimo_envio = time.monotonic()
+        
+        dados = parse_partial_json(args) if args else {}
+        self._emitir_parciais(dados, enviados)
+        return dados if isinstance(dados, dict) else {}
+    
+    def _emitir_parciais(self, parcial, enviados: dict[str, str]):
+        """Emite apenas o trecho novo de cada campo de texto desde o último envio"""
+        if not isinstance(parcial, dict):
+            return
+        
+        for campo, valor in parcial.items():
+            if not isinstance(valor, str):
+                continue
+            anterior = enviados.get(campo, "")
+            if valor == anterior:
+                continue
+            if valor.startswith(anterior):
+                self._emitir("partial", campo=campo, delta=valor[len(anterior):])
+            else:
+                self._emitir("partial", campo=campo, valor=valor)
+            enviados[campo] = valor
+    
+    def validar_conteudo(self, state: AgentState) -> dict:
+        """Nó validador: checagens determinísticas antes de gastar uma chamada ao revisor"""
+        logs = []
+        conteudo = state.get("conteudo")
+        if not conteudo:
+            return {"problemas_validacao": []}
+        
+        candidatos = state.get("candidatos") or []
+        if len(candidatos) > 1:
+            avaliados = [
+                self._reparar_e_validar(candidato, logs, f"Candidato {i + 1}: ")
+                for i, candidato in enumerate(candidatos)
+            ]
+            aprovados = [candidato for candidato, problemas in avaliados if not problemas]
+            if aprovados:
+                return {"conteudo": aprovados[0], "candidatos": aprovados, "problemas_validacao": [], "logs": logs}
+            # Nenhum candidato passou: seguir com o de menos problemas
+            conteudo, problemas = min(avaliados, key=lambda avaliado: len(avaliado[1]))
+            return {"conteudo": conteudo, "candidatos": [], "problemas_validacao": problemas, "logs": logs}
+        
+        conteudo, problemas = self._reparar_e_validar(conteudo, logs)
+        return {
+            "conteudo": conteudo,
+            "problemas_validacao": problemas,
+            "logs": logs
+        }
+    
+    def _reparar_e_validar(
+        self,
+        conteudo: ConteudoGerado,
+        logs: list[str],
+        prefixo: str = ""
+    ) -> tuple[ConteudoGerado, list[VeredictoCampo]]:
+        """Aplica os reparos triviais e retorna o conteúdo com os problemas restantes"""
+        try:
+            conteudo, reparos = validadores.reparar(conteudo)
+        except ValueError as e:
+            # Reparo produziu conteúdo inválido: seguir com o original
+            reparos = []
+            self._log(logs, f"{prefixo}⚠️ Reparo automático descartado: {str(e)}")
+        for reparo in reparos:
+            self._log(logs, f"{prefixo}🔧 Reparo automático: {reparo}")
+        
+        problemas = validadores.validar(conteudo)
+        if problemas:
+            self._log(logs, f"{prefixo}⚠️ Validação automática reprovou {len(problemas)} campo(s):")
+            for problema in problemas:
+                self._log(logs, f"   • {problema.campo}: {problema.feedback}")
+        else:
+            self._log(logs, f"{prefixo}Validação automática OK")
+        
+        return conteudo, problemas
+    
+    @staticmethod
+    def apos_validacao(state: AgentState) -> Literal["criar_conteudo", "revisar_conteudo"]:
+        """Volta direto ao criador se houver problemas mecânicos e ainda restarem iterações"""
+        if state.get("problemas_validacao") and state.get("iteracao_atual", 0) < state["config"].max_iteracoes:
+            return "criar_conteudo"
+        return "revisar_conteudo"
+    
     def revisar_conteudo(self, state: AgentState) -> dict:
         """Nó revisor: avalia qualidade com critérios claros"""
-        logs = [f"[{datetime.now().strftime('%H:%M:%S')}] Iniciando revisão (iteração {state.get('iteracao_atual', 0)})..."]
+        logs = []
+        self._log(logs, f"Iniciando revisão (iteração {state.get('iteracao_atual', 0)})...")
         
         conteudo = state["conteudo"]
         if not conteudo:
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] ERRO: Nenhum conteúdo para revisar")
+            self._log(logs, "ERRO: Nenhum conteúdo para revisar")
             return {"logs": logs}
         
         prompt = self._construir_prompt_revisor(conteudo, state["config"])
+        cadeia = cadeia_revisor(state["config"])
+        self._log(logs, f"Revisor: {cadeia[0].provider} ({cadeia[0].modelo})")
+        
+        candidatos = state.get("candidatos") or []
         
         try:
-            llm_estruturado = self.llm.with_structured_output(AvaliacaoRevisor)
-            avaliacao = llm_estruturado.invoke(prompt)
+            if len(candidatos) > 1:
+                conteudo, avaliacao = self._revisar_candidatos(candidatos, cadeia, logs)
+                self._emitir(
+                    "rascunho",
+                    nome_criativo=conteudo.nome_criativo,
+                    tipo_material=conteudo.tipo_material,
+                    iteracao=state.get("iteracao_atual", 0)
+                )
+            else:
+                avaliacao = self._invocar(cadeia, prompt, AvaliacaoRevisor, False, logs, PROMPT_SISTEMA_REVISOR)
             
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Revisão concluída!")
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Nota: {avaliacao.nota}/10")
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Status: {'✅ Aprovado' if avaliacao.aprovado else '❌ Precisa melhorar'}")
+            self._emitir(
+                "score",
+                nota=avaliacao.nota,
+                aprovado=avaliacao.aprovado,
+                iteracao=state.get("iteracao_atual", 0)
+            )
+            self._log(logs, "Revisão concluída!")
+            self._log(logs, f"Nota: {avaliacao.nota}/10")
+            self._log(logs, f"Status: {'✅ Aprovado' if avaliacao.aprovado else '❌ Precisa melhorar'}")
             
             if avaliacao.feedback:
-                logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Feedback: {avaliacao.feedback}")
+                self._log(logs, f"Feedback: {avaliacao.feedback}")
             
-            return {
+            atualizacao = {
+                "conteudo": conteudo,
                 "avaliacao": avaliacao,
+                "candidatos": [],
+                "historico_notas": [avaliacao.nota],
+                "erro_revisao": None,
                 "logs": logs
             }
+            melhor = state.get("melhor_avaliacao")
+            if melhor is None or avaliacao.nota > melhor.nota:
+                atualizacao["melhor_conteudo"] = conteudo
+                atualizacao["melhor_avaliacao"] = avaliacao
+            return atualizacao
             
+        except resiliencia.Cancelado:
+            raise
         except Exception as e:
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] ERRO na revisão: {str(e)}")
-            # Criar avaliação default em caso de erro
-            avaliacao_default = AvaliacaoRevisor(
-                nota=7.0,
-                feedback=f"Erro na revisão: {str(e)}",
-                aprovado=True,
-                clareza=1.4,
-                persuasao=1.4,
-                criatividade=1.4,
-                adequacao=1.4,
-                conversao=1.4
-            )
+            self._log(logs, f"ERRO na revisão: {str(e)}")
+            # Sem avaliação: o loop encerra mantendo a melhor versão já revisada, se houver
             return {
-                "avaliacao": avaliacao_default,
+                "conteudo": conteudo,
+                "avaliacao": None,
+                "candidatos": [],
+                "erro_revisao": str(e),
                 "logs": logs
             }
     
-    def deve_continuar(self, state: AgentState) -> Literal["criar_conteudo", "finalizar"]:
+    def _revisar_candidatos(
+        self,
+        candidatos: list[ConteudoGerado],
+        cadeia: list[PerfilLLM],
+        logs: list[str]
+    ) -> tuple[ConteudoGerado, AvaliacaoRevisor]:
+        """Avalia todos os candidatos em uma única chamada comparativa e retorna o melhor"""
+        self._log(logs, f"Comparando {len(candidatos)} candidatos em uma única revisão...")
+        prompt = self._construir_prompt_comparativo(candidatos)
+        # Uma avaliação completa por candidato na mesma resposta
+        cadeia = [perfil._replace(max_tokens=perfil.max_tokens * len(candidatos)) for perfil in cadeia]
+        comparativa = self._invocar(cadeia, prompt, AvaliacaoComparativa, False, logs, PROMPT_SISTEMA_REVISOR)
+        
+        avaliacoes = comparativa.avaliacoes[:len(candidatos)]
+        if not avaliacoes:
+            raise ValueError("O revisor não avaliou nenhum candidato")
+        for i, avaliacao in enumerate(avaliacoes):
+            self._log(logs, f"Candidato {i + 1}: nota {avaliacao.nota}/10")
+        
+        indice = comparativa.melhor
+        if indice >= len(avaliacoes):
+            indice = max(range(len(avaliacoes)), key=lambda i: avaliacoes[i].nota)
+        self._log(logs, f"🏆 Candidato {indice + 1} escolhido")
+        return candidatos[indice], avaliacoes[indice]
+    
+    @staticmethod
+    def deve_continuar(state: AgentState) -> Literal["criar_conteudo", "finalizar"]:
         """Decide se deve continuar o loop ou finalizar"""
+        if MarketingAgents._motivo_parada(state):
+            return "finalizar"
+        
+        # Caso contrário, tentar novamente
+        return "criar_conteudo"
+    
+    @staticmethod
+    def _motivo_parada(state: AgentState) -> str | None:
+        """Motivo para encerrar o loop, ou None se vale a pena mais uma iteração"""
         avaliacao = state.get("avaliacao")
         iteracao = state.get("iteracao_atual", 0)
-        max_iter = state["config"].max_iteracoes
+        config = state["config"]
+        
+        if state.get("erro_revisao"):
+            return "revisão indisponível"
         
-        # Se aprovado ou atingiu max iterações, finalizar
         if avaliacao and avaliacao.aprovado:
-            return "finalizar"
+            return "conteúdo aprovado"
         
-        if iteracao >= max_iter:
-            return "finalizar"
+        if iteracao >= config.max_iteracoes:
+            return "máximo de iterações atingido"
         
-        # Caso contrário, tentar novamente
-        return "criar_conteudo"
+        # Estagnação ou regressão: a última revisão não melhorou o suficiente a anterior
+        notas = state.get("historico_notas") or []
+        if len(notas) >= 2:
+            melhora = notas[-1] - notas[-2]
+            if melhora < 0:
+                return f"nota caiu de {notas[-2]} para {notas[-1]}"
+            if melhora < config.min_melhora_nota:
+                return f"nota estagnada em {notas[-1]} (melhora de {melhora:.1f})"
+        
+        # Orçamento: encerrar se outra iteração (pela média das anteriores) não couber
+        if iteracao and config.tempo_maximo_segundos and state.get("inicio"):
+            decorrido = time.time() - state["inicio"]
+            if decorrido + decorrido / iteracao > config.tempo_maximo_segundos:
+                return f"orçamento de tempo ({config.tempo_maximo_segundos:g}s) esgotado"
+        
+        tokens = state.get("uso_tokens", 0)
+        if iteracao and config.max_tokens_job and tokens + tokens / iteracao > config.max_tokens_job:
+            return f"orçamento de tokens ({config.max_tokens_job}) esgotado"
+        
+        return None
+    
+    def finalizar(self, state: AgentState) -> dict:
+        """Nó final: registra o motivo da parada e mantém a melhor versão revisada"""
+        logs = []
+        motivo = self._motivo_parada(state)
+        if motivo:
+            self._log(logs, f"Encerrando: {motivo}")
+        
+        atualizacao = {"logs": logs}
+        melhor = state.get("melhor_avaliacao")
+        avaliacao = state.get("avaliacao")
+        if melhor and (avaliacao is None or state.get("conteudo") is None or melhor.nota > avaliacao.nota):
+            self._log(logs, f"Mantendo a melhor versão revisada (nota {melhor.nota}/10)")
+            atualizacao["conteudo"] = state["melhor_conteudo"]
+            atualizacao["avaliacao"] = melhor
+        return atualizacao
     
     def _construir_prompt_criador(self, state: AgentState) -> str:
-        """Constrói prompt dinâmico baseado na configuração"""
+        """Constrói a parte variável do prompt do criador (produto e item extra)"""
         config = state["config"]
         
-        prompt = f"""Você é um especialista em marketing digital e copywriting para produtos educacionais brasileiros.
-
-INFORMAÇÕES DO PRODUTO:
+        prompt = f"""INFORMAÇÕES DO PRODUTO:
 Radical: {config.radical}
 Insumos: {config.insumos}
-
-TAREFA: Gere conteúdos persuasivos, modernos e otimizados para conversão, sempre mantendo tom descontraído mas profissional.
-
-DIRETRIZES:
-1. **Tipo de Material**: Classifique entre "Baralhos Anki", "Mapas Mentais", "Músicas" ou "Podcasts" baseado nos insumos
-2. **Descrição Hotmart**: Texto atrativo e instigante (máximo 1.800 caracteres). Foque nos benefícios e transformação
-3. **Artigo Blog**: HTML completo com estrutura moderna (<article>, <section>, <h1-h3>, <p>, <strong>, <ul>). Narrativa de venda engajadora com:
-   - Introdução que prende atenção
-   - Desenvolvimento mostrando benefícios
-   - Call-to-action forte
-4. **Legenda Instagram**: Texto curto, envolvente, com emojis estratégicos e hashtags relevantes
-5. **Nome Criativo**: Máximo 5 palavras impactantes que vendam o produto
-6. **Descrição Página de Vendas**: Máximo 25 palavras ultra-persuasivas
-
-PÚBLICO-ALVO: Estudantes brasileiros de concursos públicos e OAB que buscam aprovação
-
-ESTILO: 
-- Tom: Motivacional, acessível, brasileiro
-- Evite jargões excessivos
-- Use linguagem que conecta e inspira
-- Destaque transformação e resultados
-
 """
 
         if config.gerar_extra and config.prompt_extra:
@@ -226,68 +1020,53 @@ ESTILO:
         return prompt
     
     def _construir_prompt_revisor(self, conteudo: ConteudoGerado, config: ConfigGerador) -> str:
-        """Constrói prompt do revisor"""
-        return f"""Você é um revisor especializado em conteúdos de marketing digital para educação.
+        """Constrói a parte variável do prompt do revisor (conteúdo a avaliar)"""
+        return f"CONTEÚDO A AVALIAR:\n{self._resumo_conteudo(conteudo)}"
+    
+    def _construir_prompt_comparativo(self, candidatos: list[ConteudoGerado]) -> str:
+        """Constrói a parte variável do prompt do revisor para comparar vários candidatos"""
+        blocos = "\n\n".join(
+            f"CANDIDATO {i}:\n{self._resumo_conteudo(candidato)}" for i, candidato in enumerate(candidatos)
+        )
+        return f"""CANDIDATOS A AVALIAR ({len(candidatos)}):
 
-CRITÉRIOS DE AVALIAÇÃO (Total: 10 pontos):
-1. **Clareza** (2 pontos): Mensagem clara e objetiva?
-2. **Persuasão** (2 pontos): Convincente e envolvente?
-3. **Criatividade** (2 pontos): Original e memorável?
-4. **Adequação ao Público** (2 pontos): Conecta com estudantes brasileiros?
-5. **Potencial de Conversão** (2 pontos): Leva à ação de compra?
+{blocos}
 
-CONTEÚDO A AVALIAR:
----
+Avalie cada candidato separadamente, com os mesmos critérios, e devolva as avaliações na ordem apresentada.
+Em "melhor", indique o índice (a partir de 0) do candidato com maior potencial de conversão."""
+    
+    @staticmethod
+    def _resumo_conteudo(conteudo: ConteudoGerado) -> str:
+        """Conteúdo enviado ao revisor, com o texto completo de cada campo que ele aprova"""
+        extra = f"\nExtra: {conteudo.extra}" if conteudo.extra else ""
+        return f"""---
 Tipo: {conteudo.tipo_material}
 Nome: {conteudo.nome_criativo}
-Desc. Hotmart: {conteudo.desc_hotmart[:200]}...
-Legenda: {conteudo.legenda[:100]}...
+Desc. Hotmart: {conteudo.desc_hotmart}
+Legenda: {conteudo.legenda}
 Desc. PV: {conteudo.desc_pv}
----
-
-INSTRUÇÕES:
-- Avalie cada critério de 0 a 2 pontos
-- Nota >= 8: aprovar (aprovado=true)
-- Nota < 8: reprovar (aprovado=false) e dar feedback específico e acionável
-- No feedback, seja direto sobre o que precisa melhorar
-
-ANÁLISE:
-Considere se o conteúdo:
-- Desperta interesse imediato
-- Comunica benefícios claros
-- Usa linguagem adequada ao público brasileiro
-- Tem call-to-action efetivo
-- É profissional mas descontraído"""
+Artigo: {conteudo.artigo}{extra}
+---"""
 
-    def criar_grafo(self) -> StateGraph:
-        """Cria o grafo LangGraph com nós e transições"""
-        workflow = StateGraph(AgentState)
-        
-        # Adicionar nós
-        workflow.add_node("criar_conteudo", self.criar_conteudo)
-        workflow.add_node("revisar_conteudo", self.revisar_conteudo)
-        workflow.add_node("finalizar", lambda state: state)
-        
-        # Definir transições
-        workflow.set_entry_point("criar_conteudo")
-        
-        workflow.add_edge("criar_conteudo", "revisar_conteudo")
-        workflow.add_conditional_edges(
-            "revisar_conteudo",
-            self.deve_continuar,
-            {
-                "criar_conteudo": "criar_conteudo",
-                "finalizar": "finalizar"
-            }
-        )
-        
-        workflow.add_edge("finalizar", END)
-        
-        return workflow.compile()
+    def criar_grafo(self):
+        """Retorna o grafo compilado compartilhado"""
+        return criar_grafo()
     
-    def executar(self) -> tuple[ConteudoGerado | None, AvaliacaoRevisor | None, list[str], int]:
-        """Executa o fluxo completo e retorna resultado"""
-        grafo = self.criar_grafo()
+    def executar(
+        self,
+        thread_id: str | None = None,
+        checkpointer=None
+    ) -> tuple[ConteudoGerado | None, AvaliacaoRevisor | None, list[str], int, list[dict]]:
+        """Executa o fluxo completo e retorna (conteúdo, avaliação, logs, iterações, uso das chamadas)
+
+        Com checkpointer e thread_id, o estado é salvo após cada nó e uma execução
+        interrompida do mesmo thread_id continua do último nó concluído.
+        """
+        grafo = criar_grafo(checkpointer)
+        # Configuração da requisição (receptor de eventos) via RunnableConfig
+        config = {"configurable": {"agentes": self}}
+        if checkpointer and thread_id:
+            config["configurable"]["thread_id"] = thread_id
         
         estado_inicial = AgentState(
             config=self.config,
@@ -295,19 +1074,80 @@ Considere se o conteúdo:
             avaliacao=None,
             iteracao_atual=0,
             logs=[],
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.now().isoformat(),
+            problemas_validacao=[],
+            candidatos=[],
+            historico_notas=[],
+            melhor_conteudo=None,
+            melhor_avaliacao=None,
+            inicio=time.time(),
+            uso_tokens=0,
+            uso_chamadas=[],
+            erro_revisao=None
         )
         
         try:
-            resultado = grafo.invoke(estado_inicial)
+            entrada = estado_inicial
+            if checkpointer and thread_id:
+                salvo = grafo.get_state(config)
+                if salvo.values:
+                    # Retomar sem refazer os nós (e chamadas pagas) já concluídos
+                    entrada = None
+                    etapa = ", ".join(salvo.next) or "fim"
+                    self._log([], f"♻️ Retomando do checkpoint (iteração {salvo.values.get('iteracao_atual', 0)}, próximo: {etapa})")
+            
+            resultado = grafo.invoke(entrada, config=config)
             
             conteudo = resultado.get("conteudo")
             avaliacao = resultado.get("avaliacao")
             logs = resultado.get("logs", [])
             iteracoes = resultado.get("iteracao_atual", 0)
             
-            return conteudo, avaliacao, logs, iteracoes
+            # Inclui as chamadas feitas antes de uma retomada (salvas no checkpoint)
+            uso_chamadas = resultado.get("uso_chamadas", [])
+            
+            return conteudo, avaliacao, logs, iteracoes, uso_chamadas
             
+        except resiliencia.Cancelado:
+            raise
         except Exception as e:
-            logs_erro = [f"[{datetime.now().strftime('%H:%M:%S')}] ERRO CRÍTICO: {str(e)}"]
-            return None, None, logs_erro, 0
+            logs_erro = []
+            self._log(logs_erro, f"ERRO CRÍTICO: {str(e)}")
+            return None, None, logs_erro, 0, self.chamadas
+
+
+@lru_cache(maxsize=None)
+def criar_grafo(checkpointer=None):
+    """Cria e compila o grafo LangGraph uma única vez por processo (e por checkpointer)"""
+    workflow = StateGraph(AgentState)
+    
+    # Adicionar nós
+    workflow.add_node("criar_conteudo", MarketingAgents._no("criar_conteudo", MarketingAgents.criar_conteudo))
+    workflow.add_node("validar_conteudo", MarketingAgents._no("validar_conteudo", MarketingAgents.validar_conteudo))
+    workflow.add_node("revisar_conteudo", MarketingAgents._no("revisar_conteudo", MarketingAgents.revisar_conteudo))
+    workflow.add_node("finalizar", MarketingAgents._no("finalizar", MarketingAgents.finalizar))
+    
+    # Definir transições
+    workflow.set_entry_point("criar_conteudo")
+    
+    workflow.add_edge("criar_conteudo", "validar_conteudo")
+    workflow.add_conditional_edges(
+        "validar_conteudo",
+        MarketingAgents.apos_validacao,
+        {
+            "criar_conteudo": "criar_conteudo",
+            "revisar_conteudo": "revisar_conteudo"
+        }
+    )
+    workflow.add_conditional_edges(
+        "revisar_conteudo",
+        MarketingAgents.deve_continuar,
+        {
+            "criar_conteudo": "criar_conteudo",
+            "finalizar": "finalizar"
+        }
+    )
+    
+    workflow.add_edge("finalizar", END)
+    
+    return workflow.compile(checkpointer=checkpointer)
@@ -4,31 +4,130 @@ Backend FastAPI para sistema de geração de conteúdos de marketing
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi import Request
 from pydantic import ValidationError
 import asyncio
+import functools
 import json
+import threading
 import uuid
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Awaitable, Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import base64
+import shutil
+import aiofiles
 from dotenv import load_dotenv
 
 from models import ConfigGerador, ResultadoFinal
-from agents import MarketingAgents
+from agents import MarketingAgents, VERSAO_PROMPT
+from jobs import JobExecutor, SingleFlight, Publicador, CANCELAMENTO_SOLICITADO
+from cache import CacheResultados, chave_config
+from limites import limitador
+from persistencia import RegistroJobs
+from lote import executar_lote, carregar_manifesto, ler_lote
+from custos import calcular_custo, AGRUPAMENTOS
+from historico import IndiceResultados
+import mocks
+import telemetria
 
 # Importações para geração de imagens
-from openai import OpenAI
+from openai import AsyncOpenAI
 import google.generativeai as genai
 import httpx
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
 
-app = FastAPI(title="Marketing AI System")
+# Executor dos jobs de geração (limite configurável via .env)
+executor = JobExecutor(max_jobs=int(os.getenv("MAX_JOBS_CONCORRENTES", "4")))
+
+# Execuções em andamento, compartilhadas entre pedidos idênticos. Sem nenhum cliente
+# conectado, a execução aguarda uma reconexão (ex: página recarregada) antes de ser cancelada
+single_flight = SingleFlight(tolerancia_abandono=float(os.getenv("TOLERANCIA_DESCONEXAO_SEGUNDOS", "15")))
+
+# Ocupação do executor, lida a cada coleta de /metrics
+telemetria.metricas.registrar(telemetria.Medidor("dra_jobs_em_execucao", "Jobs ocupando vagas do executor", lambda: executor.ativos))
+telemetria.metricas.registrar(telemetria.Medidor("dra_jobs_aguardando", "Jobs na fila por uma vaga do executor", lambda: executor.aguardando))
+
+# Cache de resultados por configuração idêntica
+cache = CacheResultados(
+    Path("outputs/.cache"),
+    ttl_horas=float(os.getenv("CACHE_TTL_HORAS", "168")),
+    max_entradas=int(os.getenv("CACHE_MAX_ENTRADAS", "500"))
+)
+
+# Jobs persistidos e checkpoints do grafo (retomados após reinício)
+registro = RegistroJobs(Path("outputs/.jobs.db"))
+# Índice do histórico de resultados (filtros e busca textual de GET /jobs), no banco dos jobs
+indice = IndiceResultados(Path("outputs/.jobs.db"))
+# Tarefas de retomada em segundo plano (referência mantida até terminarem)
+tarefas_retomada: set[asyncio.Task] = set()
+# Ligado no desligamento: jobs interrompidos a partir daí serão retomados, não cancelados
+encerrando = False
+
+# Clientes HTTP compartilhados (criados no startup, fechados no shutdown)
+http_client: Optional[httpx.AsyncClient] = None
+openai_client: Optional[AsyncOpenAI] = None
+
+# Threads das chamadas síncronas aos SDKs de imagem
+pool_imagens = ThreadPoolExecutor(max_workers=int(os.getenv("MAX_IMAGENS_CONCORRENTES", "8")), thread_name_prefix="imagem")
+
+# Pasta de trabalho das imagens antes de irem para a pasta final do job
+PASTA_TEMP_IMAGENS = Path("outputs/.tmp")
+
+
+@asynccontextmanager
+async def clientes():
+    """Abre e fecha os clientes HTTP compartilhados (servidor e linha de comando)"""
+    global http_client, openai_client
+    
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(180.0, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("HTTP_MAX_CONEXOES", "20")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=60.0
+        )
+    )
+    if os.getenv("OPENAI_API_KEY"):
+        openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+    try:
+        yield
+    finally:
+        if openai_client:
+            await openai_client.close()
+        await http_client.aclose()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ciclo de vida da aplicação: clientes compartilhados, retomada de jobs e encerramento"""
+    global encerrando
+    
+    async with clientes():
+        # Jobs interrompidos pelo último desligamento continuam do último checkpoint
+        for job in registro.interrompidos():
+            tarefa = asyncio.create_task(retomar_job(job))
+            tarefas_retomada.add(tarefa)
+            tarefa.add_done_callback(tarefas_retomada.discard)
+        
+        yield
+        
+        encerrando = True
+    executor.encerrar()
+    pool_imagens.shutdown(wait=False)
+    registro.fechar()
+    indice.fechar()
+    telemetria.encerrar()
+
+
+app = FastAPI(title="Marketing AI System", lifespan=lifespan)
 
 # Configurar templates e arquivos estáticos
 templates = Jinja2Templates(directory="templates")
@@ -70,6 +169,9 @@ async def root(request: Request):
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket para logs em tempo real E para iniciar geração"""
     await manager.connect(websocket)
+    # Geração (ou reconexão) em andamento nesta conexão; roda em paralelo à leitura de mensagens
+    tarefa: Optional[asyncio.Task] = None
+    servidor_encerrando = False
     try:
         while True:
             # Aguardar mensagem do cliente
@@ -78,40 +180,72 @@ async def websocket_endpoint(websocket: WebSocket):
             try:
                 message = json.loads(data)
                 
+                acao = message.get("action")
+                if acao in ("gerar", "reconectar") and tarefa and not tarefa.done():
+                    await manager.send_log(
+                        json.dumps({"type": "error", "message": "❌ Já existe uma geração em andamento nesta conexão"}),
+                        websocket
+                    )
+                
                 # Verificar se é uma ação de 'gerar'
-                if message.get("action") == "gerar" and "config" in message:
+                elif acao == "gerar" and "config" in message:
                     config_dict = message["config"]
-                    # Chamar o processamento. Ele mesmo envia os logs
-                    # e o resultado final pelo websocket.
-                    await processar_geracao(config_dict, websocket)
+                    # O processamento envia os logs e o resultado final pelo websocket
+                    tarefa = asyncio.create_task(responder(processar_geracao(config_dict, websocket), websocket))
                 
-                # Se a mensagem não for 'gerar', ela é ignorada e o loop continua
+                # Reconectar a um job existente (ex: após recarregar a página)
+                elif acao == "reconectar" and message.get("job_id"):
+                    tarefa = asyncio.create_task(responder(reconectar_job(message["job_id"], websocket), websocket))
+                
+                # Abortar a geração desta conexão (segue para outros clientes que a acompanham)
+                elif acao == "cancelar":
+                    if tarefa and not tarefa.done():
+                        tarefa.cancel(CANCELAMENTO_SOLICITADO)
+                        await manager.send_log(
+                            json.dumps({"type": "cancelado", "message": "🛑 Geração cancelada"}),
+                            websocket
+                        )
+                
+                # Demais mensagens são ignoradas e o loop continua
                 
             except json.JSONDecodeError:
                 await manager.send_log(
                     json.dumps({"type": "error", "message": "❌ Erro: Mensagem inválida recebida"}),
                     websocket
                 )
-            except Exception as e_process:
-                # Captura erros de 'processar_geracao'
-                await manager.send_log(
-                    json.dumps({"type": "error", "message": f"❌ Erro no processamento: {str(e_process)}"}),
-                    websocket
-                )
 
-    except WebSocketDisconnect:
+    except WebSocketDisconnect as e:
+        # 1012: servidor reiniciando; o job segue ativo para ser retomado na inicialização
+        servidor_encerrando = e.code == 1012
         manager.disconnect(websocket)
     except Exception as e_ws:
         # Captura erros do próprio websocket (ex: conexão perdida)
         print(f"Erro no WebSocket: {e_ws}")
         manager.disconnect(websocket)
+    finally:
+        # Cliente saiu: deixa de acompanhar o job, que é cancelado se ninguém mais o acompanha
+        if tarefa and not tarefa.done() and not servidor_encerrando:
+            tarefa.cancel()
 
 
-async def gerar_imagem_openai(prompt: str, tamanho: str, websocket: WebSocket) -> Optional[bytes]:
-    """Gera imagem usando GPT Image 1 (DALL-E 3)"""
+async def responder(processamento: Awaitable, websocket: WebSocket):
+    """Executa o processamento de uma mensagem, enviando ao cliente os erros inesperados"""
+    try:
+        await processamento
+    except Exception as e_process:
+        try:
+            await manager.send_log(
+                json.dumps({"type": "error", "message": f"❌ Erro no processamento: {str(e_process)}", "terminal": True}),
+                websocket
+            )
+        except Exception:
+            # Cliente já desconectado
+            pass
+
+
+async def gerar_imagem_openai(prompt: str, tamanho: str, destino: Path, publicar: Publicador, uso: list[dict]) -> bool:
+    """Gera imagem usando GPT Image 1 e grava direto no arquivo de destino; o consumo vai para `uso`"""
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
         # Mapear tamanhos
         size_map = {
             "1080x1920": "1024x1792",  # Vertical
@@ -119,51 +253,63 @@ async def gerar_imagem_openai(prompt: str, tamanho: str, websocket: WebSocket) -
         }
         dalle_size = size_map.get(tamanho, "1024x1024")
         
-        # 1. Gerar a imagem (sem 'response_format')
-        response = client.images.generate(
-            model="gpt-image-1",
-            prompt=prompt,
-            size=dalle_size,
-            quality="hd",
-            n=1
-            # Removido o 'response_format' incorreto
-        )
+        if not openai_client:
+            raise Exception("OPENAI_API_KEY não configurada")
         
-        image_url = response.data[0].url
-        if not image_url:
-            raise Exception("API da OpenAI não retornou URL da imagem")
+        # 1. Gerar a imagem (cliente assíncrono compartilhado, dentro do limite do provedor)
+        async with limitador.reservar_async("openai/gpt-image-1"):
+            response = await openai_client.images.generate(
+                model="gpt-image-1",
+                prompt=prompt,
+                size=dalle_size,
+                quality="hd",
+                n=1
+            )
+        imagem = response.data[0]
+        # Cobrada mesmo se o download falhar
+        tokens = getattr(response, "usage", None)
+        uso.append({
+            "provedor": "openai",
+            "modelo": "gpt-image-1",
+            "etapa": "imagem",
+            "imagens": 1,
+            "tokens_entrada": getattr(tokens, "input_tokens", 0) or 0,
+            "tokens_saida": getattr(tokens, "output_tokens", 0) or 0
+        })
         
-        # 2. Baixar imagem da URL com httpx
-        async with httpx.AsyncClient() as http_client:
-            img_response = await http_client.get(image_url)
-            
-            if img_response.status_code == 200:
-                # Sucesso, retornar os bytes
-                return img_response.content
-            else:
-                # Falha no download, levantar exceção
+        if imagem.b64_json:
+            async with aiofiles.open(destino, "wb") as f:
+                await f.write(base64.b64decode(imagem.b64_json))
+            return True
+        
+        if not imagem.url:
+            raise Exception("API da OpenAI não retornou a imagem")
+        
+        # 2. Baixar em streaming direto para o arquivo, sem manter o PNG inteiro em memória
+        async with http_client.stream("GET", imagem.url) as img_response:
+            if img_response.status_code != 200:
                 raise Exception(f"Falha ao baixar imagem da URL. Status: {img_response.status_code}")
+            
+            async with aiofiles.open(destino, "wb") as f:
+                async for bloco in img_response.aiter_bytes():
+                    await f.write(bloco)
+        
+        return True
         
     except Exception as e:
         # Enviar log de erro (seja da API ou do download)
-        await manager.send_log(
-            json.dumps({"type": "error", "message": f"❌ Erro GPT Image 1: {str(e)}"}),
-            websocket
-        )
-        return None
+        await publicar({"type": "error", "message": f"❌ Erro GPT Image 1: {str(e)}"})
+        return False
 
 
-async def gerar_imagem_google(prompt: str, tamanho: str = "1024x1024") -> Optional[bytes]:
+async def gerar_imagem_google(prompt: str, tamanho: str, destino: Path, publicar: Publicador, uso: list[dict]) -> bool:
     """Gera imagem usando Google Imagen 3 (Nano Banana)"""
     try:
-        # Configurar Google Imagen 3
-        import google.generativeai as genai
-        
         # Configurar API key
         google_api_key = os.getenv("GOOGLE_API_KEY")
         if not google_api_key:
             print("GOOGLE_API_KEY não configurada")
-            return None
+            return False
             
         genai.configure(api_key=google_api_key)
         
@@ -175,185 +321,496 @@ async def gerar_imagem_google(prompt: str, tamanho: str = "1024x1024") -> Option
         # Ajustar prompt para melhor qualidade
         enhanced_prompt = f"{prompt} high quality, professional, modern design"
         
-        # Gerar imagem
-        response = model.generate_images(
-            prompt=enhanced_prompt,
-            number_of_images=1,
-            aspect_ratio=tamanho,
-        )
+        # Gerar imagem (SDK síncrono: executar fora do event loop, no pool próprio das imagens,
+        # para que a vaga ocupada não dependa das threads do executor padrão)
+        async with limitador.reservar_async("google/gemini-2.5-flash-image"):
+            response = await asyncio.get_running_loop().run_in_executor(
+                pool_imagens,
+                functools.partial(
+                    model.generate_images,
+                    prompt=enhanced_prompt,
+                    number_of_images=1,
+                    aspect_ratio=tamanho,
+                )
+            )
         
         if response and response.images:
-            # Retornar bytes da primeira imagem
-            return response.images[0]._pil_image.tobytes()
+            uso.append({"provedor": "google", "modelo": "gemini-2.5-flash-image", "etapa": "imagem", "imagens": 1})
+            # Gravar bytes da primeira imagem
+            async with aiofiles.open(destino, "wb") as f:
+                await f.write(response.images[0]._pil_image.tobytes())
+            return True
         
-        return None
+        return False
         
     except Exception as e:
         print(f"Erro ao gerar imagem Google Imagen 3: {e}")
         # Fallback para OpenAI se Google falhar
-        return await gerar_imagem_openai(prompt, tamanho)
+        return await gerar_imagem_openai(prompt, tamanho, destino, publicar, uso)
+
+
+async def gerar_imagem_mock(prompt: str, tamanho: str, destino: Path, publicar: Publicador, uso: list[dict]) -> bool:
+    """Imagem simulada (testes de carga, sem API): latência e falhas configuradas em MOCK_PROVEDORES"""
+    try:
+        async with limitador.reservar_async("mock/imagem"):
+            await mocks.simular_imagem(f"{tamanho}:{prompt}")
+        # Gravação fora da vaga do limitador
+        await mocks.gravar_imagem_mock(tamanho, destino)
+        uso.append({"provedor": "mock", "modelo": "mock-imagem", "etapa": "imagem", "imagens": 1})
+        return True
+    except Exception as e:
+        await publicar({"type": "error", "message": f"❌ Erro na imagem simulada: {str(e)}"})
+        return False
+
+
+def criar_prompt_imagem(nome_criativo: str, tipo_material: str) -> str:
+    """Monta o prompt das imagens (depende apenas do nome e do tipo de material)"""
+    return f"""Crie uma imagem moderna e profissional para um produto educacional brasileiro.
+Produto: {nome_criativo}
+Tipo: {tipo_material}
+Estilo: Moderno, clean, cores vibrantes, tipografia legível
+Elementos: Livros, mapas mentais, elementos educacionais
+Público: Estudantes de concursos públicos e OAB"""
+
+
+async def gerar_imagem(
+    config: ConfigGerador,
+    prompt: str,
+    tamanho: str,
+    destino: Path,
+    publicar: Publicador,
+    uso: list[dict]
+) -> Optional[Path]:
+    """Gera uma imagem no provedor configurado; retorna o caminho gravado"""
+    with telemetria.span("imagem", provedor=config.image_provider, tamanho=tamanho) as span:
+        if config.image_provider == "google":
+            gerada = await gerar_imagem_google(prompt, tamanho, destino, publicar, uso)
+        elif config.image_provider == "mock":
+            gerada = await gerar_imagem_mock(prompt, tamanho, destino, publicar, uso)
+        else:
+            gerada = await gerar_imagem_openai(prompt, tamanho, destino, publicar, uso)
+        if not gerada:
+            # Os provedores já publicaram o erro
+            span.status = "erro"
+    return destino if gerada else None
+
+
+async def gerar_imagens(
+    config: ConfigGerador,
+    nome_criativo: str,
+    tipo_material: str,
+    pasta: Path,
+    publicar: Publicador,
+    uso: list[dict]
+) -> tuple[Optional[Path], Optional[Path]]:
+    """Gera as imagens vertical e quadrada em paralelo dentro da pasta informada"""
+    prompt_imagem = criar_prompt_imagem(nome_criativo, tipo_material)
+    pasta.mkdir(parents=True, exist_ok=True)
+    
+    async def nenhuma():
+        return None
+    
+    return await asyncio.gather(
+        gerar_imagem(config, prompt_imagem, "1080x1920", pasta / "vert.png", publicar, uso) if config.gerar_imagem_vert else nenhuma(),
+        gerar_imagem(config, prompt_imagem, "1080x1080", pasta / "quad.png", publicar, uso) if config.gerar_imagem_quad else nenhuma()
+    )
+
+
+class ImagensEspeculativas:
+    """Dispara as imagens a partir do rascunho e só as refaz se nome ou tipo mudarem"""
+    
+    def __init__(self, config: ConfigGerador, publicar: Publicador):
+        self.config = config
+        self.publicar = publicar
+        self.chave: Optional[tuple[str, str]] = None
+        self.tarefa: Optional[asyncio.Task] = None
+        self.pasta: Optional[Path] = None
+        # Consumo de todas as imagens geradas, inclusive as descartadas por um rascunho divergente
+        self.uso: list[dict] = []
+    
+    def rascunho(self, nome_criativo: str, tipo_material: str) -> bool:
+        """Registra um rascunho; retorna True se uma nova geração foi disparada"""
+        chave = (nome_criativo, tipo_material)
+        if chave == self.chave:
+            return False
+        self.descartar()
+        self.chave = chave
+        # Cada tentativa grava em sua própria pasta temporária
+        self.pasta = PASTA_TEMP_IMAGENS / uuid.uuid4().hex
+        self.tarefa = asyncio.create_task(self._gerar(nome_criativo, tipo_material, self.pasta))
+        return True
+    
+    async def _gerar(self, nome_criativo: str, tipo_material: str, pasta: Path):
+        try:
+            return await gerar_imagens(self.config, nome_criativo, tipo_material, pasta, self.publicar, self.uso)
+        except BaseException:
+            shutil.rmtree(pasta, ignore_errors=True)
+            raise
+    
+    async def obter(self, nome_criativo: str, tipo_material: str) -> tuple[Optional[Path], Optional[Path]]:
+        """Retorna as imagens do conteúdo final, regenerando se o rascunho divergiu"""
+        self.rascunho(nome_criativo, tipo_material)
+        return await self.tarefa
+    
+    def descartar(self):
+        """Cancela a geração em andamento ou remove os arquivos já gerados"""
+        if self.tarefa and not self.tarefa.done():
+            self.tarefa.cancel()
+        elif self.pasta:
+            shutil.rmtree(self.pasta, ignore_errors=True)
+
+
+async def enviar_resultado(resultado: ResultadoFinal, output_dir: Path, publicar: Publicador):
+    """Envia o resultado completo e a mensagem de conclusão"""
+    await publicar({
+            "type": "resultado",
+            "data": {
+                **resultado.model_dump(),
+                "output_dir": str(output_dir),
+                "json_path": str(output_dir / "conteudo.json")
+            }
+        })
+    
+    await publicar({"type": "success", "message": f"🎉 Geração concluída! Nota final: {resultado.nota_conteudo}/10"})
 
 
 async def processar_geracao(config_dict: dict, websocket: WebSocket):
-    """Processa a geração completa de conteúdos"""
+    """Processa um pedido de geração vindo do WebSocket"""
+    async def enviar(evento: dict):
+        await manager.send_log(json.dumps(evento), websocket)
+    
     try:
         # Validar configuração
         config = ConfigGerador(**config_dict)
-        
-        await manager.send_log(
-            json.dumps({"type": "info", "message": "🚀 Iniciando geração de conteúdos..."}),
-            websocket
-        )
-        
-        # Criar sistema de agentes
-        agents = MarketingAgents(config)
-        
-        await manager.send_log(
-            json.dumps({"type": "info", "message": f"🤖 Usando LLM: {config.llm_provider}"}),
-            websocket
-        )
-        
-        # Executar fluxo
-        conteudo, avaliacao, logs, iteracoes = agents.executar()
-        
-        # Enviar logs em tempo real
-        for log in logs:
-            await manager.send_log(
-                json.dumps({"type": "log", "message": log}),
-                websocket
-            )
-        
-        if not conteudo or not avaliacao:
-            await manager.send_log(
-                json.dumps({"type": "error", "message": "❌ Erro ao gerar conteúdo"}),
-                websocket
-            )
+    except ValidationError as e:
+        await enviar({"type": "error", "message": f"❌ Erro de validação: {str(e)}", "terminal": True})
+        return None
+    
+    return await gerar_conteudos(config, enviar)
+
+
+async def gerar_conteudos(config: ConfigGerador, enviar: Publicador) -> Optional[ResultadoFinal]:
+    """Gera os conteúdos de uma configuração (cache + deduplicação), enviando o progresso"""
+    chave = chave_config(config, VERSAO_PROMPT)
+    
+    # Configuração idêntica já gerada: devolver o resultado salvo
+    if not config.force_refresh:
+        em_cache = cache.obter(chave)
+        if em_cache:
+            resultado, output_dir = em_cache
+            await enviar({"type": "info", "message": f"♻️ Resultado recuperado do cache: {output_dir}"})
+            await enviar_resultado(resultado, output_dir, enviar)
+            return resultado
+    
+    # Configuração idêntica em andamento: acompanhar a execução (e o job) existente
+    if single_flight.em_andamento(chave):
+        await enviar({"type": "info", "message": "🔗 Geração idêntica já em andamento, acompanhando..."})
+    
+    async def novo_job(publicar: Publicador) -> Optional[ResultadoFinal]:
+        # Criado só pela execução líder: quem acompanha recebe o mesmo job pelo histórico de eventos
+        job_id = uuid.uuid4().hex[:12]
+        registro.criar(job_id, chave, config)
+        await publicar({"type": "job", "job_id": job_id})
+        return await executar_geracao(config, chave, job_id, publicar)
+    
+    resultado, _ = await single_flight.executar(chave, novo_job, enviar)
+    return resultado
+
+
+async def reconectar_job(job_id: str, websocket: WebSocket):
+    """Volta a acompanhar um job pelo id: eventos desde o início, ou o resultado se já terminou"""
+    async def enviar(evento: dict):
+        await manager.send_log(json.dumps(evento), websocket)
+    
+    job = registro.obter(job_id)
+    if not job:
+        await enviar({"type": "error", "message": f"❌ Job {job_id} não encontrado", "terminal": True})
+        return None
+    
+    execucao = single_flight.execucao(job["chave"])
+    if execucao:
+        # O histórico da execução começa pelo evento "job"
+        await enviar({"type": "info", "message": f"🔗 Reconectado ao job {job_id}"})
+        return await execucao.acompanhar(enviar)
+    
+    if job["status"] == "concluido" and job["output_dir"]:
+        output_dir = Path(job["output_dir"])
+        try:
+            with open(output_dir / "conteudo.json", "r", encoding="utf-8") as f:
+                resultado = ResultadoFinal(**json.load(f))
+        except (OSError, ValueError):
+            await enviar({"type": "error", "message": f"❌ Arquivos do job {job_id} não encontrados", "terminal": True})
             return None
+        await enviar_resultado(resultado, output_dir, enviar)
+        return resultado
+    
+    await enviar({"type": "error", "message": f"❌ Job {job_id} {job['status']}: {job['erro'] or 'sem resultado'}", "terminal": True})
+    return None
+
+
+async def retomar_job(job: dict):
+    """Retoma um job interrompido; clientes podem reconectar pelo id enquanto ele roda"""
+    async def sem_assinante(evento: dict):
+        pass
+    
+    config = ConfigGerador.model_validate_json(job["config"])
+    print(f"Retomando job {job['job_id']} ({config.radical})")
+    
+    async def retomar(publicar: Publicador) -> Optional[ResultadoFinal]:
+        await publicar({"type": "job", "job_id": job["job_id"]})
+        return await executar_geracao(config, job["chave"], job["job_id"], publicar)
+    
+    await single_flight.executar(job["chave"], retomar, sem_assinante)
+
+
+async def executar_geracao(
+    config: ConfigGerador,
+    chave: str,
+    job_id: str,
+    publicar: Publicador
+) -> Optional[ResultadoFinal]:
+    """Executa a geração completa de conteúdos, publicando o progresso e o status do job"""
+    with telemetria.span("job", job_id=job_id, radical=config.radical, provedor=config.llm_provider) as span_job:
+        # Cancelamento (ex: desligamento do servidor) não altera o status: o job será retomado
+        registro.atualizar(job_id, "executando")
+        gerar_imgs = config.gerar_imagem_vert or config.gerar_imagem_quad
+        especulativas = ImagensEspeculativas(config, publicar)
+        # Enquanto o worker do grafo roda, ele pode gravar checkpoints mesmo depois de cancelado
+        worker_ativo = False
         
-        # Gerar ID único
-        id_conteudos = str(uuid.uuid4())[:10]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Criar pasta de output
-        output_dir = Path(f"outputs/{timestamp}_{id_conteudos}")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        images_dir = output_dir / "imagens"
-        images_dir.mkdir(exist_ok=True)
-        
-        await manager.send_log(
-            json.dumps({"type": "info", "message": f"📁 Pasta criada: {output_dir}"}),
-            websocket
-        )
-        
-        # Gerar imagens se solicitado
-        nome_img_vert = None
-        nome_img_quad = None
+        def apagar_checkpoints():
+            # Worker cancelado parou: nenhuma gravação tardia recria os checkpoints apagados
+            if not encerrando:
+                registro.apagar_checkpoints(job_id)
         
-        if config.gerar_imagem_vert or config.gerar_imagem_quad:
-            await manager.send_log(
-                json.dumps({"type": "info", "message": "🎨 Gerando imagens..."}),
-                websocket
-            )
+        try:
+            await publicar({"type": "info", "message": "🚀 Iniciando geração de conteúdos..."})
             
-            # Criar prompt para imagem
-            prompt_imagem = f"""Crie uma imagem moderna e profissional para um produto educacional brasileiro.
-Produto: {conteudo.nome_criativo}
-Tipo: {conteudo.tipo_material}
-Estilo: Moderno, clean, cores vibrantes, tipografia legível
-Elementos: Livros, mapas mentais, elementos educacionais
-Público: Estudantes de concursos públicos e OAB"""
+            await publicar({"type": "info", "message": f"🤖 Usando LLM: {config.llm_provider}"})
+            
+            if executor.lotado:
+                await publicar({"type": "info", "message": "⏳ Todas as vagas ocupadas, aguardando na fila..."})
             
-            if config.gerar_imagem_vert:
-                if config.image_provider == "google":
-                    img_vert = await gerar_imagem_google(prompt_imagem, "1080x1920")
-                else:
-                    img_vert = await gerar_imagem_openai(prompt_imagem, "1080x1920")
-                    
+
+            async def enviar_evento(evento: dict):
+                # Modo especulativo: iniciar as imagens enquanto o texto ainda é revisado
+                if evento["type"] == "rascunho" and gerar_imgs and config.imagens_especulativas:
+                    if especulativas.rascunho(evento["nome_criativo"], evento["tipo_material"]):
+                        await publicar({"type": "info", "message": f"🎨 Imagens iniciadas a partir do rascunho: {evento['nome_criativo']}"})
+                await publicar(evento)
+            
+            # Executar fluxo em um worker, enviando logs, nós e notas em tempo real
+            cancelado = threading.Event()
+            worker_ativo = True
+            try:
+                conteudo, avaliacao, logs, iteracoes, uso_chamadas = await executor.executar_com_eventos(
+                    lambda emitir: MarketingAgents(config, on_evento=emitir, cancelado=cancelado).executar(
+                        thread_id=job_id, checkpointer=registro.checkpointer
+                    ),
+                    enviar_evento,
+                    apos_cancelamento=apagar_checkpoints
+                )
+                worker_ativo = False
+            except BaseException:
+                # Inclui o cancelamento do job: o grafo para no próximo nó ou chamada ao LLM
+                cancelado.set()
+                especulativas.descartar()
+                raise
+            
+            if not conteudo:
+                especulativas.descartar()
+                span_job.status = "erro"
+                registro.atualizar(job_id, "erro", erro="Erro ao gerar conteúdo")
+                await publicar({"type": "error", "message": "❌ Erro ao gerar conteúdo", "terminal": True})
+                return None
+            if not avaliacao:
+                await publicar({"type": "info", "message": "⚠️ Revisão indisponível: conteúdo entregue sem nota, marcado como pendente"})
+            
+            # Gerar ID único
+            id_conteudos = str(uuid.uuid4())[:10]
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            
+            # Criar pasta de output
+            output_dir = Path(f"outputs/{timestamp}_{id_conteudos}")
+            output_dir.mkdir(parents=True, exist_ok=True)
+            images_dir = output_dir / "imagens"
+            images_dir.mkdir(exist_ok=True)
+            
+            await publicar({"type": "info", "message": f"📁 Pasta criada: {output_dir}"})
+            
+            # Gerar imagens se solicitado
+            nome_img_vert = None
+            nome_img_quad = None
+            
+            if gerar_imgs:
+                await publicar({"type": "info", "message": "🎨 Gerando imagens..."})
+                
+                # Vertical e quadrada em paralelo (reaproveitando as especulativas, se válidas)
+                img_vert, img_quad = await especulativas.obter(conteudo.nome_criativo, conteudo.tipo_material)
+                
                 if img_vert:
                     nome_img_vert = f"{config.radical}_{conteudo.tipo_material.replace(' ', '')}_Vert_{timestamp}.png"
-                    with open(images_dir / nome_img_vert, "wb") as f:
-                        f.write(img_vert)
-                    await manager.send_log(
-                        json.dumps({"type": "success", "message": f"✅ Imagem vertical gerada: {nome_img_vert}"}),
-                        websocket
-                    )
-            
-            if config.gerar_imagem_quad:
-                if config.image_provider == "google":
-                    img_quad = await gerar_imagem_google(prompt_imagem, "1080x1080")
-                else:
-                    img_quad = await gerar_imagem_openai(prompt_imagem, "1080x1080")
-                    
+                    with telemetria.span("arquivo", arquivo="imagem"):
+                        shutil.move(img_vert, images_dir / nome_img_vert)
+                    await publicar({"type": "success", "message": f"✅ Imagem vertical gerada: {nome_img_vert}"})
+                
                 if img_quad:
                     nome_img_quad = f"{config.radical}_{conteudo.tipo_material.replace(' ', '')}_Quad_{timestamp}.png"
-                    with open(images_dir / nome_img_quad, "wb") as f:
-                        f.write(img_quad)
-                    await manager.send_log(
-                        json.dumps({"type": "success", "message": f"✅ Imagem quadrada gerada: {nome_img_quad}"}),
-                        websocket
-                    )
-        
-        # Criar resultado final
-        resultado = ResultadoFinal(
-            data_geracao=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            id_conteudos=id_conteudos,
-            tipo_material=conteudo.tipo_material,
-            desc_hotmart=conteudo.desc_hotmart,
-            artigo=conteudo.artigo,
-            legenda=conteudo.legenda,
-            nome_imagem_vert=nome_img_vert,
-            nome_imagem_quad=nome_img_quad,
-            nome_criativo=conteudo.nome_criativo,
-            desc_pv=conteudo.desc_pv,
-            extra=conteudo.extra,
-            nota_conteudo=avaliacao.nota,
-            iteracoes_realizadas=iteracoes,
-            qualidade_pendente=(avaliacao.nota < 8 and iteracoes >= config.max_iteracoes)
-        )
-        
-        # Salvar JSON
-        json_path = output_dir / "conteudo.json"
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(resultado.model_dump(), f, ensure_ascii=False, indent=2)
-        
-        await manager.send_log(
-            json.dumps({"type": "success", "message": f"✅ JSON salvo: {json_path}"}),
-            websocket
-        )
-        
-        # Enviar resultado completo
-        await manager.send_log(
-            json.dumps({
-                "type": "resultado",
-                "data": {
-                    **resultado.model_dump(),
-                    "output_dir": str(output_dir),
-                    "json_path": str(json_path)
-                }
-            }),
-            websocket
-        )
-        
-        await manager.send_log(
-            json.dumps({"type": "success", "message": f"🎉 Geração concluída! Nota final: {avaliacao.nota}/10"}),
-            websocket
-        )
-        
-        return resultado
-        
-    except ValidationError as e:
-        await manager.send_log(
-            json.dumps({"type": "error", "message": f"❌ Erro de validação: {str(e)}"}),
-            websocket
-        )
-        return None
-    except Exception as e:
-        await manager.send_log(
-            json.dumps({"type": "error", "message": f"❌ Erro: {str(e)}"}),
-            websocket
-        )
-        return None
+                    with telemetria.span("arquivo", arquivo="imagem"):
+                        shutil.move(img_quad, images_dir / nome_img_quad)
+                    await publicar({"type": "success", "message": f"✅ Imagem quadrada gerada: {nome_img_quad}"})
+                
+                especulativas.descartar()
+            
+            # Criar resultado final
+            resultado = ResultadoFinal(
+                data_geracao=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                id_conteudos=id_conteudos,
+                radical=config.radical,
+                llm_provider=config.llm_provider,
+                tipo_material=conteudo.tipo_material,
+                desc_hotmart=conteudo.desc_hotmart,
+                artigo=conteudo.artigo,
+                legenda=conteudo.legenda,
+                nome_imagem_vert=nome_img_vert,
+                nome_imagem_quad=nome_img_quad,
+                nome_criativo=conteudo.nome_criativo,
+                desc_pv=conteudo.desc_pv,
+                extra=conteudo.extra,
+                nota_conteudo=avaliacao.nota if avaliacao else 0.0,
+                iteracoes_realizadas=iteracoes,
+                qualidade_pendente=not avaliacao or avaliacao.nota < 8,
+                custo=calcular_custo(uso_chamadas + especulativas.uso)
+            )
+            
+            # Salvar JSON
+            json_path = output_dir / "conteudo.json"
+            with telemetria.span("arquivo", arquivo="conteudo.json"), open(json_path, "w", encoding="utf-8") as f:
+                json.dump(resultado.model_dump(), f, ensure_ascii=False, indent=2)
+            
+            if not resultado.qualidade_pendente:
+                # Conteúdo não revisado ou abaixo da nota mínima não deve ser reaproveitado
+                cache.salvar(chave, output_dir)
+            
+            indice.indexar(resultado, output_dir, job_id=job_id)
+            registro.atualizar(job_id, "concluido", output_dir=str(output_dir))
+            await publicar({"type": "success", "message": f"✅ JSON salvo: {json_path}"})
+            await publicar({
+                "type": "info",
+                "message": f"💰 Custo estimado: US$ {resultado.custo.custo_usd:.4f} "
+                           f"({resultado.custo.tokens_entrada + resultado.custo.tokens_saida} tokens, {resultado.custo.imagens} imagens)"
+            })
+            
+            await enviar_resultado(resultado, output_dir, publicar)
+            return resultado
+            
+        except asyncio.CancelledError:
+            # Cliente abortou ou abandonou o job: as imagens em andamento são canceladas junto
+            especulativas.descartar()
+            if not encerrando:
+                # Com o worker ainda rodando, os checkpoints são apagados quando ele parar
+                registro.atualizar(job_id, "cancelado", apagar_checkpoints=not worker_ativo)
+            raise
+        except ValidationError as e:
+            span_job.status = "erro"
+            registro.atualizar(job_id, "erro", erro=str(e))
+            await publicar({"type": "error", "message": f"❌ Erro de validação: {str(e)}", "terminal": True})
+            return None
+        except Exception as e:
+            span_job.status = "erro"
+            registro.atualizar(job_id, "erro", erro=str(e))
+            await publicar({"type": "error", "message": f"❌ Erro: {str(e)}", "terminal": True})
+            return None
+
+
+
+@app.post("/lotes")
+async def criar_lote(request: Request, formato: str = "csv", paralelismo: int = 2):
+    """Gera um lote a partir do arquivo CSV/JSONL enviado no corpo, transmitindo o progresso em NDJSON"""
+    try:
+        linhas = ler_lote((await request.body()).decode("utf-8-sig"), formato)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not linhas:
+        raise HTTPException(status_code=400, detail="Lote vazio")
+    
+    async def transmitir():
+        fila: asyncio.Queue = asyncio.Queue()
+        tarefa = asyncio.create_task(executar_lote(linhas, gerar_conteudos, paralelismo, fila.put))
+        tarefa.add_done_callback(lambda _: fila.put_nowait(None))
+        try:
+            while (evento := await fila.get()) is not None:
+                # Parciais e resultados completos ficam de fora: o manifesto aponta as pastas
+                if evento["type"] not in ("partial", "resultado"):
+                    yield json.dumps(evento, ensure_ascii=False) + "\n"
+            manifesto = await tarefa
+            yield json.dumps({"type": "manifesto", "data": manifesto.model_dump()}, ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desconectado: os itens em andamento são cancelados
+            tarefa.cancel()
+    
+    return StreamingResponse(transmitir(), media_type="application/x-ndjson")
+
+
+@app.get("/lotes/{lote_id}")
+async def obter_lote(lote_id: str):
+    """Manifesto de um lote já executado (ou interrompido)"""
+    manifesto = carregar_manifesto(lote_id)
+    if not manifesto:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    return manifesto
+
+
+@app.get("/jobs")
+async def listar_jobs(
+    radical: Optional[str] = None,
+    tipo_material: Optional[str] = None,
+    provedor: Optional[str] = None,
+    nota_min: Optional[float] = None,
+    nota_max: Optional[float] = None,
+    de: Optional[str] = None,
+    ate: Optional[str] = None,
+    q: Optional[str] = None,
+    status: Optional[str] = None,
+    pagina: int = 1,
+    por_pagina: int = 20
+):
+    """Histórico paginado dos jobs e seus resultados, com filtros e busca textual (q) em nome, legenda e descrição"""
+    for data in (de, ate):
+        if data:
+            try:
+                datetime.strptime(data, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Data inválida: '{data}' (use AAAA-MM-DD)")
+    return await asyncio.to_thread(
+        indice.buscar,
+        radical=radical,
+        tipo_material=tipo_material,
+        llm_provider=provedor,
+        nota_min=nota_min,
+        nota_max=nota_max,
+        de=de,
+        ate=ate,
+        busca=q,
+        status=status,
+        pagina=pagina,
+        por_pagina=por_pagina
+    )
+
+
+@app.get("/custos")
+async def relatorio(agrupar: str = "provedor", de: Optional[str] = None, ate: Optional[str] = None):
+    """Tokens e custo das gerações salvas, agregados por radical, provedor ou dia (de/ate: AAAA-MM-DD)"""
+    if agrupar not in AGRUPAMENTOS:
+        raise HTTPException(status_code=400, detail=f"agrupar deve ser um de: {', '.join(AGRUPAMENTOS)}")
+    linhas = await asyncio.to_thread(indice.custos, agrupar, de, ate)
+    return {"agrupar": agrupar, "de": de, "ate": ate, "grupos": linhas}
+
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Histogramas de duração, tokens e tentativas no formato texto do Prometheus"""
+    return PlainTextResponse(telemetria.metricas.texto(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/download/{folder}/{filename}")
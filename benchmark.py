@@ -0,0 +1,392 @@
+"""
+Benchmark de ponta a ponta do fluxo de geração, com os provedores simulados (mocks.py)
+
+Modos:
+    servidor: sobe o app.py na mesma máquina e conecta N clientes WebSocket simultâneos
+    pipeline: roda MarketingAgents.executar isolado (sem servidor, imagens nem arquivos)
+
+Uso:
+    python benchmark.py servidor --jobs 40 --concorrencia 10
+    python benchmark.py pipeline --jobs 100 --concorrencia 20 --comparar benchmarks/base.json
+
+Os resultados são gravados em JSON (benchmarks/<data>_<modo>_<commit>.json) e podem ser
+comparados com uma execução anterior; regressões acima da tolerância encerram com código 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import resource
+except ImportError:
+    # Windows: o pico de memória vem do psutil, se instalado
+    resource = None
+
+PASTA_RESULTADOS = Path("benchmarks")
+# Pastas que o app.py precisa encontrar no diretório de trabalho
+PASTAS_APP = ("templates", "static")
+# Intervalo para verificar, depois de um erro, se o job terminou sem resultado
+INTERVALO_VERIFICACAO = 0.5
+
+# Métricas comparadas entre execuções: caminho no JSON e se valores maiores são piores
+METRICAS_COMPARADAS = {
+    "throughput_jobs_min": False,
+    "latencia_s.p50": True,
+    "latencia_s.p95": True,
+    "latencia_s.p99": True,
+    "primeiro_log_s.p95": True,
+    "lag_loop_ms.p99": True,
+    "memoria_por_job_mb": True,
+}
+
+
+def percentis(valores: list[float]) -> Optional[dict]:
+    """p50/p95/p99 (nearest-rank), média e máximo"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+
+    def p(q: float) -> float:
+        return round(ordenados[min(len(ordenados) - 1, max(0, round(q * len(ordenados)) - 1))], 4)
+
+    return {
+        "p50": p(0.50),
+        "p95": p(0.95),
+        "p99": p(0.99),
+        "media": round(statistics.fmean(ordenados), 4),
+        "max": round(ordenados[-1], 4),
+    }
+
+
+def _rss_pico_mb() -> Optional[float]:
+    """Pico de memória residente do processo, ou None se não há como medir"""
+    if resource is not None:
+        # ru_maxrss: KB no Linux, bytes no macOS
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memoria = psutil.Process().memory_info()
+    # peak_wset: pico do working set no Windows
+    return getattr(memoria, "peak_wset", memoria.rss) / (1024 * 1024)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _config_job(indice: int, args: argparse.Namespace) -> dict:
+    """Configuração de um job do benchmark (radical único: sem cache nem deduplicação)"""
+    return {
+        "radical": f"bench{indice}",
+        "insumos": "Mapas mentais de Direito Administrativo para concursos",
+        "llm_provider": "mock",
+        "image_provider": "mock",
+        "provedores_fallback": [],
+        "max_iteracoes": args.max_iteracoes,
+        "stream_parcial": args.stream_parcial,
+        "gerar_imagem_vert": args.imagens,
+        "gerar_imagem_quad": args.imagens,
+        "force_refresh": True,
+    }
+
+
+class MedidorLoop:
+    """Mede o atraso do event loop: quanto um sleep curto demora além do pedido"""
+
+    def __init__(self, intervalo: float = 0.01):
+        self.intervalo = intervalo
+        self.atrasos_ms: list[float] = []
+        self._tarefa: Optional[asyncio.Task] = None
+
+    async def _medir(self):
+        while True:
+            inicio = time.perf_counter()
+            await asyncio.sleep(self.intervalo)
+            self.atrasos_ms.append((time.perf_counter() - inicio - self.intervalo) * 1000)
+
+    def iniciar(self):
+        self._tarefa = asyncio.create_task(self._medir())
+
+    def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+
+
+async def _cliente(url: str, config: dict, status_job: Callable[[str], Optional[str]]) -> dict:
+    """Um cliente WebSocket: pede a geração e mede o primeiro log e a conclusão
+
+    Erros que não encerram o job (ex: uma imagem que falhou) não contam como falha: só o job
+    que terminou sem resultado, conforme o status no registro de jobs.
+    """
+    import websockets
+    from persistencia import STATUS_ATIVOS
+
+    inicio = time.perf_counter()
+    primeiro_log = None
+    eventos = 0
+    job_id = None
+    erro = None
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"action": "gerar", "config": config}))
+        while True:
+            try:
+                mensagem = await asyncio.wait_for(ws.recv(), INTERVALO_VERIFICACAO)
+            except asyncio.TimeoutError:
+                if erro and (job_id is None or status_job(job_id) not in STATUS_ATIVOS):
+                    return {"ok": False, "erro": erro, "eventos": eventos}
+                continue
+            evento = json.loads(mensagem)
+            eventos += 1
+            if primeiro_log is None and evento["type"] == "log":
+                primeiro_log = time.perf_counter() - inicio
+            if evento["type"] == "job":
+                job_id = evento["job_id"]
+            elif evento["type"] == "error":
+                erro = evento["message"]
+            elif evento["type"] == "cancelado":
+                return {"ok": False, "erro": evento["message"], "eventos": eventos}
+            elif evento["type"] == "resultado":
+                return {
+                    "ok": True,
+                    "latencia": time.perf_counter() - inicio,
+                    "primeiro_log": primeiro_log,
+                    "eventos": eventos,
+                    "output_dir": evento["data"]["output_dir"],
+                }
+
+
+async def benchmark_servidor(args: argparse.Namespace) -> tuple[dict, list[dict]]:
+    """Sobe o app.py em uma porta livre e dispara os clientes com concorrência limitada"""
+    import uvicorn
+    import app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        porta = s.getsockname()[1]
+    servidor = uvicorn.Server(uvicorn.Config(app.app, host="127.0.0.1", port=porta, log_level="warning"))
+    tarefa_servidor = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        await asyncio.sleep(0.05)
+
+    url = f"ws://127.0.0.1:{porta}/ws"
+    semaforo = asyncio.Semaphore(args.concorrencia)
+    medidor = MedidorLoop()
+
+    def status_job(job_id: str) -> Optional[str]:
+        job = app.registro.obter(job_id)
+        return job["status"] if job else None
+
+    async def rodar(indice: int) -> dict:
+        async with semaforo:
+            try:
+                return await _cliente(url, _config_job(indice, args), status_job)
+            except Exception as e:
+                return {"ok": False, "erro": f"{type(e).__name__}: {e}", "eventos": 0}
+
+    memoria_antes = _rss_pico_mb()
+    medidor.iniciar()
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(rodar(i) for i in range(args.jobs)))
+    duracao = time.perf_counter() - inicio
+    medidor.parar()
+
+    servidor.should_exit = True
+    await tarefa_servidor
+
+    metricas = _metricas(resultados, duracao, memoria_antes, args)
+    metricas["lag_loop_ms"] = percentis(medidor.atrasos_ms)
+    return metricas, resultados
+
+
+def benchmark_pipeline(args: argparse.Namespace) -> tuple[dict, list[dict]]:
+    """Executa o grafo de agentes isolado, em threads, com concorrência limitada"""
+    from agents import MarketingAgents
+    from models import ConfigGerador
+
+    def rodar(indice: int) -> dict:
+        inicio = time.perf_counter()
+        primeiro_log = []
+        eventos = []
+
+        def on_evento(evento: dict):
+            eventos.append(evento["type"])
+            if not primeiro_log and evento["type"] == "log":
+                primeiro_log.append(time.perf_counter() - inicio)
+
+        try:
+            conteudo, avaliacao, _, _, _ = MarketingAgents(
+                ConfigGerador(**_config_job(indice, args)), on_evento=on_evento
+            ).executar()
+        except Exception as e:
+            return {"ok": False, "erro": f"{type(e).__name__}: {e}", "eventos": len(eventos)}
+        return {
+            "ok": conteudo is not None and avaliacao is not None,
+            "latencia": time.perf_counter() - inicio,
+            "primeiro_log": primeiro_log[0] if primeiro_log else None,
+            "eventos": len(eventos),
+        }
+
+    memoria_antes = _rss_pico_mb()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia, thread_name_prefix="bench") as pool:
+        resultados = list(pool.map(rodar, range(args.jobs)))
+    duracao = time.perf_counter() - inicio
+
+    metricas = _metricas(resultados, duracao, memoria_antes, args)
+    metricas["lag_loop_ms"] = None
+    return metricas, resultados
+
+
+def _metricas(resultados: list[dict], duracao: float, memoria_antes: Optional[float], args: argparse.Namespace) -> dict:
+    concluidos = [r for r in resultados if r["ok"]]
+    memoria_pico = _rss_pico_mb()
+    return {
+        "jobs": len(resultados),
+        "falhas": len(resultados) - len(concluidos),
+        "duracao_total_s": round(duracao, 3),
+        "throughput_jobs_min": round(len(concluidos) / duracao * 60, 2) if duracao else 0.0,
+        "latencia_s": percentis([r["latencia"] for r in concluidos]),
+        "primeiro_log_s": percentis([r["primeiro_log"] for r in concluidos if r.get("primeiro_log") is not None]),
+        "eventos_por_job": round(statistics.fmean([r["eventos"] for r in resultados]), 1) if resultados else 0,
+        # Crescimento do pico de memória dividido pelos jobs simultâneos
+        "memoria_por_job_mb": (
+            round(max(0.0, memoria_pico - memoria_antes) / min(args.concorrencia, len(resultados) or 1), 3)
+            if memoria_pico is not None and memoria_antes is not None else None
+        ),
+        "memoria_pico_mb": round(memoria_pico, 1) if memoria_pico is not None else None,
+    }
+
+
+def _valor(metricas: dict, caminho: str) -> Optional[float]:
+    valor = metricas
+    for parte in caminho.split("."):
+        valor = valor.get(parte) if isinstance(valor, dict) else None
+    return valor
+
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> list[str]:
+    """Imprime a variação das métricas e retorna as que pioraram além da tolerância"""
+    regressoes = []
+    print(f"\nComparação com {base.get('commit') or '?'} ({base.get('data')}):")
+    if base.get("modo") != atual["modo"] or base.get("parametros") != atual["parametros"]:
+        print(f"  ⚠️ Modo ou parâmetros diferentes da base ({base.get('modo')}): os números podem não ser comparáveis")
+    for caminho, maior_pior in METRICAS_COMPARADAS.items():
+        antes, depois = _valor(base["metricas"], caminho), _valor(atual["metricas"], caminho)
+        if not antes or depois is None:
+            continue
+        variacao = (depois - antes) / antes
+        piorou = variacao > tolerancia if maior_pior else variacao < -tolerancia
+        if piorou:
+            regressoes.append(caminho)
+        print(f"  {'❌' if piorou else '  '} {caminho:<22} {antes:>10.3f} → {depois:>10.3f} ({variacao:+.1%})")
+    return regressoes
+
+
+def _resumo(resultado: dict):
+    m = resultado["metricas"]
+    print(f"\n📊 {resultado['modo']}: {m['jobs']} jobs, {m['falhas']} falhas, {m['duracao_total_s']}s")
+    print(f"   Throughput: {m['throughput_jobs_min']} jobs/min")
+    for nome, chave in (("Latência (s)", "latencia_s"), ("Primeiro log (s)", "primeiro_log_s"), ("Lag do loop (ms)", "lag_loop_ms")):
+        if m.get(chave):
+            print(f"   {nome}: p50 {m[chave]['p50']} | p95 {m[chave]['p95']} | p99 {m[chave]['p99']} | máx {m[chave]['max']}")
+    if m["memoria_pico_mb"] is not None:
+        print(f"   Memória: {m['memoria_por_job_mb']} MB/job (pico {m['memoria_pico_mb']} MB)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do fluxo de geração com provedores simulados")
+    parser.add_argument("modo", choices=("servidor", "pipeline"))
+    parser.add_argument("--jobs", type=int, default=20, help="Total de jobs (padrão: 20)")
+    parser.add_argument("--concorrencia", type=int, default=5, help="Jobs/clientes simultâneos (padrão: 5)")
+    parser.add_argument("--max-iteracoes", type=int, default=3)
+    parser.add_argument("--stream-parcial", action="store_true", help="Usa o streaming parcial do criador")
+    parser.add_argument("--sem-imagens", dest="imagens", action="store_false", help="Não gera imagens (modo servidor)")
+    parser.add_argument("--mock", default='{"latencia": {"media": 0.2}, "notas": [6.5, 8.5], "semente": 1, "imagem": {"latencia": {"media": 0.3}}}',
+                        help="Configuração dos provedores simulados (JSON de MOCK_PROVEDORES)")
+    parser.add_argument("--saida", type=Path, help="Arquivo de resultados (padrão: benchmarks/<data>_<modo>_<commit>.json)")
+    parser.add_argument("--comparar", type=Path, help="Resultado anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita na comparação (padrão: 0.2)")
+    parser.add_argument("--manter-saidas", action="store_true", help="Não apaga a pasta temporária com as saídas geradas")
+    args = parser.parse_args()
+    # Caminhos do usuário valem a partir do diretório atual, antes da troca para a pasta temporária
+    raiz = Path.cwd()
+    commit = _commit()
+    saida = raiz / (args.saida or PASTA_RESULTADOS / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{args.modo}_{commit or 'sem-commit'}.json")
+    base = raiz / args.comparar if args.comparar else None
+
+    # Antes de importar o app: provedores simulados e vagas para todos os jobs simultâneos
+    os.environ["MOCK_PROVEDORES"] = args.mock
+    os.environ["MAX_JOBS_CONCORRENTES"] = str(args.concorrencia)
+
+    # O app grava em outputs/ (resultados, cache e .jobs.db) relativo ao diretório
+    # de trabalho: o benchmark roda numa pasta temporária para não tocar nos dados reais
+    pasta_app = Path(__file__).resolve().parent
+    trabalho = Path(tempfile.mkdtemp(prefix="dra-benchmark-"))
+    for pasta in PASTAS_APP:
+        shutil.copytree(pasta_app / pasta, trabalho / pasta)
+    (trabalho / "outputs").mkdir()
+    sys.path.insert(0, str(pasta_app))
+    os.chdir(trabalho)
+    try:
+        import mocks
+        # Cada execução começa com os sorteios zerados (e lê o MOCK_PROVEDORES definido acima)
+        mocks.config_mock.reiniciar()
+        if args.modo == "servidor":
+            metricas, resultados = asyncio.run(benchmark_servidor(args))
+        else:
+            metricas, resultados = benchmark_pipeline(args)
+    finally:
+        os.chdir(raiz)
+        if args.manter_saidas:
+            print(f"📁 Saídas geradas: {trabalho / 'outputs'}")
+        else:
+            shutil.rmtree(trabalho, ignore_errors=True)
+
+    resultado = {
+        "modo": args.modo,
+        "commit": commit,
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "parametros": {chave: valor for chave, valor in vars(args).items() if chave not in ("saida", "comparar", "modo")},
+        "metricas": metricas,
+        "erros": sorted({r["erro"] for r in resultados if not r["ok"] and r.get("erro")})[:10],
+    }
+    resultado["parametros"] = json.loads(json.dumps(resultado["parametros"], default=str))
+
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    _resumo(resultado)
+    print(f"💾 Resultados: {saida}")
+
+    if base:
+        with open(base, "r", encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        if regressoes:
+            print(f"\n❌ Regressões acima de {args.tolerancia:.0%}: {', '.join(regressoes)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Cache em disco de resultados, endereçado pelo hash da configuração de geração
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from models import ConfigGerador, ResultadoFinal
+
+# Campos que mudam apenas a forma de entrega, não o conteúdo gerado
+CAMPOS_FORA_DA_CHAVE = {
+    "force_refresh", "stream_parcial", "imagens_especulativas",
+    "provedores_fallback", "timeout_llm_segundos", "tentativas_llm", "hedge_llm"
+}
+
+
+def chave_config(config: ConfigGerador, versao_prompt: str) -> str:
+    """Hash canônico da configuração + versão dos templates de prompt"""
+    dados = config.model_dump(exclude=CAMPOS_FORA_DA_CHAVE)
+    dados["versao_prompt"] = versao_prompt
+    canonico = json.dumps(dados, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+class CacheResultados:
+    """Índice chave -> pasta de output, com expiração (TTL) e descarte LRU"""
+
+    def __init__(self, pasta: Path, ttl_horas: float = 168, max_entradas: int = 500):
+        self.pasta = pasta
+        self.ttl_segundos = ttl_horas * 3600
+        self.max_entradas = max_entradas
+
+    def _arquivo(self, chave: str) -> Path:
+        return self.pasta / f"{chave}.json"
+
+    def _expirada(self, entrada: dict) -> bool:
+        return time.time() - entrada.get("criado_em", 0) > self.ttl_segundos
+
+    def obter(self, chave: str) -> Optional[tuple[ResultadoFinal, Path]]:
+        """Retorna o resultado e a pasta de output, se houver entrada válida"""
+        arquivo = self._arquivo(chave)
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        output_dir = Path(entrada["output_dir"])
+        try:
+            with open(output_dir / "conteudo.json", "r", encoding="utf-8") as f:
+                resultado = ResultadoFinal(**json.load(f))
+        except (OSError, ValueError):
+            resultado = None
+
+        # Entrada vencida, arquivos removidos do outputs/ ou qualidade pendente: descartar
+        imagens = [resultado.nome_imagem_vert, resultado.nome_imagem_quad] if resultado else []
+        faltando = any(nome and not (output_dir / "imagens" / nome).exists() for nome in imagens)
+        if resultado is None or resultado.qualidade_pendente or faltando or self._expirada(entrada):
+            arquivo.unlink(missing_ok=True)
+            return None
+
+        # O mtime do arquivo marca o último acesso (usado no descarte LRU)
+        os.utime(arquivo)
+        return resultado, output_dir
+
+    def salvar(self, chave: str, output_dir: Path):
+        """Registra a pasta de output gerada para a chave"""
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        arquivo = self._arquivo(chave)
+        temporario = arquivo.with_suffix(".tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"output_dir": str(output_dir), "criado_em": time.time()}, f)
+        os.replace(temporario, arquivo)
+        self._descartar_excedentes()
+
+    def _descartar_excedentes(self):
+        """Remove entradas vencidas e, acima do limite, as menos acessadas"""
+        validas = []
+        for arquivo in self.pasta.glob("*.json"):
+            try:
+                with open(arquivo, "r", encoding="utf-8") as f:
+                    entrada = json.load(f)
+                if self._expirada(entrada):
+                    arquivo.unlink(missing_ok=True)
+                else:
+                    validas.append((arquivo.stat().st_mtime, arquivo))
+            except (OSError, json.JSONDecodeError):
+                arquivo.unlink(missing_ok=True)
+
+        validas.sort()
+        for _, arquivo in validas[:max(0, len(validas) - self.max_entradas)]:
+            arquivo.unlink(missing_ok=True)
@@ -0,0 +1,90 @@
+"""
+Custo das gerações: tokens e imagens de cada chamada convertidos pela tabela de preços por provedor/modelo
+"""
+import json
+import os
+from typing import Iterable, Optional
+
+from models import CustoGeracao, UsoProvedor
+
+# Preços de referência em USD: "entrada"/"saida" por 1M de tokens, "imagem" por imagem gerada.
+# Confira a tabela atual de cada provedor; PRECOS_PROVEDORES sobrescreve estes valores.
+PRECOS_PADRAO: dict[str, dict[str, float]] = {
+    "anthropic/claude-sonnet-4-5": {"entrada": 3.0, "saida": 15.0},
+    "anthropic/claude-haiku-4-5": {"entrada": 1.0, "saida": 5.0},
+    "openai/gpt-5": {"entrada": 1.25, "saida": 10.0},
+    "openai/gpt-5-mini": {"entrada": 0.25, "saida": 2.0},
+    "google/gemini-2.5-pro": {"entrada": 1.25, "saida": 10.0},
+    "google/gemini-2.5-flash": {"entrada": 0.30, "saida": 2.50},
+    "deepseek/deepseek-chat": {"entrada": 0.28, "saida": 0.42},
+    "grok/grok-2.0": {"entrada": 2.0, "saida": 10.0},
+    "grok/grok-3-mini": {"entrada": 0.30, "saida": 0.50},
+    "qwen/qwen-turbo": {"entrada": 0.05, "saida": 0.20},
+    # Imagens: o GPT Image 1 cobra por token (saída = tokens da imagem), o Gemini por imagem
+    "openai/gpt-image-1": {"entrada": 5.0, "saida": 40.0},
+    "google/gemini-2.5-flash-image": {"imagem": 0.039},
+    "mock": {"entrada": 0.0, "saida": 0.0, "imagem": 0.0},
+}
+
+# Agrupamentos do relatório de custos (GET /custos), agregado pelo índice do histórico
+AGRUPAMENTOS = ("radical", "provedor", "dia")
+
+
+class TabelaPrecos:
+    """Preços por chave "provedor/modelo", com sobreposições da variável PRECOS_PROVEDORES (JSON)
+
+    Exemplo: {"anthropic/claude-sonnet-4-5": {"entrada": 3, "saida": 15}, "mock": {"entrada": 1, "saida": 2}}
+    A chave exata tem prioridade sobre a do provedor.
+    """
+
+    def __init__(self, precos: Optional[dict[str, dict]] = None):
+        self._precos = precos
+
+    @property
+    def precos(self) -> dict[str, dict]:
+        if self._precos is None:
+            # Leitura tardia: o .env é carregado depois da importação dos módulos
+            try:
+                configurados = json.loads(os.getenv("PRECOS_PROVEDORES") or "{}")
+            except json.JSONDecodeError:
+                configurados = {}
+            self._precos = {**PRECOS_PADRAO, **configurados}
+        return self._precos
+
+    def preco(self, provedor: str, modelo: str) -> Optional[dict]:
+        return self.precos.get(f"{provedor}/{modelo}") or self.precos.get(provedor)
+
+    def custo(self, uso: UsoProvedor) -> Optional[float]:
+        """Custo em USD do uso, ou None se o modelo não está na tabela"""
+        preco = self.preco(uso.provedor, uso.modelo)
+        if preco is None:
+            return None
+        return (
+            uso.tokens_entrada * preco.get("entrada", 0) / 1_000_000
+            + uso.tokens_saida * preco.get("saida", 0) / 1_000_000
+            + uso.imagens * preco.get("imagem", 0)
+        )
+
+
+tabela_precos = TabelaPrecos()
+
+
+def calcular_custo(usos: Iterable[dict]) -> CustoGeracao:
+    """Soma o consumo das chamadas do job e o converte pela tabela de preços"""
+    custo = CustoGeracao()
+    for dados in usos:
+        uso = UsoProvedor(**dados)
+        valor = tabela_precos.custo(uso)
+        if valor is None:
+            chave = f"{uso.provedor}/{uso.modelo}"
+            if chave not in custo.sem_preco:
+                custo.sem_preco.append(chave)
+        else:
+            uso.custo_usd = round(valor, 6)
+            custo.custo_usd += valor
+        custo.tokens_entrada += uso.tokens_entrada
+        custo.tokens_saida += uso.tokens_saida
+        custo.imagens += uso.imagens
+        custo.chamadas.append(uso)
+    custo.custo_usd = round(custo.custo_usd, 6)
+    return custo
@@ -0,0 +1,407 @@
+"""
+Índice SQLite (com busca textual FTS5) dos resultados salvos em outputs/, para o histórico paginado
+
+As tabelas ficam no banco do registro de jobs (outputs/.jobs.db): o histórico junta os resultados
+aos jobs pelo job_id e também lista os jobs sem resultado (em andamento, com erro ou cancelados).
+Cada geração concluída é indexada ao salvar o conteudo.json. Para pastas antigas ou copiadas:
+    python historico.py reindexar
+"""
+import argparse
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+
+from custos import AGRUPAMENTOS
+from models import PaginaJobs, ResultadoFinal, ResumoJob
+
+MAX_POR_PAGINA = 100
+# Resultados gravados por transação na reindexação
+TAMANHO_LOTE_INDEXACAO = 500
+
+COLUNAS = (
+    "pasta", "id_conteudos", "job_id", "radical", "tipo_material", "llm_provider", "nome_criativo",
+    "nota_conteudo", "iteracoes_realizadas", "qualidade_pendente", "custo_usd", "data_geracao",
+    "legenda", "desc_hotmart"
+)
+
+
+# Colunas do histórico para os jobs que não têm resultado salvo
+_SQL_JOBS_SEM_RESULTADO = """
+    SELECT NULL AS pasta, NULL AS id_conteudos, j.job_id, json_extract(j.config, '$.radical') AS radical,
+           NULL AS tipo_material, json_extract(j.config, '$.llm_provider') AS llm_provider,
+           NULL AS nome_criativo, NULL AS nota_conteudo, NULL AS iteracoes_realizadas,
+           NULL AS qualidade_pendente, NULL AS custo_usd,
+           datetime(j.criado_em, 'unixepoch', 'localtime') AS data_geracao, j.status, j.erro,
+           NULL AS trecho, NULL AS relevancia, j.rowid AS ordem
+    FROM jobs j
+    WHERE NOT EXISTS (SELECT 1 FROM resultados r WHERE r.job_id = j.job_id)
+"""
+
+
+# Chave de cada agrupamento do relatório de custos (r: resultados, c: custos da geração ou do provedor)
+_CHAVES_CUSTOS = {
+    "radical": "COALESCE(r.radical, 'desconhecido')",
+    "provedor": "COALESCE(c.provedor, 'desconhecido')",
+    "dia": "substr(r.data_geracao, 1, 10)",
+}
+
+# Custos por provedor somados por resultado (agrupamentos por radical e por dia)
+_SQL_CUSTOS_POR_RESULTADO = """
+    SELECT resultado_id, SUM(tokens_entrada) AS tokens_entrada, SUM(tokens_saida) AS tokens_saida,
+           SUM(imagens) AS imagens, SUM(custo_usd) AS custo_usd
+    FROM custos_resultados GROUP BY resultado_id
+"""
+
+
+# Um job_id já conhecido não é apagado por uma reindexação que não o tenha
+_SQL_INDEXAR = (
+    f"INSERT INTO resultados ({', '.join(COLUNAS)}) VALUES ({', '.join('?' * len(COLUNAS))}) "
+    "ON CONFLICT (pasta) DO UPDATE SET "
+    + ", ".join(
+        f"{coluna} = COALESCE(excluded.{coluna}, {coluna})" if coluna == "job_id" else f"{coluna} = excluded.{coluna}"
+        for coluna in COLUNAS[1:]
+    )
+)
+
+
+def ler_resultados(pasta: Path) -> Iterator[tuple[Path, ResultadoFinal]]:
+    """Pastas de resultado e seus conteudo.json, ignorando arquivos ilegíveis"""
+    for caminho in sorted(pasta.glob("*/conteudo.json")):
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                yield caminho.parent, ResultadoFinal(**json.load(f))
+        except (OSError, json.JSONDecodeError, TypeError, ValidationError):
+            continue
+
+
+def _consulta_textual(busca: str) -> str:
+    """Termos da busca como prefixos entre aspas (a sintaxe do FTS5 não chega ao usuário)"""
+    return " ".join('"' + termo.replace('"', '""') + '"*' for termo in busca.split())
+
+
+class IndiceResultados:
+    """Tabela dos resultados (filtros e ordenação) e tabela FTS5 de nome, legenda e descrição
+
+    Usa o mesmo arquivo do RegistroJobs, cuja tabela jobs dá o status de cada geração.
+    """
+
+    def __init__(self, caminho: Path):
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            sem_custos = self._conexao.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'custos_resultados'"
+            ).fetchone() is None
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS resultados (
+                    id INTEGER PRIMARY KEY,
+                    pasta TEXT NOT NULL UNIQUE,
+                    id_conteudos TEXT NOT NULL,
+                    job_id TEXT,
+                    radical TEXT,
+                    tipo_material TEXT NOT NULL,
+                    llm_provider TEXT,
+                    nome_criativo TEXT NOT NULL,
+                    nota_conteudo REAL NOT NULL,
+                    iteracoes_realizadas INTEGER NOT NULL,
+                    qualidade_pendente INTEGER NOT NULL,
+                    custo_usd REAL,
+                    data_geracao TEXT NOT NULL,
+                    legenda TEXT NOT NULL,
+                    desc_hotmart TEXT NOT NULL
+                )
+            """)
+            for coluna in ("data_geracao", "radical", "tipo_material", "llm_provider", "nota_conteudo", "job_id"):
+                self._conexao.execute(f"CREATE INDEX IF NOT EXISTS resultados_{coluna} ON resultados ({coluna})")
+            # Conteúdo externo: o FTS guarda só o índice e é mantido pelos gatilhos
+            self._conexao.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS resultados_fts USING fts5(
+                    nome_criativo, legenda, desc_hotmart,
+                    content='resultados', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS resultados_ai AFTER INSERT ON resultados BEGIN
+                    INSERT INTO resultados_fts (rowid, nome_criativo, legenda, desc_hotmart)
+                    VALUES (new.id, new.nome_criativo, new.legenda, new.desc_hotmart);
+                END;
+                CREATE TRIGGER IF NOT EXISTS resultados_ad AFTER DELETE ON resultados BEGIN
+                    INSERT INTO resultados_fts (resultados_fts, rowid, nome_criativo, legenda, desc_hotmart)
+                    VALUES ('delete', old.id, old.nome_criativo, old.legenda, old.desc_hotmart);
+                END;
+                CREATE TRIGGER IF NOT EXISTS resultados_au AFTER UPDATE ON resultados BEGIN
+                    INSERT INTO resultados_fts (resultados_fts, rowid, nome_criativo, legenda, desc_hotmart)
+                    VALUES ('delete', old.id, old.nome_criativo, old.legenda, old.desc_hotmart);
+                    INSERT INTO resultados_fts (rowid, nome_criativo, legenda, desc_hotmart)
+                    VALUES (new.id, new.nome_criativo, new.legenda, new.desc_hotmart);
+                END;
+            """)
+            # Totais de cada provedor usado pela geração, para o relatório de custos (GET /custos)
+            self._conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS custos_resultados (
+                    resultado_id INTEGER NOT NULL,
+                    provedor TEXT NOT NULL,
+                    tokens_entrada INTEGER NOT NULL,
+                    tokens_saida INTEGER NOT NULL,
+                    imagens INTEGER NOT NULL,
+                    custo_usd REAL NOT NULL,
+                    PRIMARY KEY (resultado_id, provedor)
+                );
+                CREATE TRIGGER IF NOT EXISTS resultados_custos_ad AFTER DELETE ON resultados BEGIN
+                    DELETE FROM custos_resultados WHERE resultado_id = old.id;
+                END;
+            """)
+            if sem_custos and self._conexao.execute("SELECT 1 FROM resultados LIMIT 1").fetchone():
+                print("⚠️ Índice anterior aos custos por provedor: rode 'python historico.py reindexar' para preencher o relatório de custos")
+
+    def indexar(self, resultado: ResultadoFinal, output_dir: Path, job_id: Optional[str] = None):
+        """Insere ou atualiza o resultado da pasta (reindexar a mesma pasta não duplica)"""
+        self.indexar_varios([(resultado, output_dir, job_id)])
+
+    def indexar_varios(self, itens: Iterable[tuple[ResultadoFinal, Path, Optional[str]]]):
+        """Indexa vários resultados em uma única transação (backfill)"""
+        valores = [
+            (
+                output_dir.name, resultado.id_conteudos, job_id, resultado.radical, resultado.tipo_material,
+                resultado.llm_provider, resultado.nome_criativo, resultado.nota_conteudo,
+                resultado.iteracoes_realizadas, int(resultado.qualidade_pendente),
+                resultado.custo.custo_usd if resultado.custo else None, resultado.data_geracao,
+                resultado.legenda, resultado.desc_hotmart
+            )
+            for resultado, output_dir, job_id in itens
+        ]
+        custos = [
+            (output_dir.name, provedor, *totais)
+            for resultado, output_dir, _ in itens
+            for provedor, totais in _custos_por_provedor(resultado).items()
+        ]
+        with self._lock, self._conexao:
+            self._conexao.executemany(_SQL_INDEXAR, valores)
+            self._conexao.executemany(
+                "DELETE FROM custos_resultados WHERE resultado_id = (SELECT id FROM resultados WHERE pasta = ?)",
+                [(valor[0],) for valor in valores]
+            )
+            self._conexao.executemany(
+                "INSERT INTO custos_resultados (resultado_id, provedor, tokens_entrada, tokens_saida, imagens, custo_usd) "
+                "SELECT id, ?, ?, ?, ?, ? FROM resultados WHERE pasta = ?",
+                [(provedor, *totais, pasta) for pasta, provedor, *totais in custos]
+            )
+
+    def remover_ausentes(self, pastas: set[str]) -> int:
+        """Remove do índice as pastas que não existem mais; retorna quantas"""
+        with self._lock, self._conexao:
+            indexadas = {linha["pasta"] for linha in self._conexao.execute("SELECT pasta FROM resultados")}
+            ausentes = indexadas - pastas
+            self._conexao.executemany("DELETE FROM resultados WHERE pasta = ?", [(pasta,) for pasta in ausentes])
+        return len(ausentes)
+
+    def buscar(
+        self,
+        radical: Optional[str] = None,
+        tipo_material: Optional[str] = None,
+        llm_provider: Optional[str] = None,
+        nota_min: Optional[float] = None,
+        nota_max: Optional[float] = None,
+        de: Optional[str] = None,
+        ate: Optional[str] = None,
+        busca: Optional[str] = None,
+        status: Optional[str] = None,
+        pagina: int = 1,
+        por_pagina: int = 20
+    ) -> PaginaJobs:
+        """Página do histórico filtrado (datas AAAA-MM-DD, inclusivas; busca textual com prefixos)
+
+        Filtros de resultado (tipo, nota, busca) deixam de fora os jobs sem resultado salvo.
+        """
+        pagina = max(1, pagina)
+        por_pagina = min(max(1, por_pagina), MAX_POR_PAGINA)
+        condicoes: list[str] = []
+        parametros: list = []
+        for coluna, valor in (
+            ("radical", radical), ("tipo_material", tipo_material), ("llm_provider", llm_provider), ("status", status)
+        ):
+            if valor:
+                condicoes.append(f"h.{coluna} = ?")
+                parametros.append(valor)
+        if nota_min is not None:
+            condicoes.append("h.nota_conteudo >= ?")
+            parametros.append(nota_min)
+        if nota_max is not None:
+            condicoes.append("h.nota_conteudo <= ?")
+            parametros.append(nota_max)
+        if de:
+            condicoes.append("h.data_geracao >= ?")
+            parametros.append(de)
+        if ate:
+            condicoes.append("h.data_geracao <= ?")
+            parametros.append(f"{ate} 23:59:59")
+
+        with self._lock:
+            tem_jobs = self._conexao.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs'"
+            ).fetchone() is not None
+            juncao_jobs = "LEFT JOIN jobs j ON j.job_id = r.job_id" if tem_jobs else ""
+            status_resultado = "COALESCE(j.status, 'concluido')" if tem_jobs else "'concluido'"
+            erro_resultado = "j.erro" if tem_jobs else "NULL"
+            colunas = f"r.{', r.'.join(COLUNAS[:12])}, {status_resultado} AS status, {erro_resultado} AS erro"
+
+            consulta = _consulta_textual(busca) if busca else ""
+            parametros_fonte: list = []
+            if consulta:
+                # Trecho da coluna com o termo (legenda ou descrição), com o termo entre colchetes
+                fonte = (
+                    f"SELECT {colunas}, snippet(resultados_fts, -1, '[', ']', '…', 12) AS trecho, "
+                    f"bm25(resultados_fts) AS relevancia, r.id AS ordem "
+                    f"FROM resultados_fts JOIN resultados r ON r.id = resultados_fts.rowid {juncao_jobs} "
+                    f"WHERE resultados_fts MATCH ?"
+                )
+                parametros_fonte.append(consulta)
+                ordem = "h.relevancia, h.data_geracao DESC"
+            else:
+                fonte = f"SELECT {colunas}, NULL AS trecho, NULL AS relevancia, r.id AS ordem FROM resultados r {juncao_jobs}"
+                if tem_jobs:
+                    fonte += f" UNION ALL {_SQL_JOBS_SEM_RESULTADO}"
+                ordem = "h.data_geracao DESC, h.ordem DESC"
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+            total = self._conexao.execute(
+                f"SELECT COUNT(*) FROM ({fonte}) h {where}", [*parametros_fonte, *parametros]
+            ).fetchone()[0]
+            linhas = self._conexao.execute(
+                f"SELECT h.* FROM ({fonte}) h {where} ORDER BY {ordem} LIMIT ? OFFSET ?",
+                [*parametros_fonte, *parametros, por_pagina, (pagina - 1) * por_pagina]
+            ).fetchall()
+        return PaginaJobs(
+            total=total,
+            pagina=pagina,
+            por_pagina=por_pagina,
+            itens=[ResumoJob(**{chave: linha[chave] for chave in linha.keys() if chave in ResumoJob.model_fields}) for linha in linhas]
+        )
+
+    def custos(
+        self,
+        agrupar: str = "provedor",
+        de: Optional[str] = None,
+        ate: Optional[str] = None
+    ) -> list[dict]:
+        """Custos agregados por radical, provedor ou dia (datas no formato AAAA-MM-DD, inclusivas)
+
+        No agrupamento por provedor, cada job conta para todos os provedores que usou, com a
+        parte do custo de cada um; assim custo_por_aprovado compara os provedores entre si.
+        Resultados sem custo (anteriores à contabilização) contam só em sem_custo.
+        """
+        if agrupar not in AGRUPAMENTOS:
+            raise ValueError(f"agrupar deve ser um de: {', '.join(AGRUPAMENTOS)}")
+        if agrupar == "provedor":
+            # Uma linha por provedor usado; resultados sem custo ficam em 'desconhecido'
+            fonte = "resultados r LEFT JOIN custos_resultados c ON c.resultado_id = r.id"
+            condicoes = ["(r.custo_usd IS NULL OR c.provedor IS NOT NULL)"]
+        else:
+            fonte = f"resultados r LEFT JOIN ({_SQL_CUSTOS_POR_RESULTADO}) c ON c.resultado_id = r.id"
+            condicoes = []
+        parametros: list = []
+        if de:
+            condicoes.append("substr(r.data_geracao, 1, 10) >= ?")
+            parametros.append(de)
+        if ate:
+            condicoes.append("substr(r.data_geracao, 1, 10) <= ?")
+            parametros.append(ate)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+        with self._lock:
+            grupos = self._conexao.execute(f"""
+                SELECT {_CHAVES_CUSTOS[agrupar]} AS chave,
+                       SUM(r.custo_usd IS NOT NULL) AS jobs,
+                       SUM(r.custo_usd IS NOT NULL AND NOT r.qualidade_pendente) AS aprovados,
+                       SUM(CASE WHEN r.custo_usd IS NOT NULL THEN r.iteracoes_realizadas ELSE 0 END) AS iteracoes,
+                       COALESCE(SUM(c.tokens_entrada), 0) AS tokens_entrada,
+                       COALESCE(SUM(c.tokens_saida), 0) AS tokens_saida,
+                       COALESCE(SUM(c.imagens), 0) AS imagens,
+                       COALESCE(SUM(c.custo_usd), 0.0) AS custo_usd,
+                       SUM(r.custo_usd IS NULL) AS sem_custo
+                FROM {fonte} {where}
+                GROUP BY chave ORDER BY chave
+            """, parametros).fetchall()
+
+        linhas = []
+        for grupo in grupos:
+            jobs, aprovados, custo = grupo["jobs"], grupo["aprovados"], grupo["custo_usd"]
+            linhas.append({
+                agrupar: grupo["chave"],
+                **{chave: grupo[chave] for chave in grupo.keys() if chave != "chave"},
+                "custo_usd": round(custo, 4),
+                "custo_medio_usd": round(custo / jobs, 4) if jobs else None,
+                "custo_por_aprovado_usd": round(custo / aprovados, 4) if aprovados else None,
+                "iteracoes_media": round(grupo["iteracoes"] / jobs, 2) if jobs else None,
+            })
+        return linhas
+
+    def jobs_por_pasta(self) -> dict[str, tuple[str, Optional[str]]]:
+        """job_id e provedor de cada pasta de saída, do registro de jobs (se existir no banco)"""
+        with self._lock:
+            try:
+                linhas = self._conexao.execute(
+                    "SELECT job_id, config, output_dir FROM jobs WHERE output_dir IS NOT NULL"
+                ).fetchall()
+            except sqlite3.Error:
+                return {}
+        return {
+            Path(linha["output_dir"]).name: (linha["job_id"], json.loads(linha["config"]).get("llm_provider"))
+            for linha in linhas
+        }
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+
+def _custos_por_provedor(resultado: ResultadoFinal) -> dict[str, tuple[int, int, int, float]]:
+    """Tokens de entrada, de saída, imagens e custo de cada provedor usado pela geração"""
+    totais: dict[str, tuple[int, int, int, float]] = {}
+    for uso in resultado.custo.chamadas if resultado.custo else []:
+        entrada, saida, imagens, custo = totais.get(uso.provedor, (0, 0, 0, 0.0))
+        totais[uso.provedor] = (
+            entrada + uso.tokens_entrada, saida + uso.tokens_saida, imagens + uso.imagens, custo + (uso.custo_usd or 0.0)
+        )
+    return totais
+
+
+def reindexar(indice: IndiceResultados, pasta: Path) -> tuple[int, int]:
+    """Indexa todas as pastas de resultado e remove as que sumiram; retorna (indexadas, removidas)"""
+    jobs = indice.jobs_por_pasta()
+    indexadas = set()
+    lote = []
+    for output_dir, resultado in ler_resultados(pasta):
+        job_id, provedor = jobs.get(output_dir.name, (None, None))
+        if not resultado.llm_provider and provedor:
+            # Resultados antigos não guardavam o provedor
+            resultado.llm_provider = provedor
+        lote.append((resultado, output_dir, job_id))
+        indexadas.add(output_dir.name)
+        if len(lote) >= TAMANHO_LOTE_INDEXACAO:
+            indice.indexar_varios(lote)
+            lote = []
+    indice.indexar_varios(lote)
+    return len(indexadas), indice.remover_ausentes(indexadas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice do histórico de gerações (outputs/)")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    comando = subcomandos.add_parser("reindexar", help="Indexa as pastas existentes (backfill) e remove as apagadas")
+    comando.add_argument("--pasta", type=Path, default=Path("outputs"), help="Pasta dos resultados (padrão: outputs)")
+    args = parser.parse_args()
+
+    inicio = datetime.now()
+    indice = IndiceResultados(args.pasta / ".jobs.db")
+    try:
+        indexadas, removidas = reindexar(indice, args.pasta)
+    finally:
+        indice.fechar()
+    print(f"✅ {indexadas} resultados indexados, {removidas} removidos ({(datetime.now() - inicio).total_seconds():.1f}s)")
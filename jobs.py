@@ -0,0 +1,184 @@
+"""
+Camada de execução assíncrona dos jobs de geração
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+# Função assíncrona que entrega um evento (dict) a um cliente
+Publicador = Callable[[dict], Awaitable[None]]
+
+# Mensagem de Task.cancel() para cancelamento pedido pelo cliente (sem tolerância)
+CANCELAMENTO_SOLICITADO = "cancelamento solicitado"
+
+
+class JobExecutor:
+    """Pool de workers com limite de concorrência para rodar jobs fora do event loop"""
+
+    def __init__(self, max_jobs: int = 4):
+        self.max_jobs = max(1, max_jobs)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="job")
+        self._semaforo = asyncio.Semaphore(self.max_jobs)
+        self.ativos = 0
+        self.aguardando = 0
+
+    @property
+    def lotado(self) -> bool:
+        """Indica se todas as vagas de execução estão ocupadas"""
+        return self.ativos >= self.max_jobs
+
+    async def executar(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Executa uma função bloqueante em um worker, respeitando o limite de concorrência"""
+        self.aguardando += 1
+        try:
+            await self._semaforo.acquire()
+        finally:
+            self.aguardando -= 1
+
+        self.ativos += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # Contexto copiado (como em asyncio.to_thread): os spans do worker ficam sob o do job
+            contexto = contextvars.copy_context()
+            return await loop.run_in_executor(self._pool, functools.partial(contexto.run, fn, *args, **kwargs))
+        finally:
+            self.ativos -= 1
+            self._semaforo.release()
+
+    async def executar_com_eventos(
+        self,
+        fn: Callable[[Callable[[dict], None]], Any],
+        enviar: Callable[[dict], Awaitable[None]],
+        apos_cancelamento: Optional[Callable[[], None]] = None
+    ) -> Any:
+        """Executa fn(emitir) em um worker, repassando cada evento emitido assim que ocorre
+
+        Se a espera for cancelada, o worker segue até parar sozinho; apos_cancelamento é
+        chamada (no event loop) quando ele de fato termina.
+        """
+        loop = asyncio.get_running_loop()
+        fila: asyncio.Queue = asyncio.Queue()
+        fim = object()
+
+        def emitir(evento: dict):
+            # Chamado na thread do worker: agenda a entrega no event loop
+            loop.call_soon_threadsafe(fila.put_nowait, evento)
+
+        async def rodar():
+            try:
+                return await self.executar(fn, emitir)
+            finally:
+                fila.put_nowait(fim)
+
+        tarefa = asyncio.create_task(rodar())
+        try:
+            while True:
+                evento = await fila.get()
+                if evento is fim:
+                    break
+                await enviar(evento)
+        except asyncio.CancelledError:
+            # O worker não é interrompido à força: fn deve parar sozinha (cancelamento cooperativo)
+            tarefa.add_done_callback(lambda t: t.cancelled() or t.exception())
+            if apos_cancelamento:
+                tarefa.add_done_callback(lambda t: apos_cancelamento())
+            raise
+
+        return await tarefa
+
+    def encerrar(self):
+        """Encerra o pool, descartando jobs que ainda não começaram"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ExecucaoCompartilhada:
+    """Execução em andamento cujos eventos são repassados a todos os assinantes"""
+
+    def __init__(self, tolerancia_abandono: float = 0):
+        self.eventos: list[dict] = []
+        self.assinantes: list[Publicador] = []
+        self.tarefa: Optional[asyncio.Task] = None
+        # Segundos que uma execução sem assinantes aguarda uma reconexão antes de ser cancelada
+        self.tolerancia_abandono = tolerancia_abandono
+
+    async def publicar(self, evento: dict):
+        """Guarda o evento no histórico e o entrega a todos os assinantes"""
+        self.eventos.append(evento)
+        for enviar in list(self.assinantes):
+            try:
+                await enviar(evento)
+            except Exception:
+                # Cliente desconectado: a execução continua para os demais
+                if enviar in self.assinantes:
+                    self.assinantes.remove(enviar)
+
+    async def assinar(self, enviar: Publicador):
+        """Reenvia o histórico ao novo assinante e passa a incluí-lo nos próximos eventos"""
+        enviados = 0
+        while enviados < len(self.eventos):
+            await enviar(self.eventos[enviados])
+            enviados += 1
+        self.assinantes.append(enviar)
+
+    async def acompanhar(self, enviar: Publicador) -> Any:
+        """Assina e aguarda o resultado; se o último assinante sair (cancelado), a execução é cancelada"""
+        try:
+            await self.assinar(enviar)
+            return await asyncio.shield(self.tarefa)
+        except asyncio.CancelledError as e:
+            solicitado = CANCELAMENTO_SOLICITADO in e.args
+            self.sair(enviar, 0 if solicitado else self.tolerancia_abandono)
+            raise
+
+    def sair(self, enviar: Publicador, tolerancia: float = 0):
+        """Remove o assinante; sem nenhum restante, cancela a execução após a tolerância"""
+        if enviar in self.assinantes:
+            self.assinantes.remove(enviar)
+        if tolerancia > 0:
+            asyncio.get_running_loop().call_later(tolerancia, self._cancelar_se_abandonada)
+        else:
+            self._cancelar_se_abandonada()
+
+    def _cancelar_se_abandonada(self):
+        if not self.assinantes and self.tarefa and not self.tarefa.done():
+            self.tarefa.cancel()
+
+
+class SingleFlight:
+    """Agrupa pedidos idênticos simultâneos em uma única execução"""
+
+    def __init__(self, tolerancia_abandono: float = 0):
+        self._em_andamento: dict[str, ExecucaoCompartilhada] = {}
+        self.tolerancia_abandono = tolerancia_abandono
+
+    def em_andamento(self, chave: str) -> bool:
+        return chave in self._em_andamento
+
+    def execucao(self, chave: str) -> Optional[ExecucaoCompartilhada]:
+        """Execução em andamento da chave, para novos assinantes"""
+        return self._em_andamento.get(chave)
+
+    async def executar(
+        self,
+        chave: str,
+        fn: Callable[[Publicador], Awaitable[Any]],
+        enviar: Publicador
+    ) -> tuple[Any, bool]:
+        """Executa fn(publicar) ou acompanha a execução existente; retorna (resultado, compartilhado)"""
+        execucao = self._em_andamento.get(chave)
+        if execucao:
+            return await execucao.acompanhar(enviar), True
+
+        execucao = ExecucaoCompartilhada(self.tolerancia_abandono)
+        self._em_andamento[chave] = execucao
+
+        async def rodar():
+            try:
+                return await fn(execucao.publicar)
+            finally:
+                self._em_andamento.pop(chave, None)
+
+        execucao.tarefa = asyncio.create_task(rodar())
+        return await execucao.acompanhar(enviar), False
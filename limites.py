@@ -0,0 +1,281 @@
+"""
+Limites de uso compartilhados por provedor/modelo: concorrência, RPM/TPM (token bucket) e Retry-After
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+CONCORRENCIA_PADRAO = 8
+# Pausa aplicada a todos os pedidos da chave quando um 429 chega sem Retry-After
+PAUSA_429_PADRAO = 2.0
+# Intervalo máximo entre verificações do descarte de um pedido na fila
+INTERVALO_CANCELAMENTO = 0.5
+
+
+class EsperaCancelada(Exception):
+    """O pedido foi descartado (timeout, failover, hedge ou cancelamento) enquanto aguardava na fila"""
+
+
+def retry_after(erro: BaseException) -> Optional[float]:
+    """Segundos pedidos pelo provedor no cabeçalho Retry-After (ou retry-after-ms), se houver"""
+    headers = getattr(getattr(erro, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        valor = headers.get("retry-after")
+        if not valor:
+            return None
+        try:
+            return max(0.0, float(valor))
+        except ValueError:
+            # Formato de data HTTP
+            return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _status(erro: BaseException) -> Optional[int]:
+    return getattr(erro, "status_code", None) or getattr(getattr(erro, "response", None), "status_code", None)
+
+
+class LimiteProvedor:
+    """Fila justa (FIFO) com limite de concorrência e token buckets de requisições e tokens por minuto"""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, concorrencia: int = CONCORRENCIA_PADRAO):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concorrencia = max(1, concorrencia)
+        self._cond = threading.Condition()
+        self._fila: deque = deque()
+        self._em_uso = 0
+        self._saldo_requisicoes = float(rpm or 0)
+        self._saldo_tokens = float(tpm or 0)
+        self._atualizado = time.monotonic()
+        self._pausa_ate = 0.0
+
+    @property
+    def aguardando(self) -> int:
+        return len(self._fila)
+
+    def _repor(self, agora: float):
+        decorrido = agora - self._atualizado
+        self._atualizado = agora
+        if self.rpm:
+            self._saldo_requisicoes = min(self.rpm, self._saldo_requisicoes + decorrido * self.rpm / 60)
+        if self.tpm:
+            self._saldo_tokens = min(self.tpm, self._saldo_tokens + decorrido * self.tpm / 60)
+
+    def _espera(self, tokens: int, agora: float) -> Optional[float]:
+        """Segundos até haver saldo (0 = liberado), ou None se depende de outro pedido terminar"""
+        if self._em_uso >= self.concorrencia:
+            return None
+        espera = max(0.0, self._pausa_ate - agora)
+        if self.rpm and self._saldo_requisicoes < 1:
+            espera = max(espera, (1 - self._saldo_requisicoes) * 60 / self.rpm)
+        if self.tpm and self._saldo_tokens < tokens:
+            espera = max(espera, (tokens - self._saldo_tokens) * 60 / self.tpm)
+        return espera
+
+    def _tokens(self, tokens: int) -> int:
+        # Um pedido maior que o bucket inteiro reserva o bucket inteiro
+        return min(tokens, int(self.tpm)) if self.tpm else 0
+
+    def _tentar(self, vez: "_Vez", tokens: int) -> Optional[float]:
+        """Ocupa a vaga se for a vez do pedido e houver saldo (0), senão a espera; chamar com o lock"""
+        agora = time.monotonic()
+        self._repor(agora)
+        espera = self._espera(tokens, agora) if self._fila[0] is vez else None
+        if espera == 0:
+            self._em_uso += 1
+            if self.rpm:
+                self._saldo_requisicoes -= 1
+            self._saldo_tokens -= tokens
+        return espera
+
+    def _notificar(self):
+        """Acorda os pedidos em espera (threads e corrotinas); chamar com o lock"""
+        self._cond.notify_all()
+        for vez in self._fila:
+            vez.acordar()
+
+    def _sair_da_fila(self, vez: "_Vez"):
+        with self._cond:
+            self._fila.remove(vez)
+            self._notificar()
+
+    def adquirir(self, tokens: int = 0, cancelado: Optional[threading.Event] = None) -> int:
+        """Bloqueia até a vez do pedido na fila e haver saldo; retorna os tokens reservados
+
+        Se `cancelado` for sinalizado durante a espera, o pedido sai da fila sem consumir
+        saldo e EsperaCancelada é levantada.
+        """
+        tokens = self._tokens(tokens)
+        vez = _Vez()
+        with self._cond:
+            self._fila.append(vez)
+        try:
+            with self._cond:
+                while True:
+                    if cancelado is not None and cancelado.is_set():
+                        raise EsperaCancelada()
+                    espera = self._tentar(vez, tokens)
+                    if espera == 0:
+                        break
+                    if cancelado is not None:
+                        espera = min(espera if espera is not None else INTERVALO_CANCELAMENTO, INTERVALO_CANCELAMENTO)
+                    self._cond.wait(espera)
+        finally:
+            self._sair_da_fila(vez)
+        return tokens
+
+    async def adquirir_async(self, tokens: int = 0) -> int:
+        """Aguarda a vez na mesma fila sem ocupar threads do event loop; retorna os tokens reservados"""
+        tokens = self._tokens(tokens)
+        vez = _Vez(asyncio.get_running_loop())
+        with self._cond:
+            self._fila.append(vez)
+        try:
+            while True:
+                with self._cond:
+                    espera = self._tentar(vez, tokens)
+                    if espera == 0:
+                        return tokens
+                    vez.sinal.clear()
+                try:
+                    await asyncio.wait_for(vez.sinal.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._sair_da_fila(vez)
+
+    def liberar(self, reservados: int = 0, consumidos: Optional[int] = None, executada: bool = True):
+        """Devolve a vaga de concorrência e acerta o saldo com os tokens realmente consumidos
+
+        Sem `consumidos` (o provedor não informou o uso), a reserva fica como consumida; uma
+        chamada que não chegou a ser feita (`executada=False`) devolve a requisição e os tokens.
+        """
+        with self._cond:
+            self._em_uso -= 1
+            if not executada:
+                consumidos = 0
+                if self.rpm:
+                    self._saldo_requisicoes = min(self.rpm, self._saldo_requisicoes + 1)
+            if self.tpm and consumidos is not None:
+                self._saldo_tokens = min(self.tpm, self._saldo_tokens + reservados - consumidos)
+            self._notificar()
+
+    def pausar(self, segundos: float):
+        """Suspende novos pedidos (ex: Retry-After de um 429)"""
+        with self._cond:
+            self._pausa_ate = max(self._pausa_ate, time.monotonic() + segundos)
+            self._notificar()
+
+
+class _Vez:
+    """Lugar de um pedido na fila; os pedidos do event loop são acordados por um asyncio.Event"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.sinal = asyncio.Event() if loop else None
+
+    def acordar(self):
+        if self.loop:
+            try:
+                # Pode ser chamado de outra thread (liberação por uma chamada síncrona)
+                self.loop.call_soon_threadsafe(self.sinal.set)
+            except RuntimeError:
+                # Event loop já encerrado
+                pass
+
+
+class Reserva:
+    """Vaga obtida no limitador; quem chama informa os tokens consumidos ao final"""
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.consumidos: Optional[int] = None
+
+
+class Limitador:
+    """Limites por chave "provedor/modelo", configurados pela variável LIMITES_PROVEDORES (JSON)
+
+    Exemplo: {"anthropic": {"rpm": 50, "tpm": 80000}, "openai/gpt-image-1": {"rpm": 5, "concorrencia": 2}}
+    A chave exata tem prioridade sobre a do provedor; "padrao" vale para as demais.
+    """
+
+    def __init__(self, configuracao: Optional[dict[str, dict]] = None):
+        self._configuracao = configuracao
+        self._limites: dict[str, LimiteProvedor] = {}
+        self._lock = threading.Lock()
+
+    def _config(self, chave: str) -> dict:
+        if self._configuracao is None:
+            # Leitura tardia: o .env é carregado depois da importação dos módulos
+            try:
+                self._configuracao = json.loads(os.getenv("LIMITES_PROVEDORES") or "{}")
+            except json.JSONDecodeError:
+                self._configuracao = {}
+        provedor = chave.split("/", 1)[0]
+        return self._configuracao.get(chave) or self._configuracao.get(provedor) or self._configuracao.get("padrao") or {}
+
+    def limite(self, chave: str) -> LimiteProvedor:
+        with self._lock:
+            if chave not in self._limites:
+                config = self._config(chave)
+                self._limites[chave] = LimiteProvedor(
+                    rpm=config.get("rpm"),
+                    tpm=config.get("tpm"),
+                    concorrencia=config.get("concorrencia", CONCORRENCIA_PADRAO)
+                )
+            return self._limites[chave]
+
+    def _registrar_erro(self, limite: LimiteProvedor, erro: BaseException):
+        segundos = retry_after(erro)
+        if segundos is None and _status(erro) == 429:
+            segundos = PAUSA_429_PADRAO
+        if segundos:
+            limite.pausar(segundos)
+
+    @contextmanager
+    def reservar(self, chave: str, tokens: int = 0, cancelado: Optional[threading.Event] = None):
+        """Ocupa uma vaga da chave durante o bloco (uso em threads)
+
+        Com `cancelado` sinalizado antes da vaga, levanta EsperaCancelada sem gastar o saldo.
+        """
+        limite = self.limite(chave)
+        reserva = Reserva(limite.adquirir(tokens, cancelado))
+        if cancelado is not None and cancelado.is_set():
+            # Descartado no instante em que obteve a vaga: a chamada não será feita
+            limite.liberar(reserva.tokens, executada=False)
+            raise EsperaCancelada()
+        try:
+            yield reserva
+        except Exception as e:
+            self._registrar_erro(limite, e)
+            raise
+        finally:
+            limite.liberar(reserva.tokens, reserva.consumidos)
+
+    @asynccontextmanager
+    async def reservar_async(self, chave: str, tokens: int = 0):
+        """Ocupa uma vaga da chave durante o bloco (uso no event loop)"""
+        limite = self.limite(chave)
+        reserva = Reserva(await limite.adquirir_async(tokens))
+        try:
+            yield reserva
+        except Exception as e:
+            self._registrar_erro(limite, e)
+            raise
+        finally:
+            limite.liberar(reserva.tokens, reserva.consumidos)
+
+
+limitador = Limitador()
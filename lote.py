@@ -0,0 +1,253 @@
+"""
+Geração em lote: arquivo CSV/JSONL de configurações processado com paralelismo controlado
+
+Uso pela linha de comando:
+    python lote.py produtos.csv --paralelismo 3
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from pydantic import ValidationError
+
+from jobs import Publicador
+import telemetria
+from models import ConfigGerador, ItemLote, ManifestoLote, ResultadoFinal
+
+FORMATOS = ("csv", "jsonl")
+
+# Manifestos agregados (os conteúdos de cada item ficam nas pastas usuais de outputs/)
+PASTA_LOTES = Path("outputs/lotes")
+
+# Gera os conteúdos de uma configuração publicando o progresso (ex: app.gerar_conteudos)
+Gerador = Callable[[ConfigGerador, Publicador], Awaitable[Optional[ResultadoFinal]]]
+
+
+def formato_do_arquivo(caminho: str | Path) -> str:
+    """Formato do lote pela extensão do arquivo"""
+    formato = Path(caminho).suffix.lower().lstrip(".")
+    if formato == "ndjson":
+        formato = "jsonl"
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de lote não suportado: '{formato}' (use .csv ou .jsonl)")
+    return formato
+
+
+def _valor_csv(valor: str):
+    valor = valor.strip()
+    # Listas (ex: provedores_candidatos) vêm como JSON na célula
+    if valor[:1] in ("[", "{"):
+        try:
+            return json.loads(valor)
+        except json.JSONDecodeError:
+            pass
+    return valor
+
+
+def ler_lote(texto: str, formato: str) -> list[dict]:
+    """Linhas do lote como dicionários de ConfigGerador (células vazias ficam com o padrão)"""
+    texto = texto.lstrip("\ufeff")
+    if formato == "csv":
+        # Planilhas em português costumam exportar com ';'
+        try:
+            dialeto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialeto = csv.excel
+        leitor = csv.DictReader(io.StringIO(texto), dialect=dialeto)
+        return [
+            {campo.strip(): _valor_csv(valor) for campo, valor in linha.items() if campo and valor and valor.strip()}
+            for linha in leitor
+        ]
+
+    if formato == "jsonl":
+        linhas = []
+        for numero, linha in enumerate(texto.splitlines(), 1):
+            if not linha.strip():
+                continue
+            try:
+                dados = json.loads(linha)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Linha {numero} do lote inválida: {e}") from e
+            if not isinstance(dados, dict):
+                raise ValueError(f"Linha {numero} do lote: esperado um objeto JSON")
+            linhas.append(dados)
+        return linhas
+
+    raise ValueError(f"Formato de lote não suportado: '{formato}' (use {' ou '.join(FORMATOS)})")
+
+
+def salvar_manifesto(manifesto: ManifestoLote) -> Path:
+    PASTA_LOTES.mkdir(parents=True, exist_ok=True)
+    caminho = PASTA_LOTES / f"{manifesto.lote_id}.json"
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(manifesto.model_dump(), f, ensure_ascii=False, indent=2)
+    return caminho
+
+
+def carregar_manifesto(lote_id: str) -> Optional[ManifestoLote]:
+    if not re.fullmatch(r"[\w-]+", lote_id):
+        return None
+    caminho = PASTA_LOTES / f"{lote_id}.json"
+    if not caminho.exists():
+        return None
+    with open(caminho, "r", encoding="utf-8") as f:
+        return ManifestoLote(**json.load(f))
+
+
+async def executar_lote(
+    linhas: list[dict],
+    gerar: Gerador,
+    paralelismo: int = 2,
+    publicar: Optional[Publicador] = None
+) -> ManifestoLote:
+    """Gera cada linha com no máximo `paralelismo` itens simultâneos e salva o manifesto
+
+    Os limites por provedor (LIMITES_PROVEDORES) e de jobs do servidor continuam valendo
+    para os itens, compartilhados com as demais gerações em andamento.
+    """
+    manifesto = ManifestoLote(
+        lote_id=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}",
+        criado_em=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        paralelismo=max(1, paralelismo),
+        total=len(linhas),
+        itens=[
+            ItemLote(indice=i, radical=str(linha["radical"]) if linha.get("radical") is not None else None)
+            for i, linha in enumerate(linhas, 1)
+        ]
+    )
+    semaforo = asyncio.Semaphore(manifesto.paralelismo)
+
+    async def emitir(evento: dict):
+        if publicar:
+            await publicar({**evento, "lote_id": manifesto.lote_id})
+
+    async def progresso(item: Optional[ItemLote] = None):
+        await emitir({
+            "type": "lote",
+            "item": item.indice if item else None,
+            "radical": item.radical if item else None,
+            "status": item.status if item else "iniciado",
+            "concluidos": manifesto.concluidos,
+            "falhas": manifesto.falhas,
+            "total": manifesto.total
+        })
+
+    async def gerar_item(item: ItemLote, config: ConfigGerador):
+        async def publicar_item(evento: dict):
+            if evento["type"] == "job":
+                item.job_id = evento["job_id"]
+            elif evento["type"] == "resultado":
+                item.output_dir = evento["data"]["output_dir"]
+            elif evento["type"] == "error":
+                item.erro = evento["message"]
+            await emitir({**evento, "item": item.indice})
+
+        inicio = time.perf_counter()
+        try:
+            resultado = await gerar(config, publicar_item)
+        except Exception as e:
+            resultado = None
+            item.erro = str(e)
+        item.duracao_segundos = round(time.perf_counter() - inicio, 2)
+
+        if resultado:
+            item.status = "concluido"
+            item.nota_conteudo = resultado.nota_conteudo
+            item.iteracoes_realizadas = resultado.iteracoes_realizadas
+            item.qualidade_pendente = resultado.qualidade_pendente
+        else:
+            item.status = "erro"
+            item.erro = item.erro or "Geração sem resultado"
+
+    async def processar(item: ItemLote, linha: dict):
+        try:
+            try:
+                config = ConfigGerador(**linha)
+            except ValidationError as e:
+                item.status = "invalido"
+                item.erro = str(e)
+            else:
+                async with semaforo:
+                    await gerar_item(item, config)
+        except asyncio.CancelledError:
+            item.status = "cancelado"
+            raise
+
+        if item.status == "concluido":
+            manifesto.concluidos += 1
+        else:
+            manifesto.falhas += 1
+        await progresso(item)
+
+    await progresso()
+    try:
+        await asyncio.gather(*(processar(item, linha) for item, linha in zip(manifesto.itens, linhas)))
+    finally:
+        # Salvo também se o lote for interrompido, com o que já foi gerado
+        for item in manifesto.itens:
+            if item.status == "pendente":
+                item.status = "cancelado"
+        manifesto.concluido_em = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        salvar_manifesto(manifesto)
+    return manifesto
+
+
+async def _main(args: argparse.Namespace) -> int:
+    # Importado aqui: as variáveis definidas pelos argumentos valem na criação do servidor
+    import app
+
+    linhas = ler_lote(Path(args.arquivo).read_text(encoding="utf-8-sig"), args.formato or formato_do_arquivo(args.arquivo))
+    print(f"📦 {len(linhas)} itens, paralelismo {args.paralelismo}")
+
+    async def imprimir(evento: dict):
+        if evento["type"] == "lote" and evento["item"]:
+            processados = evento["concluidos"] + evento["falhas"]
+            print(f"[{processados}/{evento['total']}] #{evento['item']} {evento['radical']}: {evento['status']}")
+        elif evento["type"] == "error":
+            print(f"   #{evento['item']} {evento['message']}")
+        elif args.verbose and evento["type"] in ("log", "info", "success"):
+            print(f"   #{evento['item']} {evento['message']}")
+
+    async with app.clientes():
+        try:
+            manifesto = await executar_lote(linhas, app.gerar_conteudos, args.paralelismo, imprimir)
+        finally:
+            app.executor.encerrar()
+            app.registro.fechar()
+            app.indice.fechar()
+            telemetria.encerrar()
+
+    print(f"✅ {manifesto.concluidos} concluídos, ❌ {manifesto.falhas} com falha")
+    print(f"📄 Manifesto: {PASTA_LOTES / (manifesto.lote_id + '.json')}")
+    return 1 if manifesto.falhas else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera conteúdos para cada linha de um arquivo CSV/JSONL de configurações")
+    parser.add_argument("arquivo", help="Arquivo .csv ou .jsonl (colunas/campos de ConfigGerador)")
+    parser.add_argument("--formato", choices=FORMATOS, help="Formato do arquivo (padrão: pela extensão)")
+    parser.add_argument("--paralelismo", type=int, default=2, help="Itens gerados simultaneamente (padrão: 2)")
+    parser.add_argument("--limites", help="Limites por provedor em JSON (sobrepõe LIMITES_PROVEDORES)")
+    parser.add_argument("--verbose", action="store_true", help="Exibe os logs de cada item")
+    args = parser.parse_args()
+
+    # Antes de carregar o .env, que não sobrescreve variáveis já definidas
+    os.environ["MAX_JOBS_CONCORRENTES"] = str(max(1, args.paralelismo))
+    if args.limites:
+        os.environ["LIMITES_PROVEDORES"] = args.limites
+
+    try:
+        sys.exit(asyncio.run(_main(args)))
+    except KeyboardInterrupt:
+        print("\n⚠️ Lote interrompido (manifesto parcial salvo)")
+        sys.exit(130)
@@ -0,0 +1,297 @@
+"""
+Provedores simulados ("mock") de LLM e de imagem, para testes de carga e benchmarks sem API keys
+
+Configuração pela variável MOCK_PROVEDORES (JSON), por exemplo:
+    {"latencia": {"distribuicao": "lognormal", "media": 2.0, "desvio": 1.0},
+     "falhas": 0.05, "notas": [6.5, 7.5, 8.5], "semente": 42,
+     "modelos": {"mock-revisor": {"latencia": {"media": 0.5}}},
+     "imagem": {"latencia": {"distribuicao": "fixa", "media": 3.0}, "falhas": 0.0}}
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import BaseModel
+
+from models import AvaliacaoComparativa, AvaliacaoRevisor, CampoConteudo, ConteudoGerado
+
+# Partes em que a resposta é dividida no streaming
+PARTES_STREAM = 40
+# Fração da latência até o primeiro chunk no streaming
+FRACAO_PRIMEIRO_CHUNK = 0.2
+# Campos reprovados pelo revisor simulado (os demais, incluindo a marca do job, são mantidos)
+CAMPOS_REPROVADOS = ("artigo", "legenda")
+
+_TIPOS_MATERIAL = {
+    "anki": "Baralhos Anki",
+    "mapa": "Mapas Mentais",
+    "músic": "Músicas",
+    "music": "Músicas",
+    "podcast": "Podcasts",
+}
+
+
+class ErroProvedorMock(Exception):
+    """Falha simulada; o status 503 é tratado como transitório pela camada de resiliência"""
+    status_code = 503
+
+
+def _resumo(texto: str) -> bytes:
+    return hashlib.blake2b(texto.encode(), digest_size=16).digest()
+
+
+class ConfigMock:
+    """Parâmetros de latência, falhas e notas lidos (uma vez) de MOCK_PROVEDORES"""
+
+    def __init__(self, configuracao: Optional[dict] = None):
+        self._configuracao_inicial = configuracao
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Volta ao estado inicial: relê MOCK_PROVEDORES e zera os sorteios e as revisões
+
+        Chamado a cada execução (ex: pelo benchmark), para que os contadores não cresçam
+        nem se acumulem entre execuções.
+        """
+        with self._lock:
+            self._configuracao = self._configuracao_inicial
+            # Revisões já feitas por conteúdo (resumo da marca), para seguir a sequência de notas de cada job
+            self._revisoes: dict[bytes, int] = {}
+            # Sorteios já feitos por chave (resumo do prompt), para que repetir a mesma chamada não repita o sorteio
+            self._sorteios: dict[bytes, int] = {}
+
+    @property
+    def configuracao(self) -> dict:
+        if self._configuracao is None:
+            # Leitura tardia: o .env é carregado depois da importação dos módulos
+            try:
+                self._configuracao = json.loads(os.getenv("MOCK_PROVEDORES") or "{}")
+            except json.JSONDecodeError:
+                self._configuracao = {}
+        return self._configuracao
+
+    def _parametros(self, modelo: str) -> dict:
+        if modelo == "imagem":
+            return self.configuracao.get("imagem", {})
+        return {**self.configuracao, **self.configuracao.get("modelos", {}).get(modelo, {})}
+
+    def sorteador(self, chave: str) -> random.Random:
+        """Gerador próprio de uma chamada identificada pela chave (ex: modelo e prompt)
+
+        Com semente, os sorteios dependem só da semente, da chave e de quantas vezes ela já foi
+        sorteada, e não da ordem em que as chamadas concorrentes chegam.
+        """
+        semente = self.configuracao.get("semente")
+        if semente is None:
+            return random.Random()
+        # O prompt inteiro não fica guardado: só um resumo de tamanho fixo
+        resumo_chave = _resumo(chave)
+        with self._lock:
+            ocorrencia = self._sorteios.get(resumo_chave, 0)
+            self._sorteios[resumo_chave] = ocorrencia + 1
+        resumo = hashlib.sha256(f"{semente}:{ocorrencia}:".encode() + resumo_chave).digest()
+        return random.Random(int.from_bytes(resumo[:8], "big"))
+
+    def latencia(self, modelo: str, sorteio: random.Random) -> float:
+        """Segundos de uma chamada, amostrados da distribuição configurada"""
+        parametros = self._parametros(modelo).get("latencia", {})
+        distribuicao = parametros.get("distribuicao", "fixa")
+        media = float(parametros.get("media", 0.5 if modelo != "imagem" else 1.0))
+        desvio = float(parametros.get("desvio", 0))
+        if distribuicao == "normal":
+            valor = sorteio.gauss(media, desvio)
+        elif distribuicao == "lognormal" and media > 0:
+            # Parâmetros da normal subjacente a partir da média e do desvio desejados
+            sigma = math.sqrt(math.log(1 + (desvio / media) ** 2))
+            valor = sorteio.lognormvariate(math.log(media) - sigma ** 2 / 2, sigma)
+        elif distribuicao == "exponencial" and media > 0:
+            valor = sorteio.expovariate(1 / media)
+        elif distribuicao == "uniforme":
+            valor = sorteio.uniform(media - desvio, media + desvio)
+        else:
+            valor = media
+        return max(0.0, valor)
+
+    def falhou(self, modelo: str, sorteio: random.Random) -> bool:
+        taxa = float(self._parametros(modelo).get("falhas", 0))
+        return taxa > 0 and sorteio.random() < taxa
+
+    def proxima_nota(self, marca: str) -> float:
+        """Nota da próxima revisão do conteúdo identificado pela marca"""
+        notas = self.configuracao.get("notas") or [6.5, 8.5]
+        resumo_marca = _resumo(marca)
+        with self._lock:
+            revisao = self._revisoes.get(resumo_marca, 0)
+            self._revisoes[resumo_marca] = revisao + 1
+        return float(notas[min(revisao, len(notas) - 1)])
+
+
+config_mock = ConfigMock()
+
+
+def _campo_prompt(texto: str, rotulo: str) -> Optional[str]:
+    encontrado = re.search(rf"^{rotulo}:\s*(.+)$", texto, re.MULTILINE)
+    return encontrado.group(1).strip() if encontrado else None
+
+
+def _conteudo_mock(prompt: str, sorteio: random.Random) -> dict:
+    """Conteúdo válido (passa pelos validadores) derivado do radical e dos insumos do prompt"""
+    radical = _campo_prompt(prompt, "Radical") or "mock"
+    insumos = (_campo_prompt(prompt, "Insumos") or "").lower()
+    tipo = next((tipo for chave, tipo in _TIPOS_MATERIAL.items() if chave in insumos), "Baralhos Anki")
+    # Marca única do job: mantida no desc_pv, que o revisor simulado sempre aprova
+    marca = f"{sorteio.getrandbits(32):08x}"
+    paragrafos = "".join(
+        f"<p>Parágrafo {i} sobre {tipo} de {radical}: estude com método e <strong>conquiste a aprovação</strong>.</p>"
+        for i in range(1, 31)
+    )
+    return {
+        "tipo_material": tipo,
+        "desc_hotmart": f"{tipo} {radical}: material completo para acelerar sua aprovação. " * 8,
+        "artigo": f"<article><h1>{tipo} {radical}</h1><section>{paragrafos}</section></article>",
+        "legenda": f"📚 {tipo} para {radical}! Garanta já o seu, link na bio. #concursos #{radical}",
+        "nome_criativo": f"{tipo} {radical} Turbo",
+        "desc_pv": f"Aprovação com {tipo} ({radical}) #{marca}",
+        "extra": "Conteúdo extra simulado",
+    }
+
+
+def _marcas(prompt: str) -> list[str]:
+    """Marcas dos conteúdos no prompt do revisor (uma por candidato)"""
+    return re.findall(r"^Desc\. PV: .*#([0-9a-f]{8})\s*$", prompt, re.MULTILINE) or ["sem-marca"]
+
+
+def _avaliacao_mock(marca: str) -> dict:
+    nota = config_mock.proxima_nota(marca)
+    aprovado = nota >= 8
+    campos: tuple[CampoConteudo, ...] = ("tipo_material", "nome_criativo", "desc_hotmart", "legenda", "desc_pv", "artigo")
+    return {
+        "nota": nota,
+        "aprovado": aprovado,
+        "feedback": None if aprovado else "Feedback simulado: fortalecer a chamada para ação",
+        **{criterio: round(nota / 5, 2) for criterio in ("clareza", "persuasao", "criatividade", "adequacao", "conversao")},
+        "veredictos": [
+            {
+                "campo": campo,
+                "aprovado": aprovado or campo not in CAMPOS_REPROVADOS,
+                "feedback": None if aprovado or campo not in CAMPOS_REPROVADOS else f"Melhorar {campo}"
+            }
+            for campo in campos
+        ],
+    }
+
+
+def resposta_mock(schema: type[BaseModel], prompt: str, sorteio: random.Random) -> dict:
+    """Argumentos válidos para o schema pedido (conteúdo, avaliação, comparação ou campos parciais)"""
+    if schema is AvaliacaoRevisor:
+        return _avaliacao_mock(_marcas(prompt)[0])
+    if schema is AvaliacaoComparativa:
+        avaliacoes = [_avaliacao_mock(marca) for marca in _marcas(prompt)]
+        melhor = max(range(len(avaliacoes)), key=lambda i: avaliacoes[i]["nota"])
+        return {"avaliacoes": avaliacoes, "melhor": melhor}
+    # ConteudoGerado ou schema parcial com um subconjunto dos campos
+    conteudo = _conteudo_mock(prompt, sorteio)
+    return {campo: conteudo[campo] for campo in schema.model_fields if campo in conteudo}
+
+
+class ChatMock(BaseChatModel):
+    """Chat model simulado: responde por tool call com dados válidos do schema vinculado"""
+
+    modelo: str = "mock"
+    max_tokens: int = 4096
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.bind(esquemas=list(tools), **kwargs)
+
+    def _resposta(self, messages: list[BaseMessage], esquemas: Optional[list]) -> tuple[str, str, dict, float]:
+        """Nome da tool, argumentos, uso de tokens e latência da chamada (ou a falha simulada)"""
+        prompt = "\n".join(str(m.content) for m in messages)
+        schema = (esquemas or [ConteudoGerado])[0]
+        sorteio = config_mock.sorteador(f"{self.modelo}:{schema.__name__}:{prompt}")
+        if config_mock.falhou(self.modelo, sorteio):
+            # A falha chega, em média, na metade da latência normal
+            time.sleep(config_mock.latencia(self.modelo, sorteio) / 2)
+            raise ErroProvedorMock(f"Falha simulada em {self.modelo}")
+        args = json.dumps(resposta_mock(schema, prompt, sorteio), ensure_ascii=False)
+        uso = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(args) // 4,
+            "total_tokens": (len(prompt) + len(args)) // 4,
+        }
+        return schema.__name__, args, uso, config_mock.latencia(self.modelo, sorteio)
+
+    def _generate(self, messages, stop=None, run_manager=None, esquemas=None, **kwargs: Any) -> ChatResult:
+        nome, args, uso, latencia = self._resposta(messages, esquemas)
+        time.sleep(latencia)
+        mensagem = AIMessage(
+            content="",
+            tool_calls=[{"name": nome, "args": json.loads(args), "id": f"mock_{uuid.uuid4().hex[:8]}"}],
+            usage_metadata=uso
+        )
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def _stream(self, messages, stop=None, run_manager=None, esquemas=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        nome, args, uso, latencia = self._resposta(messages, esquemas)
+        time.sleep(latencia * FRACAO_PRIMEIRO_CHUNK)
+        tamanho = math.ceil(len(args) / PARTES_STREAM)
+        partes = [args[i:i + tamanho] for i in range(0, len(args), tamanho)]
+        for i, parte in enumerate(partes):
+            time.sleep(latencia * (1 - FRACAO_PRIMEIRO_CHUNK) / len(partes))
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[{
+                    "name": nome if i == 0 else None,
+                    "args": parte,
+                    "id": f"mock_{i}" if i == 0 else None,
+                    "index": 0
+                }],
+                usage_metadata=uso if i == len(partes) - 1 else None
+            ))
+
+
+def _png(largura: int, altura: int) -> bytes:
+    """PNG válido de cor sólida no tamanho pedido"""
+    def bloco(tipo: bytes, dados: bytes) -> bytes:
+        return struct.pack(">I", len(dados)) + tipo + dados + struct.pack(">I", zlib.crc32(tipo + dados))
+    linha = b"\x00" + bytes((99, 102, 241)) * largura
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + bloco(b"IHDR", struct.pack(">IIBBBBB", largura, altura, 8, 2, 0, 0, 0))
+        + bloco(b"IDAT", zlib.compress(linha * altura, 6))
+        + bloco(b"IEND", b"")
+    )
+
+
+async def simular_imagem(chave: str):
+    """Simula a chamada ao provedor de imagem (chave: prompt e tamanho): aguarda a latência configurada (ou falha)"""
+    sorteio = config_mock.sorteador(f"imagem:{chave}")
+    latencia = config_mock.latencia("imagem", sorteio)
+    if config_mock.falhou("imagem", sorteio):
+        await asyncio.sleep(latencia / 2)
+        raise ErroProvedorMock("Falha simulada na geração de imagem")
+    await asyncio.sleep(latencia)
+
+
+async def gravar_imagem_mock(tamanho: str, destino: Path):
+    """Grava um PNG de cor sólida no tamanho da imagem simulada"""
+    largura, altura = (int(valor) for valor in tamanho.split("x"))
+    destino.write_bytes(await asyncio.to_thread(_png, largura, altura))
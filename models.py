@@ -5,6 +5,10 @@ from pydantic import BaseModel, Field
 from typing import Optional, Literal
 from datetime import datetime
 
+# Provedores aceitos: valores fora da lista são rejeitados na validação (viram rótulos de métricas e chaves internas)
+ProvedorLLM = Literal["anthropic", "openai", "google", "deepseek", "grok", "qwen", "mock"]
+ProvedorImagem = Literal["openai", "google", "mock"]
+
 
 class ConteudoGerado(BaseModel):
     """Modelo para conteúdos gerados pelo agente criador"""
@@ -17,6 +21,16 @@ class ConteudoGerado(BaseModel):
     extra: Optional[str] = Field(default=None, description="Conteúdo extra customizável")
 
 
+CampoConteudo = Literal["tipo_material", "desc_hotmart", "artigo", "legenda", "nome_criativo", "desc_pv", "extra"]
+
+
+class VeredictoCampo(BaseModel):
+    """Veredicto do revisor para um campo específico do conteúdo"""
+    campo: CampoConteudo
+    aprovado: bool = Field(description="Se o campo pode ser mantido como está")
+    feedback: Optional[str] = Field(default=None, description="O que mudar neste campo, se reprovado")
+
+
 class AvaliacaoRevisor(BaseModel):
     """Modelo para avaliação do revisor"""
     nota: float = Field(ge=0, le=10, description="Nota de 0 a 10")
@@ -29,6 +43,15 @@ class AvaliacaoRevisor(BaseModel):
     criatividade: float = Field(default=0, ge=0, le=2, description="Pontos de criatividade")
     adequacao: float = Field(default=0, ge=0, le=2, description="Pontos de adequação ao público")
     conversao: float = Field(default=0, ge=0, le=2, description="Pontos de potencial de conversão")
+    
+    # Veredictos por campo (permitem refazer apenas o que foi reprovado)
+    veredictos: list[VeredictoCampo] = Field(default_factory=list, description="Veredicto de cada campo avaliado")
+
+
+class AvaliacaoComparativa(BaseModel):
+    """Avaliação conjunta de vários candidatos em uma única chamada ao revisor"""
+    avaliacoes: list[AvaliacaoRevisor] = Field(description="Avaliação de cada candidato, na ordem apresentada")
+    melhor: int = Field(ge=0, description="Índice (a partir de 0) do melhor candidato")
 
 
 class ConfigGerador(BaseModel):
@@ -36,8 +59,33 @@ class ConfigGerador(BaseModel):
     radical: str = Field(description="String alfanumérica (ex: dAdm, dConst)")
     insumos: str = Field(description="Texto base com informações do produto")
     max_iteracoes: int = Field(default=3, ge=1, le=10, description="Máximo de iterações")
-    llm_provider: str = Field(default="anthropic", description="Provedor de LLM para texto")
-    image_provider: str = Field(default="openai", description="Provedor para geração de imagens")
+    llm_provider: ProvedorLLM = Field(default="anthropic", description="Provedor de LLM para texto")
+    image_provider: ProvedorImagem = Field(default="openai", description="Provedor para geração de imagens")
+    stream_parcial: bool = Field(default=True, description="Envia os campos parciais enquanto são gerados")
+    imagens_especulativas: bool = Field(default=False, description="Inicia as imagens a partir do primeiro rascunho")
+    force_refresh: bool = Field(default=False, description="Ignora o cache e gera novamente")
+    candidatos: int = Field(default=1, ge=1, le=5, description="Rascunhos gerados em paralelo por rodada (best-of-N)")
+    provedores_candidatos: list[ProvedorLLM] = Field(default_factory=list, description="Provedores alternados entre os candidatos")
+    
+    # Resiliência das chamadas ao LLM
+    provedores_fallback: Optional[list[ProvedorLLM]] = Field(default=None, description="Ordem de failover (None: todos com API key; []: desativado)")
+    timeout_llm_segundos: float = Field(default=180, gt=0, description="Tempo máximo de cada chamada ao LLM")
+    tentativas_llm: int = Field(default=2, ge=0, le=5, description="Novas tentativas por provedor em erros transitórios")
+    hedge_llm: bool = Field(default=False, description="Dispara o próximo provedor se o atual passar do seu p95")
+    
+    # Parada antecipada: estagnação/regressão da nota e orçamento por job
+    min_melhora_nota: float = Field(default=0.3, ge=0, le=10, description="Melhora mínima da nota entre revisões para continuar")
+    tempo_maximo_segundos: Optional[float] = Field(default=None, gt=0, description="Orçamento de tempo do job")
+    max_tokens_job: Optional[int] = Field(default=None, gt=0, description="Orçamento de tokens do job (todas as chamadas)")
+    
+    # Modelo por papel: o revisor só devolve uma avaliação curta e pode usar um modelo rápido
+    modelo_criador: Optional[str] = Field(default=None, description="Modelo do criador (padrão: principal do provedor)")
+    max_tokens_criador: int = Field(default=16000, ge=256, description="Limite de tokens da resposta do criador")
+    temperatura_criador: float = Field(default=0.7, ge=0, le=2, description="Temperatura do criador")
+    revisor_provider: Optional[ProvedorLLM] = Field(default=None, description="Provedor do revisor (padrão: o mesmo do criador)")
+    modelo_revisor: Optional[str] = Field(default=None, description="Modelo do revisor (padrão: rápido do provedor)")
+    max_tokens_revisor: int = Field(default=2048, ge=256, description="Limite de tokens da resposta do revisor")
+    temperatura_revisor: float = Field(default=0.2, ge=0, le=2, description="Temperatura do revisor")
     
     # Checklist de conteúdos
     gerar_tipo_material: bool = Field(default=True)
@@ -52,10 +100,33 @@ class ConfigGerador(BaseModel):
     prompt_extra: Optional[str] = Field(default=None, description="Prompt para item extra")
 
 
+class UsoProvedor(BaseModel):
+    """Consumo de uma chamada ao LLM ou de uma geração de imagem"""
+    provedor: str
+    modelo: str
+    etapa: str = Field(default="", description="Nó do grafo (ex: criar_conteudo) ou 'imagem'")
+    tokens_entrada: int = 0
+    tokens_saida: int = 0
+    imagens: int = 0
+    custo_usd: Optional[float] = Field(default=None, description="None se o modelo não está na tabela de preços")
+
+
+class CustoGeracao(BaseModel):
+    """Tokens, imagens e custo de uma geração, com o detalhe de cada chamada"""
+    tokens_entrada: int = 0
+    tokens_saida: int = 0
+    imagens: int = 0
+    custo_usd: float = 0.0
+    sem_preco: list[str] = Field(default_factory=list, description="provedor/modelo usados sem preço na tabela (fora do total)")
+    chamadas: list[UsoProvedor] = Field(default_factory=list)
+
+
 class ResultadoFinal(BaseModel):
     """Modelo para o resultado final salvo em JSON"""
     data_geracao: str
     id_conteudos: str
+    radical: Optional[str] = None
+    llm_provider: Optional[str] = None
     tipo_material: str
     desc_hotmart: str
     artigo: str
@@ -68,3 +139,57 @@ class ResultadoFinal(BaseModel):
     nota_conteudo: float
     iteracoes_realizadas: int
     qualidade_pendente: bool = False
+    custo: Optional[CustoGeracao] = None
+
+
+class ItemLote(BaseModel):
+    """Situação de uma linha do arquivo de lote"""
+    indice: int = Field(description="Posição da linha no arquivo (a partir de 1)")
+    radical: Optional[str] = None
+    status: Literal["pendente", "concluido", "erro", "invalido", "cancelado"] = "pendente"
+    job_id: Optional[str] = None
+    output_dir: Optional[str] = None
+    nota_conteudo: Optional[float] = None
+    iteracoes_realizadas: Optional[int] = None
+    qualidade_pendente: Optional[bool] = None
+    erro: Optional[str] = None
+    duracao_segundos: Optional[float] = None
+
+
+class ManifestoLote(BaseModel):
+    """Manifesto agregado de uma geração em lote"""
+    lote_id: str
+    criado_em: str
+    concluido_em: Optional[str] = None
+    paralelismo: int
+    total: int
+    concluidos: int = 0
+    falhas: int = 0
+    itens: list[ItemLote] = Field(default_factory=list)
+
+
+class ResumoJob(BaseModel):
+    """Linha do histórico de gerações: o resultado salvo em outputs/ ou, sem ele, só o job"""
+    pasta: Optional[str] = Field(default=None, description="Pasta do resultado em outputs/ (None: sem resultado)")
+    id_conteudos: Optional[str] = None
+    job_id: Optional[str] = None
+    status: str = Field(default="concluido", description="Status do job (pendente, executando, concluido, erro, cancelado)")
+    erro: Optional[str] = None
+    radical: Optional[str] = None
+    tipo_material: Optional[str] = None
+    llm_provider: Optional[str] = None
+    nome_criativo: Optional[str] = None
+    nota_conteudo: Optional[float] = None
+    iteracoes_realizadas: Optional[int] = None
+    qualidade_pendente: Optional[bool] = None
+    custo_usd: Optional[float] = None
+    data_geracao: str = Field(description="Data da geração (ou da criação do job, se não há resultado)")
+    trecho: Optional[str] = Field(default=None, description="Trecho que casou com a busca textual")
+
+
+class PaginaJobs(BaseModel):
+    """Página do histórico, do mais recente para o mais antigo (ou por relevância na busca)"""
+    total: int
+    pagina: int
+    por_pagina: int
+    itens: list[ResumoJob]
@@ -0,0 +1,115 @@
+"""
+Persistência dos jobs e dos checkpoints do grafo em SQLite (sobrevivem a reinícios do servidor)
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from models import ConfigGerador
+
+# Modelos guardados no estado do grafo (liberados para desserialização dos checkpoints)
+MODELOS_CHECKPOINT = [
+    ("models", "ConfigGerador"),
+    ("models", "ConteudoGerado"),
+    ("models", "AvaliacaoRevisor"),
+    ("models", "VeredictoCampo"),
+]
+
+STATUS_ATIVOS = ("pendente", "executando")
+
+
+class RegistroJobs:
+    """Tabela de jobs (status, configuração, pasta de saída) e checkpointer LangGraph no mesmo arquivo"""
+
+    def __init__(self, caminho: Path):
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    chave TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    output_dir TEXT,
+                    erro TEXT,
+                    criado_em REAL NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )
+            """)
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+        # Checkpoint após cada nó: um job interrompido retoma do último nó concluído
+        self.checkpointer = SqliteSaver(
+            sqlite3.connect(caminho, check_same_thread=False),
+            serde=JsonPlusSerializer(allowed_msgpack_modules=MODELOS_CHECKPOINT)
+        )
+
+    def criar(self, job_id: str, chave: str, config: ConfigGerador):
+        agora = time.time()
+        with self._lock, self._conexao:
+            self._conexao.execute(
+                "INSERT INTO jobs (job_id, chave, config, status, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, chave, config.model_dump_json(), "pendente", agora, agora)
+            )
+
+    def atualizar(
+        self,
+        job_id: str,
+        status: str,
+        output_dir: Optional[str] = None,
+        erro: Optional[str] = None,
+        apagar_checkpoints: bool = True
+    ):
+        """Altera o status do job; ao encerrá-lo, apaga os checkpoints
+
+        Com o worker do grafo ainda rodando (cancelamento), passe apagar_checkpoints=False e
+        chame apagar_checkpoints quando ele terminar: a próxima gravação os recriaria.
+        """
+        with self._lock, self._conexao:
+            self._conexao.execute(
+                "UPDATE jobs SET status = ?, output_dir = COALESCE(?, output_dir), erro = ?, atualizado_em = ? "
+                "WHERE job_id = ?",
+                (status, output_dir, erro, time.time(), job_id)
+            )
+        if status not in STATUS_ATIVOS and apagar_checkpoints:
+            # Job encerrado: os checkpoints não serão mais necessários
+            self.apagar_checkpoints(job_id)
+
+    def apagar_checkpoints(self, job_id: str):
+        self.checkpointer.delete_thread(job_id)
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            linha = self._conexao.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(linha) if linha else None
+
+    def ativo_por_chave(self, chave: str) -> Optional[str]:
+        """Id do job ainda em andamento para a mesma configuração, se houver"""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT job_id FROM jobs WHERE chave = ? AND status IN (?, ?) ORDER BY criado_em DESC LIMIT 1",
+                (chave, *STATUS_ATIVOS)
+            ).fetchone()
+        return linha["job_id"] if linha else None
+
+    def interrompidos(self) -> list[dict]:
+        """Jobs que não terminaram (ex: servidor reiniciado no meio da execução)"""
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY criado_em", STATUS_ATIVOS
+            ).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+        self.checkpointer.conn.close()
@@ -0,0 +1,234 @@
+"""
+Chamadas resilientes a provedores: timeout, novas tentativas com backoff, failover e hedging
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, NamedTuple, Optional
+
+from limites import retry_after
+
+# Status HTTP que indicam falha passageira (vale tentar de novo no mesmo provedor)
+STATUS_TRANSITORIOS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+# Nomes de exceções de SDKs que indicam falha de rede/sobrecarga
+NOMES_TRANSITORIOS = ("Timeout", "Connection", "RateLimit", "Overloaded", "ServiceUnavailable", "InternalServer")
+
+# Intervalo máximo entre verificações do cancelamento do job
+INTERVALO_CANCELAMENTO = 0.5
+
+# Workers das chamadas (threads que estouram o timeout continuam até o timeout do próprio cliente,
+# pouco maior que o da tentativa)
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm")
+
+
+class Tentativa(threading.Event):
+    """Sinal de descarte de uma tentativa, que também marca quando a chamada de fato começou
+
+    O timeout e a latência contam a partir do início da tentativa em um worker, não da espera
+    por uma thread livre. A função da chamada ainda avisa que está na fila do limitador
+    (aguardar_vaga) e quando obteve a vaga (iniciar), e o prazo recomeça daí.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.inicio: Optional[float] = None
+
+    def aguardar_vaga(self):
+        self.inicio = None
+
+    def iniciar(self):
+        self.inicio = time.monotonic()
+
+
+class Chamada(NamedTuple):
+    """Uma opção da cadeia de failover: nome (para logs/latência) e a função que faz a chamada"""
+    nome: str
+    fn: Callable[[Tentativa], Any]
+
+
+class FalhaProvedores(Exception):
+    """Todas as opções da cadeia falharam"""
+
+    def __init__(self, erros: list[str]):
+        self.erros = erros
+        super().__init__("Todos os provedores falharam: " + " | ".join(erros[-4:]))
+
+
+class Cancelado(Exception):
+    """O job foi cancelado (cliente desconectou ou abortou)"""
+
+
+class HistoricoLatencia:
+    """Janela das últimas latências de cada chave, para estimar o p95"""
+
+    def __init__(self, janela: int = 50, minimo_amostras: int = 5):
+        self.minimo_amostras = minimo_amostras
+        self._amostras: dict[str, deque] = defaultdict(lambda: deque(maxlen=janela))
+        self._lock = threading.Lock()
+
+    def registrar(self, chave: str, segundos: float):
+        with self._lock:
+            self._amostras[chave].append(segundos)
+
+    def p95(self, chave: str) -> Optional[float]:
+        """p95 das amostras recentes, ou None enquanto houver poucas"""
+        with self._lock:
+            amostras = sorted(self._amostras.get(chave, ()))
+        if len(amostras) < self.minimo_amostras:
+            return None
+        return amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))]
+
+
+historico_latencia = HistoricoLatencia()
+
+
+def erro_transitorio(erro: BaseException) -> bool:
+    """Indica se o erro é passageiro (timeout, rede, 429, 5xx)"""
+    if isinstance(erro, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(erro, "status_code", None) or getattr(getattr(erro, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in STATUS_TRANSITORIOS
+    return any(nome in type(erro).__name__ for nome in NOMES_TRANSITORIOS)
+
+
+def espera_backoff(tentativa: int, base: float = 1.0, maximo: float = 20.0) -> float:
+    """Backoff exponencial com jitter completo (evita que os jobs tentem de novo em sincronia)"""
+    return random.uniform(0, min(maximo, base * 2 ** tentativa))
+
+
+def _executar(fn: Callable[[Tentativa], Any], tentativa: Tentativa) -> Any:
+    """Roda a tentativa no worker, com o prazo contando a partir daqui"""
+    if tentativa.is_set():
+        # Descartada enquanto esperava uma thread livre
+        raise Cancelado()
+    tentativa.iniciar()
+    return fn(tentativa)
+
+
+def _resumo(erro: BaseException) -> str:
+    return f"{type(erro).__name__}: {str(erro)[:150]}"
+
+
+def executar_com_failover(
+    chamadas: list[Chamada],
+    timeout: float,
+    tentativas: int = 2,
+    hedge: bool = False,
+    categoria: str = "",
+    avisar: Callable[[str], None] = lambda mensagem: None,
+    cancelado: Optional[threading.Event] = None
+) -> tuple[int, Any]:
+    """Executa a primeira opção que responder com sucesso; retorna (índice da opção, resultado)
+
+    Cada opção recebe até `tentativas` novas tentativas em erros transitórios antes de passar
+    à seguinte. Com `hedge`, a próxima opção é disparada em paralelo quando a atual passa do
+    seu p95 histórico; vale a resposta que chegar primeiro. Quando `cancelado` é sinalizado,
+    as chamadas em andamento são descartadas e `Cancelado` é levantada.
+    """
+    erros: list[str] = []
+    pendentes: dict[Future, tuple[int, Tentativa]] = {}
+    agendadas: list[tuple[float, int]] = []  # (quando, índice) de novas tentativas
+    feitas = [0] * len(chamadas)
+    proxima = 0
+    hedge_disparado = False
+
+    def chave(indice: int) -> str:
+        return f"{categoria}:{chamadas[indice].nome}"
+
+    def lancar(indice: int):
+        feitas[indice] += 1
+        tentativa = Tentativa()
+        # Contexto copiado: os spans da chamada ficam sob o span de quem a disparou
+        futuro = _pool.submit(contextvars.copy_context().run, _executar, chamadas[indice].fn, tentativa)
+        pendentes[futuro] = (indice, tentativa)
+
+    def lancar_proxima(motivo: str) -> bool:
+        nonlocal proxima
+        if proxima >= len(chamadas):
+            return False
+        if proxima > 0:
+            avisar(f"{motivo}; usando {chamadas[proxima].nome}")
+        lancar(proxima)
+        proxima += 1
+        return True
+
+    def tratar_falha(indice: int, erro: BaseException):
+        nome = chamadas[indice].nome
+        erros.append(f"{nome}: {_resumo(erro)}")
+        if erro_transitorio(erro) and feitas[indice] <= tentativas:
+            # Respeitar o Retry-After do provedor quando for maior que o backoff
+            espera = max(espera_backoff(feitas[indice]), retry_after(erro) or 0)
+            avisar(f"{nome} falhou ({_resumo(erro)}); nova tentativa em {espera:.1f}s")
+            agendadas.append((time.monotonic() + espera, indice))
+        elif not pendentes and not agendadas:
+            lancar_proxima(f"{nome} falhou ({_resumo(erro)})")
+
+    lancar_proxima("")
+    while pendentes or agendadas:
+        if cancelado is not None and cancelado.is_set():
+            for _, tentativa in pendentes.values():
+                tentativa.set()
+            raise Cancelado()
+        
+        agora = time.monotonic()
+        # Tentativas à espera de uma thread ou na fila do limitador ainda não têm prazo
+        inicios = [tentativa.inicio for _, tentativa in pendentes.values()]
+        prazos = [inicio + timeout for inicio in inicios if inicio is not None] + [quando for quando, _ in agendadas]
+
+        # Hedge: só enquanto houver uma única chamada em andamento e ainda restarem opções
+        limite_hedge = None
+        if hedge and not hedge_disparado and len(pendentes) == 1 and not agendadas and proxima < len(chamadas):
+            indice, tentativa = next(iter(pendentes.values()))
+            p95 = historico_latencia.p95(chave(indice))
+            inicio = tentativa.inicio
+            if p95 is not None and inicio is not None and agora < inicio + timeout:
+                limite_hedge = inicio + p95
+                prazos.append(limite_hedge)
+
+        espera = max(0.0, min(prazos) - agora) if prazos else None
+        if cancelado is not None or espera is None:
+            # Sem prazo, a espera é refeita para notar quando a chamada sair da fila
+            espera = min(espera if espera is not None else INTERVALO_CANCELAMENTO, INTERVALO_CANCELAMENTO)
+        if pendentes:
+            prontos, _ = wait(list(pendentes), timeout=espera, return_when=FIRST_COMPLETED)
+        else:
+            # Só há novas tentativas agendadas: aguardar o backoff
+            prontos = set()
+            time.sleep(espera)
+        agora = time.monotonic()
+
+        for futuro in prontos:
+            indice, tentativa = pendentes.pop(futuro)
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                tratar_falha(indice, e)
+                continue
+            if tentativa.inicio is not None:
+                historico_latencia.registrar(chave(indice), agora - tentativa.inicio)
+            # Descartar as demais chamadas (as da fila saem dela; as que fazem streaming param no próximo chunk)
+            for _, pendente in pendentes.values():
+                pendente.set()
+            return indice, resultado
+
+        for futuro, (indice, tentativa) in list(pendentes.items()):
+            inicio = tentativa.inicio
+            if inicio is not None and agora >= inicio + timeout:
+                del pendentes[futuro]
+                tentativa.set()
+                tratar_falha(indice, TimeoutError(f"sem resposta em {timeout:g}s"))
+
+        for agendada in [a for a in agendadas if a[0] <= agora]:
+            agendadas.remove(agendada)
+            lancar(agendada[1])
+
+        if limite_hedge is not None and agora >= limite_hedge and pendentes:
+            hedge_disparado = True
+            indice = next(iter(pendentes.values()))[0]
+            lancar_proxima(f"{chamadas[indice].nome} passou do p95 ({p95:.1f}s), disparando em paralelo")
+
+    raise FalhaProvedores(erros)
@@ -5,9 +5,12 @@ let outputDir = null;
 
 // Elementos do DOM
 const btnGerar = document.getElementById('btn-gerar');
+const btnCancelar = document.getElementById('btn-cancelar');
 const logsContainer = document.getElementById('logs-container');
 const logsDiv = document.getElementById('logs');
 const resultsContainer = document.getElementById('results-container');
+const partialContainer = document.getElementById('partial-container');
+const partialFields = document.getElementById('partial-fields');
 const statusIndicator = document.getElementById('status');
 const checkExtra = document.getElementById('check-extra');
 const extraField = document.getElementById('extra-field');
@@ -21,6 +24,7 @@ document.addEventListener('DOMContentLoaded', () => {
 function initializeEventListeners() {
     // Botão gerar
     btnGerar.addEventListener('click', iniciarGeracao);
+    btnCancelar.addEventListener('click', cancelarGeracao);
     
     // Checkbox extra
     checkExtra.addEventListener('change', (e) => {
@@ -46,6 +50,7 @@ function initializeWebSocket() {
     ws.onopen = () => {
         console.log('WebSocket conectado');
         updateStatus('Pronto', 'success');
+        reconectarJob();
     };
     
     ws.onmessage = (event) => {
@@ -65,6 +70,23 @@ function initializeWebSocket() {
     };
 }
 
+// Volta a acompanhar o job em andamento (ex: após recarregar a página ou queda da conexão)
+function reconectarJob() {
+    const jobId = localStorage.getItem('jobAtual');
+    if (!jobId) return;
+    
+    // O servidor reenvia todos os eventos desde o início do job
+    limparLogs();
+    esconderParciais();
+    esconderResultados();
+    logsContainer.style.display = 'block';
+    btnGerar.disabled = true;
+    btnGerar.textContent = '⏳ Gerando...';
+    btnCancelar.style.display = 'inline-block';
+    updateStatus('Processando', 'processing');
+    ws.send(JSON.stringify({ action: 'reconectar', job_id: jobId }));
+}
+
 function handleWebSocketMessage(data) {
     try {
         const message = JSON.parse(data);
@@ -79,18 +101,45 @@ function handleWebSocketMessage(data) {
             case 'success':
                 addLog(message.message, 'success');
                 break;
+            case 'node':
+                addLog(formatarEventoNo(message), 'info');
+                break;
+            case 'partial':
+                atualizarParcial(message);
+                break;
+            case 'job':
+                localStorage.setItem('jobAtual', message.job_id);
+                break;
+            case 'score':
+                addLog(`📊 Nota da iteração ${message.iteracao}: ${message.nota.toFixed(1)}/10`, message.aprovado ? 'success' : 'log');
+                break;
             case 'error':
                 addLog(message.message, 'error');
-                // ADICIONAR ESTAS LINHAS:
+                // Erros sem "terminal" (ex: uma imagem que falhou) não encerram o job, que segue em andamento
+                if (!message.terminal) break;
+                localStorage.removeItem('jobAtual');
                 btnGerar.disabled = false;
                 btnGerar.textContent = '🎯 Gerar Conteúdos';
+                btnCancelar.style.display = 'none';
                 updateStatus('Erro', 'error');
                 break;
+            case 'cancelado':
+                esconderParciais();
+                addLog(message.message, 'error');
+                localStorage.removeItem('jobAtual');
+                btnGerar.disabled = false;
+                btnGerar.textContent = '🎯 Gerar Conteúdos';
+                btnCancelar.style.display = 'none';
+                updateStatus('Cancelado', 'error');
+                break;
             case 'resultado':
+                esconderParciais();
                 exibirResultados(message.data);
+                localStorage.removeItem('jobAtual');
                 // ADICIONAR ESTAS LINHAS:
                 btnGerar.disabled = false;
                 btnGerar.textContent = '🎯 Gerar Conteúdos';
+                btnCancelar.style.display = 'none';
                 updateStatus('Pronto', 'success');
                 break;
         }
@@ -99,6 +148,21 @@ function handleWebSocketMessage(data) {
     }
 }
 
+const NOMES_NOS = {
+    criar_conteudo: '✍️ Criador',
+    validar_conteudo: '🧪 Validação automática',
+    revisar_conteudo: '🔍 Revisor',
+    finalizar: '🏁 Finalização'
+};
+
+function formatarEventoNo(message) {
+    const nome = NOMES_NOS[message.node] || message.node;
+    if (message.status === 'inicio') {
+        return `${nome} iniciado`;
+    }
+    return `${nome} concluído em ${message.duracao}s`;
+}
+
 function iniciarGeracao() {
     // Validar campos obrigatórios
     const radical = document.getElementById('radical').value.trim();
@@ -114,7 +178,9 @@ function iniciarGeracao() {
         radical,
         insumos,
         max_iteracoes: parseInt(document.getElementById('max-iteracoes').value),
+        candidatos: parseInt(document.getElementById('candidatos').value) || 1,
         llm_provider: document.getElementById('llm-provider').value,
+        revisor_provider: document.getElementById('revisor-provider').value || null,
         image_provider: document.getElementById('image-provider').value,
         gerar_tipo_material: document.getElementById('check-tipo').checked,
         gerar_desc_hotmart: document.getElementById('check-desc-hotmart').checked,
@@ -125,17 +191,22 @@ function iniciarGeracao() {
         gerar_nome_criativo: document.getElementById('check-nome').checked,
         gerar_desc_pv: document.getElementById('check-desc-pv').checked,
         gerar_extra: document.getElementById('check-extra').checked,
+        stream_parcial: document.getElementById('check-stream-parcial').checked,
+        imagens_especulativas: document.getElementById('check-imagens-especulativas').checked,
+        force_refresh: document.getElementById('check-force-refresh').checked,
         prompt_extra: document.getElementById('prompt-extra').value || null
     };
     
     // Resetar interface
     limparLogs();
+    esconderParciais();
     esconderResultados();
     logsContainer.style.display = 'block';
     
     // Desabilitar botão
     btnGerar.disabled = true;
     btnGerar.textContent = '⏳ Gerando...';
+    btnCancelar.style.display = 'inline-block';
     updateStatus('Processando', 'processing');
     
     // Enviar via WebSocket
@@ -147,10 +218,18 @@ function iniciarGeracao() {
         alert('Conexão WebSocket não está disponível. Tente recarregar a página.');
         btnGerar.disabled = false;
         btnGerar.textContent = '🎯 Gerar Conteúdos';
+        btnCancelar.style.display = 'none';
         updateStatus('Erro', 'error');
     }
 }
 
+// Aborta a geração em andamento (o servidor para o grafo e as imagens)
+function cancelarGeracao() {
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ action: 'cancelar' }));
+    }
+}
+
 function addLog(message, type = 'log') {
     const logEntry = document.createElement('div');
     logEntry.className = `log-entry ${type}`;
@@ -161,6 +240,58 @@ function addLog(message, type = 'log') {
     logsDiv.scrollTop = logsDiv.scrollHeight;
 }
 
+const NOMES_CAMPOS = {
+    tipo_material: 'Tipo de Material',
+    nome_criativo: 'Nome Criativo',
+    desc_pv: 'Desc. Página de Vendas',
+    desc_hotmart: 'Desc. Hotmart',
+    legenda: 'Legenda Instagram',
+    artigo: 'Artigo (HTML)',
+    extra: 'Extra'
+};
+
+function atualizarParcial(message) {
+    partialContainer.style.display = 'block';
+    
+    // Nova geração: descartar os textos parciais anteriores dos campos que serão refeitos
+    if (message.reset) {
+        if (!message.campos) {
+            partialFields.innerHTML = '';
+            return;
+        }
+        message.campos.forEach(campo => {
+            const pre = document.getElementById(`partial-${campo}`);
+            if (pre) pre.parentElement.remove();
+        });
+        return;
+    }
+    
+    let pre = document.getElementById(`partial-${message.campo}`);
+    if (!pre) {
+        const div = document.createElement('div');
+        div.className = 'partial-field';
+        const h4 = document.createElement('h4');
+        h4.textContent = NOMES_CAMPOS[message.campo] || message.campo;
+        pre = document.createElement('pre');
+        pre.id = `partial-${message.campo}`;
+        div.appendChild(h4);
+        div.appendChild(pre);
+        partialFields.appendChild(div);
+    }
+    
+    if (message.delta !== undefined) {
+        pre.textContent += message.delta;
+    } else {
+        pre.textContent = message.valor;
+    }
+    pre.scrollTop = pre.scrollHeight;
+}
+
+function esconderParciais() {
+    partialContainer.style.display = 'none';
+    partialFields.innerHTML = '';
+}
+
 function limparLogs() {
     logsDiv.innerHTML = '';
 }
@@ -200,6 +331,11 @@ function exibirResultados(data) {
     const iterBadge = document.getElementById('result-iteracoes');
     iterBadge.textContent = `${data.iteracoes_realizadas} iterações`;
     
+    // Custo estimado (ausente em resultados anteriores à contabilização)
+    const custoBadge = document.getElementById('result-custo');
+    custoBadge.textContent = data.custo ? `US$ ${data.custo.custo_usd.toFixed(4)}` : '';
+    custoBadge.style.display = data.custo ? '' : 'none';
+    
     // Preview
     document.getElementById('preview-nome').textContent = data.nome_criativo;
     document.getElementById('preview-desc-pv').textContent = data.desc_pv;
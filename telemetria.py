@@ -0,0 +1,270 @@
+"""
+Telemetria dos jobs: spans das etapas (nós do grafo, chamadas ao LLM, imagens e gravação de arquivos)
+agregados em histogramas no formato texto do Prometheus (GET /metrics)
+
+Com OTEL_EXPORTER_OTLP_ENDPOINT definida (ex: http://localhost:4318) e o SDK do OpenTelemetry
+instalado, os spans também são exportados via OTLP/HTTP para um coletor.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from resiliencia import Cancelado
+
+# Limites (segundos) dos buckets de duração: de chamadas rápidas a jobs inteiros
+BUCKETS_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+BUCKETS_TOKENS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+BUCKETS_TENTATIVAS = (1, 2, 3, 4, 6, 8)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(rotulos: dict) -> str:
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos.items()) + "}"
+
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if valor != float("inf") else "+Inf"
+
+
+class Histograma:
+    """Histograma com rótulos fixos; cada combinação de valores tem seus próprios buckets"""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, descricao: str, rotulos: tuple[str, ...], buckets: tuple[float, ...] = BUCKETS_SEGUNDOS):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.buckets = tuple(sorted(buckets))
+        # valores dos rótulos -> (contagem por bucket, soma, total)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **rotulos):
+        chave = tuple(str(rotulos.get(nome, "")) for nome in self.rotulos)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.setdefault(chave, [[0] * len(self.buckets), 0.0, 0])
+            if indice < len(self.buckets):
+                serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def linhas(self) -> list[str]:
+        with self._lock:
+            series = {chave: (list(contagens), soma, total) for chave, (contagens, soma, total) in self._series.items()}
+        linhas = []
+        for chave, (contagens, soma, total) in sorted(series.items()):
+            rotulos = dict(zip(self.rotulos, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos({**rotulos, 'le': _numero(limite)})} {acumulado}")
+            linhas.append(f"{self.nome}_bucket{_formatar_rotulos({**rotulos, 'le': '+Inf'})} {total}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(rotulos)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(rotulos)} {total}")
+        return linhas
+
+
+class Contador:
+    """Contador monotônico com rótulos fixos"""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, descricao: str, rotulos: tuple[str, ...] = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self._valores: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor: float = 1, **rotulos):
+        chave = tuple(str(rotulos.get(nome, "")) for nome in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def linhas(self) -> list[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return [
+            f"{self.nome}{_formatar_rotulos(dict(zip(self.rotulos, chave)))} {_numero(valor)}"
+            for chave, valor in sorted(valores.items())
+        ]
+
+
+class Medidor:
+    """Valor instantâneo lido na hora da coleta (ex: jobs em execução)"""
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, descricao: str, ler: Callable[[], float]):
+        self.nome = nome
+        self.descricao = descricao
+        self.ler = ler
+
+    def linhas(self) -> list[str]:
+        try:
+            return [f"{self.nome} {_numero(self.ler())}"]
+        except Exception:
+            return []
+
+
+class Metricas:
+    """Registro das métricas do processo"""
+
+    def __init__(self):
+        self._metricas: dict[str, Histograma | Contador | Medidor] = {}
+
+    def registrar(self, metrica):
+        self._metricas[metrica.nome] = metrica
+        return metrica
+
+    def texto(self) -> str:
+        """Todas as métricas no formato de exposição texto do Prometheus (0.0.4)"""
+        linhas = []
+        for metrica in self._metricas.values():
+            linhas.append(f"# HELP {metrica.nome} {metrica.descricao}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.linhas())
+        return "\n".join(linhas) + "\n"
+
+
+metricas = Metricas()
+
+# Duração de cada tipo de span; os rótulos são lidos dos atributos do span
+DURACAO_SPANS = {
+    "job": metricas.registrar(Histograma(
+        "dra_job_duracao_segundos", "Duração dos jobs de geração, do início ao resultado", ("status",)
+    )),
+    "no": metricas.registrar(Histograma(
+        "dra_no_duracao_segundos", "Duração de cada nó do grafo de agentes", ("no", "status")
+    )),
+    "llm": metricas.registrar(Histograma(
+        "dra_llm_duracao_segundos", "Chamada ao LLM incluindo novas tentativas, failover e hedge", ("categoria", "provedor", "status")
+    )),
+    "llm.tentativa": metricas.registrar(Histograma(
+        "dra_llm_tentativa_duracao_segundos", "Cada tentativa de chamada a um provedor de LLM", ("provedor", "modelo", "status")
+    )),
+    "imagem": metricas.registrar(Histograma(
+        "dra_imagem_duracao_segundos", "Geração de uma imagem, incluindo a gravação do arquivo", ("provedor", "tamanho", "status")
+    )),
+    "arquivo": metricas.registrar(Histograma(
+        "dra_arquivo_duracao_segundos", "Gravação e movimentação dos arquivos do resultado", ("arquivo", "status")
+    )),
+}
+ESPERA_LIMITE = metricas.registrar(Histograma(
+    "dra_llm_espera_limite_segundos", "Espera por vaga no limitador do provedor antes da chamada", ("provedor", "modelo")
+))
+TOKENS_LLM = metricas.registrar(Histograma(
+    "dra_llm_tokens", "Tokens por tentativa de chamada ao LLM", ("provedor", "modelo", "tipo"), BUCKETS_TOKENS
+))
+TENTATIVAS_LLM = metricas.registrar(Histograma(
+    "dra_llm_tentativas", "Tentativas feitas por chamada ao LLM (1 = sem novas tentativas)", ("categoria",), BUCKETS_TENTATIVAS
+))
+
+
+class Span:
+    """Etapa medida de um job; os atributos podem ser completados durante a execução"""
+
+    def __init__(self, nome: str, atributos: dict):
+        self.nome = nome
+        self.atributos = atributos
+        self.status = "ok"
+        self.inicio = time.perf_counter()
+        self.duracao: Optional[float] = None
+
+
+_span_atual: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("span_atual", default=None)
+
+# Tracer do OpenTelemetry, configurado no primeiro span (depois do carregamento do .env)
+_tracer = None
+_provedor_otel = None
+_lock_otel = threading.Lock()
+
+
+def _obter_tracer():
+    global _tracer, _provedor_otel
+    if _tracer is not None:
+        return _tracer or None
+    with _lock_otel:
+        if _tracer is not None:
+            return _tracer or None
+        _tracer = False
+        if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            return None
+        try:
+            from opentelemetry import trace
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        except ImportError:
+            print("OTEL_EXPORTER_OTLP_ENDPOINT definida, mas o OpenTelemetry não está instalado "
+                  "(pip install opentelemetry-sdk opentelemetry-exporter-otlp-proto-http)")
+            return None
+        # Endpoint, cabeçalhos e nome do serviço seguem as variáveis OTEL_* padrão
+        _provedor_otel = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "dra-content")}))
+        _provedor_otel.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        _tracer = _provedor_otel.get_tracer("dra-content")
+        return _tracer
+
+
+def _atributos_otel(atributos: dict) -> dict:
+    return {chave: valor for chave, valor in atributos.items() if isinstance(valor, (str, bool, int, float))}
+
+
+@contextmanager
+def span(nome: str, **atributos) -> Iterator[Span]:
+    """Mede uma etapa: registra a duração no histograma do tipo e, se configurado, exporta o span
+
+    O status é "erro" se a etapa levantar exceção e "cancelado" se o job for cancelado.
+    """
+    atual = Span(nome, atributos)
+    token = _span_atual.set(atual)
+    tracer = _obter_tracer()
+    contexto_otel = None
+    if tracer:
+        from opentelemetry import context, trace
+        span_otel = tracer.start_span(nome, attributes=_atributos_otel(atributos))
+        contexto_otel = (span_otel, context.attach(trace.set_span_in_context(span_otel)))
+    try:
+        yield atual
+    except BaseException as e:
+        # CancelledError do asyncio ou Cancelado do grafo
+        atual.status = "cancelado" if isinstance(e, Cancelado) or type(e).__name__ == "CancelledError" else "erro"
+        atual.atributos.setdefault("erro", f"{type(e).__name__}: {str(e)[:200]}")
+        raise
+    finally:
+        atual.duracao = time.perf_counter() - atual.inicio
+        _span_atual.reset(token)
+        histograma = DURACAO_SPANS.get(nome)
+        if histograma:
+            histograma.observar(atual.duracao, **atual.atributos, status=atual.status)
+        if contexto_otel:
+            from opentelemetry import context, trace
+            span_otel, token_otel = contexto_otel
+            span_otel.set_attributes(_atributos_otel({**atual.atributos, "status": atual.status}))
+            if atual.status == "erro":
+                span_otel.set_status(trace.Status(trace.StatusCode.ERROR, atual.atributos.get("erro")))
+            span_otel.end()
+            context.detach(token_otel)
+
+
+def span_atual() -> Optional[Span]:
+    """Span em andamento no contexto atual (para completar atributos, ex: tokens)"""
+    return _span_atual.get()
+
+
+def encerrar():
+    """Envia os spans pendentes ao coletor (desligamento do servidor)"""
+    if _provedor_otel:
+        _provedor_otel.shutdown()
@@ -5,6 +5,7 @@ Pode ser executado sem a interface web
 import asyncio
 from models import ConfigGerador
 from agents import MarketingAgents
+from custos import calcular_custo
 import json
 from pathlib import Path
 from datetime import datetime
@@ -62,7 +63,7 @@ def test_basic():
     print("🚀 Executando fluxo de geração...")
     print("-" * 60)
     
-    conteudo, avaliacao, logs, iteracoes = agents.executar()
+    conteudo, avaliacao, logs, iteracoes, uso_chamadas = agents.executar()
     
     # Exibir logs
     print()
@@ -87,6 +88,9 @@ def test_basic():
     print(f"  - Nota Final: {avaliacao.nota:.1f}/10")
     print(f"  - Aprovado: {'✅ Sim' if avaliacao.aprovado else '❌ Não'}")
     print(f"  - Iterações: {iteracoes}")
+    custo = calcular_custo(uso_chamadas)
+    print(f"  - Tokens: {custo.tokens_entrada} entrada / {custo.tokens_saida} saída")
+    print(f"  - Custo estimado: US$ {custo.custo_usd:.4f}")
     print()
     
     print(f"  Breakdown da Nota:")
@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+from cache import CacheResultados
+from models import ResultadoFinal
+
+
+def _resultado(pasta, qualidade_pendente: bool):
+    pasta.mkdir()
+    resultado = ResultadoFinal(
+        data_geracao="2026-01-01 00:00:00", id_conteudos="teste", tipo_material="Baralhos Anki",
+        desc_hotmart="d", artigo="a", legenda="l", nome_criativo="n", desc_pv="p",
+        nota_conteudo=6.5, iteracoes_realizadas=3, qualidade_pendente=qualidade_pendente
+    )
+    (pasta / "conteudo.json").write_text(json.dumps(resultado.model_dump()), encoding="utf-8")
+    return pasta
+
+
+@pytest.mark.parametrize("qualidade_pendente", [False, True])
+def test_qualidade_pendente_nao_e_reaproveitada(tmp_path, qualidade_pendente):
+    cache = CacheResultados(tmp_path / "cache")
+    cache.salvar("chave", _resultado(tmp_path / "saida", qualidade_pendente))
+
+    encontrado = cache.obter("chave")
+    assert (encontrado is None) == qualidade_pendente
+    assert (tmp_path / "cache" / "chave.json").exists() != qualidade_pendente
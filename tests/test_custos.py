@@ -0,0 +1,44 @@
+from custos import calcular_custo
+from historico import IndiceResultados
+from models import ResultadoFinal
+
+
+def _resultado(radical, usos, qualidade_pendente=False, data="2026-03-10 10:00:00"):
+    return ResultadoFinal(
+        data_geracao=data, id_conteudos=radical, radical=radical, tipo_material="Baralhos Anki",
+        desc_hotmart="d", artigo="a", legenda="l", nome_criativo="n", desc_pv="p", nota_conteudo=8.5,
+        iteracoes_realizadas=2, qualidade_pendente=qualidade_pendente,
+        custo=calcular_custo(usos) if usos is not None else None
+    )
+
+
+def test_custos_agregados_pelo_indice(tmp_path):
+    indice = IndiceResultados(tmp_path / ".jobs.db")
+    anthropic = {"provedor": "anthropic", "modelo": "claude-haiku-4-5", "tokens_entrada": 1_000_000, "tokens_saida": 0}
+    openai = {"provedor": "openai", "modelo": "gpt-5-mini", "tokens_entrada": 0, "tokens_saida": 1_000_000}
+    indice.indexar_varios([
+        (_resultado("a", [anthropic, anthropic]), tmp_path / "p1", None),
+        (_resultado("a", [anthropic, openai], qualidade_pendente=True), tmp_path / "p2", None),
+        (_resultado("b", None, data="2026-03-11 10:00:00"), tmp_path / "p3", None),
+    ])
+    # Reindexar a mesma pasta substitui os custos, sem duplicar
+    indice.indexar(_resultado("a", [anthropic, anthropic]), tmp_path / "p1")
+
+    por_provedor = {linha["provedor"]: linha for linha in indice.custos("provedor")}
+    assert por_provedor["anthropic"]["jobs"] == 2
+    assert por_provedor["anthropic"]["custo_usd"] == 3.0
+    assert por_provedor["anthropic"]["custo_por_aprovado_usd"] == 3.0
+    assert por_provedor["openai"]["custo_usd"] == 2.0
+    assert por_provedor["desconhecido"]["sem_custo"] == 1
+
+    por_radical = {linha["radical"]: linha for linha in indice.custos("radical")}
+    assert por_radical["a"]["custo_medio_usd"] == 2.5
+    assert por_radical["a"]["tokens_entrada"] == 3_000_000
+    assert por_radical["b"]["jobs"] == 0 and por_radical["b"]["sem_custo"] == 1
+
+    assert [linha["dia"] for linha in indice.custos("dia", de="2026-03-11")] == ["2026-03-11"]
+
+    indice.remover_ausentes({"p2", "p3"})
+    assert {linha["provedor"] for linha in indice.custos("provedor")} == {"anthropic", "openai", "desconhecido"}
+    assert {linha["provedor"]: linha["jobs"] for linha in indice.custos("provedor")}["anthropic"] == 1
+    indice.fechar()
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+from jobs import JobExecutor
+
+
+def test_apos_cancelamento_espera_o_worker_parar():
+    async def cenario():
+        executor = JobExecutor(max_jobs=1)
+        liberar = threading.Event()
+        worker_terminou = threading.Event()
+        chamadas = []
+
+        def worker(emitir):
+            emitir({"type": "log", "message": "iniciado"})
+            liberar.wait(5)
+            worker_terminou.set()
+
+        async def enviar(evento):
+            pass
+
+        def apos_cancelamento():
+            chamadas.append(worker_terminou.is_set())
+
+        tarefa = asyncio.create_task(executor.executar_com_eventos(worker, enviar, apos_cancelamento))
+        await asyncio.sleep(0.05)
+        tarefa.cancel()
+        try:
+            await tarefa
+        except asyncio.CancelledError:
+            pass
+
+        # Cancelado, mas o worker ainda roda: nada é chamado antes de ele parar
+        await asyncio.sleep(0.05)
+        assert chamadas == []
+
+        liberar.set()
+        for _ in range(100):
+            if chamadas:
+                break
+            await asyncio.sleep(0.01)
+        assert chamadas == [True]
+        executor.encerrar()
+
+    asyncio.run(cenario())
@@ -0,0 +1,196 @@
+"""
+Limitador por provedor: fila justa, espera no event loop, descarte de pedidos na fila e devoluções
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import agents
+import mocks
+from limites import EsperaCancelada, LimiteProvedor, Limitador, retry_after
+from models import ConfigGerador
+
+
+def test_async_com_to_thread_na_vaga_nao_trava_com_executor_pequeno():
+    limitador = Limitador({"padrao": {"concorrencia": 1}})
+
+    async def tarefa(indice: int) -> int:
+        async with limitador.reservar_async("mock/imagem"):
+            await asyncio.sleep(0.01)
+            await asyncio.to_thread(time.sleep, 0.01)
+        return indice
+
+    async def principal():
+        # Uma única thread no executor padrão: esperas que ocupassem threads travariam o to_thread
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        return await asyncio.wait_for(asyncio.gather(*(tarefa(i) for i in range(7))), timeout=10)
+
+    assert asyncio.run(principal()) == list(range(7))
+    assert limitador.limite("mock/imagem").aguardando == 0
+
+
+def test_espera_async_cancelada_sai_da_fila():
+    limite = LimiteProvedor(concorrencia=1)
+
+    async def principal():
+        await limite.adquirir_async()
+        espera = asyncio.create_task(limite.adquirir_async())
+        await asyncio.sleep(0.05)
+        assert limite.aguardando == 1
+        espera.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await espera
+        assert limite.aguardando == 0
+        limite.liberar()
+        # A vaga continua disponível para o próximo pedido
+        await asyncio.wait_for(limite.adquirir_async(), timeout=1)
+
+    asyncio.run(principal())
+
+
+def test_threads_e_corrotinas_compartilham_a_fila():
+    limitador = Limitador({"padrao": {"concorrencia": 1}})
+    ocupadas = []
+    maximo = []
+    lock = threading.Lock()
+
+    def ocupar():
+        with lock:
+            ocupadas.append(1)
+            maximo.append(len(ocupadas))
+        time.sleep(0.01)
+        with lock:
+            ocupadas.pop()
+
+    def em_thread():
+        with limitador.reservar("mock/x"):
+            ocupar()
+
+    async def principal():
+        async def em_corrotina():
+            async with limitador.reservar_async("mock/x"):
+                await asyncio.to_thread(ocupar)
+
+        threads = [threading.Thread(target=em_thread) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        await asyncio.gather(*(em_corrotina() for _ in range(4)))
+        for thread in threads:
+            thread.join()
+
+    asyncio.run(principal())
+    assert len(maximo) == 8 and max(maximo) == 1
+
+
+def test_retry_after_em_segundos_e_milissegundos():
+    class Resposta:
+        def __init__(self, headers):
+            self.headers = headers
+
+    class Erro(Exception):
+        def __init__(self, headers):
+            self.response = Resposta(headers)
+
+    assert retry_after(Erro({"retry-after": "3"})) == 3
+    assert retry_after(Erro({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(Erro({})) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_pedido_descartado_na_fila_nao_consome_saldo():
+    limitador = Limitador({"padrao": {"concorrencia": 1, "rpm": 60, "tpm": 1000}})
+    limite = limitador.limite("mock/x")
+    descartada = threading.Event()
+    erros = []
+
+    def esperar():
+        try:
+            with limitador.reservar("mock/x", 500, descartada):
+                pass
+        except EsperaCancelada as e:
+            erros.append(e)
+
+    with limitador.reservar("mock/x", 100) as reserva:
+        reserva.consumidos = 100
+        thread = threading.Thread(target=esperar)
+        thread.start()
+        time.sleep(0.1)
+        descartada.set()
+        thread.join(timeout=2)
+
+    assert len(erros) == 1
+    assert limite.aguardando == 0
+    limite._repor(time.monotonic())
+    # Só o pedido feito consumiu requisição e tokens (o resto é reposição contínua do balde);
+    # sem a devolução, o descartado levaria mais uma requisição e 500 tokens
+    assert 59 <= limite._saldo_requisicoes < 60
+    assert 900 <= limite._saldo_tokens < 950
+
+
+def test_liberar_sem_execucao_devolve_requisicao_e_tokens():
+    limite = LimiteProvedor(rpm=10, tpm=1000)
+    reservados = limite.adquirir(400)
+    limite.liberar(reservados, executada=False)
+    assert limite._saldo_requisicoes == pytest.approx(10)
+    assert limite._saldo_tokens == pytest.approx(1000)
+
+
+def test_liberar_sem_uso_informado_mantem_a_reserva():
+    limite = LimiteProvedor(tpm=1000)
+    reservados = limite.adquirir(400)
+    limite.liberar(reservados)
+    assert limite._saldo_tokens == pytest.approx(600, abs=5)
+
+
+def test_pipeline_mock_sem_vazamento_no_limitador(monkeypatch):
+    """Candidatos disputando uma vaga: a fila não estoura o timeout e cada vaga vira uma chamada"""
+    limitador = Limitador({"mock": {"concorrencia": 1, "rpm": 600, "tpm": 1_000_000}})
+    monkeypatch.setattr(agents, "limitador", limitador)
+    monkeypatch.setattr(mocks, "config_mock", mocks.ConfigMock({"latencia": {"media": 0.15}, "notas": [8.5], "semente": 1}))
+
+    aquisicoes = []
+    adquirir = LimiteProvedor.adquirir
+
+    def contar_aquisicao(self, *args, **kwargs):
+        tokens = adquirir(self, *args, **kwargs)
+        aquisicoes.append(tokens)
+        return tokens
+
+    monkeypatch.setattr(LimiteProvedor, "adquirir", contar_aquisicao)
+    chamadas = []
+    resposta = mocks.ChatMock._resposta
+
+    def contar_chamada(self, *args, **kwargs):
+        chamadas.append(self.modelo)
+        return resposta(self, *args, **kwargs)
+
+    monkeypatch.setattr(mocks.ChatMock, "_resposta", contar_chamada)
+
+    config = ConfigGerador(
+        radical="limite", insumos="Mapas mentais", llm_provider="mock", provedores_fallback=[],
+        candidatos=3, max_iteracoes=1, stream_parcial=False, timeout_llm_segundos=0.3, tentativas_llm=0
+    )
+    conteudo, avaliacao, logs, _, _ = agents.MarketingAgents(config).executar()
+
+    assert conteudo is not None and avaliacao is not None
+    assert not [log for log in logs if "sem resposta" in log]
+    assert len(aquisicoes) == len(chamadas)
+    for limite in limitador._limites.values():
+        assert limite.aguardando == 0 and limite._em_uso == 0
+
+
+def test_modelo_livre_nao_cria_chaves_novas():
+    perfil = agents.PerfilLLM("mock", "zzz-modelo-1", 1000, 0.7, 210)
+    assert agents._chave_limite(perfil) == "mock/outro"
+    assert agents._nome_chamada(perfil) == "mock (outro)"
+    assert agents._rotulo_modelo(agents.PerfilLLM("mock", "mock-criador", 1000, 0.7, 210)) == "mock-criador"
+
+
+def test_provedor_desconhecido_e_rejeitado():
+    with pytest.raises(ValueError):
+        ConfigGerador(radical="x", insumos="y", llm_provider="zzz")
+    with pytest.raises(ValueError):
+        ConfigGerador(radical="x", insumos="y", image_provider="zzz")
@@ -0,0 +1,16 @@
+from mocks import ConfigMock
+
+
+def test_reiniciar_repete_os_sorteios_sem_guardar_o_prompt():
+    config = ConfigMock({"semente": 7, "notas": [6.5, 8.5]})
+    prompt = "Radical: teste\n" + "x" * 10_000
+
+    primeira = [config.sorteador(prompt).random() for _ in range(3)]
+    notas = [config.proxima_nota("abc"), config.proxima_nota("abc")]
+    assert notas == [6.5, 8.5]
+    assert all(len(chave) == 16 for chave in config._sorteios)
+
+    config.reiniciar()
+    assert not config._sorteios and not config._revisoes
+    assert [config.sorteador(prompt).random() for _ in range(3)] == primeira
+    assert config.proxima_nota("abc") == 6.5
@@ -0,0 +1,156 @@
+"""
+Failover, novas tentativas, timeout contado a partir da vaga e cancelamento de executar_com_failover
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import agents
+import resiliencia
+from limites import Limitador
+from models import ConfigGerador
+from resiliencia import Cancelado, Chamada, FalhaProvedores, executar_com_failover
+
+
+class ErroSobrecarga(Exception):
+    """Falha passageira, como um 503 do provedor"""
+    status_code = 503
+
+
+@pytest.fixture(autouse=True)
+def sem_backoff(monkeypatch):
+    monkeypatch.setattr(resiliencia, "espera_backoff", lambda tentativa, base=1.0, maximo=20.0: 0.01)
+
+
+def test_failover_em_erro_permanente():
+    def falhar(tentativa):
+        raise ValueError("schema inválido")
+
+    avisos = []
+    indice, resultado = executar_com_failover(
+        [Chamada("a", falhar), Chamada("b", lambda tentativa: "ok")],
+        timeout=5, categoria="teste", avisar=avisos.append
+    )
+    assert (indice, resultado) == (1, "ok")
+    assert any("usando b" in aviso for aviso in avisos)
+
+
+def test_nova_tentativa_em_erro_transitorio():
+    feitas = []
+
+    def instavel(tentativa):
+        feitas.append(1)
+        if len(feitas) < 3:
+            raise ErroSobrecarga("sobrecarga")
+        return "ok"
+
+    assert executar_com_failover([Chamada("a", instavel)], timeout=5, tentativas=2) == (0, "ok")
+    assert len(feitas) == 3
+
+
+def test_tentativas_esgotadas_levantam_falha_provedores():
+    def sempre_falha(tentativa):
+        raise ErroSobrecarga("sobrecarga")
+
+    with pytest.raises(FalhaProvedores) as erro:
+        executar_com_failover([Chamada("a", sempre_falha), Chamada("b", sempre_falha)], timeout=5, tentativas=1)
+    assert len(erro.value.erros) == 4
+
+
+def test_timeout_descarta_a_tentativa():
+    tentativas = []
+
+    def lenta(tentativa):
+        tentativas.append(tentativa)
+        tentativa.wait(2)
+        return "tarde"
+
+    with pytest.raises(FalhaProvedores, match="sem resposta"):
+        executar_com_failover([Chamada("a", lenta)], timeout=0.2, tentativas=0)
+    assert tentativas[0].is_set()
+
+
+def test_timeout_tenta_de_novo_sem_cancelar_o_job():
+    """O sinal de descarte da tentativa não pode ser confundido com o cancelamento do job"""
+    feitas = []
+
+    def lenta_na_primeira(tentativa):
+        feitas.append(1)
+        if len(feitas) == 1:
+            tentativa.wait(2)
+        return "ok"
+
+    indice, resultado = executar_com_failover(
+        [Chamada("a", lenta_na_primeira)], timeout=0.2, tentativas=1, cancelado=threading.Event()
+    )
+    assert (indice, resultado) == (0, "ok")
+    assert len(feitas) == 2
+
+
+def test_cancelamento_descarta_as_chamadas_em_andamento():
+    tentativas = []
+
+    def lenta(tentativa):
+        tentativas.append(tentativa)
+        tentativa.wait(2)
+        return "tarde"
+
+    cancelado = threading.Event()
+    threading.Timer(0.1, cancelado.set).start()
+    with pytest.raises(Cancelado):
+        executar_com_failover([Chamada("a", lenta)], timeout=5, tentativas=0, cancelado=cancelado)
+    assert tentativas[0].is_set()
+
+
+def test_espera_na_fila_nao_conta_no_timeout():
+    def enfileirada(tentativa):
+        tentativa.aguardar_vaga()
+        time.sleep(0.6)
+        tentativa.iniciar()
+        time.sleep(0.1)
+        return "ok"
+
+    assert executar_com_failover([Chamada("a", enfileirada)], timeout=0.3, tentativas=0) == (0, "ok")
+
+
+
+def test_espera_por_thread_livre_nao_conta_no_timeout(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(resiliencia, "_pool", pool)
+    # Uma chamada travada ocupa a única thread por mais que o timeout
+    pool.submit(time.sleep, 0.6)
+    assert executar_com_failover([Chamada("a", lambda tentativa: "ok")], timeout=0.3, tentativas=0) == (0, "ok")
+    pool.shutdown()
+
+def test_cancelamento_tira_a_tentativa_da_fila_sem_consumir():
+    limitador = Limitador({"padrao": {"concorrencia": 1, "rpm": 60}})
+    limite = limitador.limite("mock/x")
+    executadas = []
+
+    def na_fila(tentativa):
+        tentativa.aguardar_vaga()
+        with limitador.reservar("mock/x", 0, tentativa):
+            tentativa.iniciar()
+            executadas.append(1)
+        return "ok"
+
+    cancelado = threading.Event()
+    threading.Timer(0.2, cancelado.set).start()
+    with limitador.reservar("mock/x"):
+        with pytest.raises(Cancelado):
+            executar_com_failover([Chamada("a", na_fila)], timeout=0.1, tentativas=0, cancelado=cancelado)
+        # A tentativa descartada sai da fila sozinha (verifica o sinal a cada INTERVALO_CANCELAMENTO)
+        prazo = time.monotonic() + 2
+        while limite.aguardando and time.monotonic() < prazo:
+            time.sleep(0.05)
+        assert limite.aguardando == 0
+    assert not executadas
+    assert limite._em_uso == 0
+
+
+def test_cliente_encerra_pouco_depois_do_timeout_da_chamada():
+    config = ConfigGerador(radical="x", insumos="y", llm_provider="mock", timeout_llm_segundos=20)
+    assert agents.perfil_criador(config).timeout == 20 + agents.MARGEM_TIMEOUT_CLIENTE
+    assert agents.perfil_revisor(config).timeout == 20 + agents.MARGEM_TIMEOUT_CLIENTE
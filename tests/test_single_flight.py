@@ -0,0 +1,101 @@
+"""
+Deduplicação de execuções idênticas: SingleFlight e o job único criado por gerar_conteudos
+"""
+import asyncio
+import importlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from jobs import SingleFlight
+from models import ConfigGerador
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def test_pedidos_identicos_compartilham_uma_execucao():
+    single_flight = SingleFlight()
+    execucoes = []
+
+    async def gerar(publicar):
+        execucoes.append(1)
+        await publicar({"type": "info", "message": "início"})
+        await asyncio.sleep(0.05)
+        await publicar({"type": "info", "message": "fim"})
+        return "resultado"
+
+    async def principal():
+        recebidos = ([], [])
+
+        async def cliente(indice):
+            async def enviar(evento):
+                recebidos[indice].append(evento["message"])
+            return await single_flight.executar("chave", gerar, enviar)
+
+        primeiro = asyncio.create_task(cliente(0))
+        await asyncio.sleep(0.01)
+        # O segundo chega depois do primeiro evento e o recebe pelo histórico
+        segundo = await cliente(1)
+        return await primeiro, segundo, recebidos
+
+    primeiro, segundo, recebidos = asyncio.run(principal())
+    assert primeiro == ("resultado", False)
+    assert segundo == ("resultado", True)
+    assert len(execucoes) == 1
+    assert recebidos[0] == recebidos[1] == ["início", "fim"]
+    assert not single_flight.em_andamento("chave")
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    """Aplicação importada em uma pasta temporária (outputs/ e os bancos ficam fora do repositório)"""
+    pasta = tmp_path_factory.mktemp("app")
+    for nome in ("templates", "static"):
+        shutil.copytree(RAIZ / nome, pasta / nome)
+    anterior = os.getcwd()
+    os.chdir(pasta)
+    try:
+        modulo = importlib.import_module("app")
+        yield modulo
+        modulo.registro.fechar()
+        modulo.indice.fechar()
+    finally:
+        os.chdir(anterior)
+
+
+def test_pedidos_identicos_simultaneos_criam_um_so_job(app, monkeypatch):
+    execucoes = []
+
+    async def executar_geracao(config, chave, job_id, publicar):
+        execucoes.append(job_id)
+        await asyncio.sleep(0.05)
+        await publicar({"type": "info", "message": "gerando"})
+        return None
+
+    monkeypatch.setattr(app, "executar_geracao", executar_geracao)
+    config = ConfigGerador(
+        radical="corrida", insumos="Mapas mentais", llm_provider="mock", image_provider="mock", force_refresh=True
+    )
+
+    async def principal():
+        recebidos = ([], [])
+
+        async def cliente(indice):
+            async def enviar(evento):
+                # Como no WebSocket, o envio devolve o controle ao event loop
+                await asyncio.sleep(0)
+                recebidos[indice].append(evento)
+            return await app.gerar_conteudos(config, enviar)
+
+        await asyncio.gather(cliente(0), cliente(1))
+        return recebidos
+
+    recebidos = asyncio.run(principal())
+    assert len(execucoes) == 1
+    for eventos in recebidos:
+        assert [evento["job_id"] for evento in eventos if evento["type"] == "job"] == execucoes
+    jobs = [job for job in app.registro.interrompidos() if json.loads(job["config"])["radical"] == "corrida"]
+    assert [job["job_id"] for job in jobs] == execucoes
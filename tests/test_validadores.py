@@ -0,0 +1,67 @@
+"""
+Validações e reparos determinísticos do conteúdo, executados antes do revisor LLM
+"""
+from models import ConteudoGerado
+from validadores import PADRAO_CTA, normalizar, reparar, validar
+
+
+VALIDO = {
+    "tipo_material": "Baralhos Anki",
+    "desc_hotmart": "Baralhos Anki de Direito Administrativo para acelerar sua aprovação.",
+    "artigo": "<article><h1>Baralhos Anki</h1><p>Estude com <strong>método</strong>.</p></article>",
+    "legenda": "📚 Baralhos Anki para dAdm! Garanta já o seu, link na bio. #concursos #dAdm",
+    "nome_criativo": "Anki dAdm Turbo",
+    "desc_pv": "Aprovação com Baralhos Anki de Direito Administrativo",
+}
+
+
+def _conteudo(**campos) -> ConteudoGerado:
+    return ConteudoGerado(**{**VALIDO, **campos})
+
+
+def _reprovados(conteudo: ConteudoGerado) -> dict[str, str]:
+    return {veredicto.campo: veredicto.feedback for veredicto in validar(conteudo)}
+
+
+def test_conteudo_valido_passa():
+    assert validar(_conteudo()) == []
+
+
+def test_cta_exige_palavra_inteira():
+    assert PADRAO_CTA.search("Garanta já, link na bio")
+    assert PADRAO_CTA.search("Vem estudar com a gente")
+    assert not PADRAO_CTA.search("O método provém da prática")
+    assert not PADRAO_CTA.search("Um conteúdo que acessei ontem")
+
+
+def test_legenda_sem_hashtag_nem_cta():
+    feedback = _reprovados(_conteudo(legenda="O material provém de anos de estudo."))["legenda"]
+    assert "hashtags" in feedback and "chamada para ação" in feedback
+
+
+def test_nome_e_desc_pv_longos():
+    reprovados = _reprovados(_conteudo(nome_criativo="Um nome com seis palavras aqui", desc_pv="uma " * 26))
+    assert set(reprovados) == {"nome_criativo", "desc_pv"}
+
+
+def test_artigo_fora_de_article_ou_malformado():
+    assert "artigo" in _reprovados(_conteudo(artigo="<p>Sem article</p>"))
+    assert "malformado" in _reprovados(_conteudo(artigo="<article><p><b>Texto</p></article>"))["artigo"]
+
+
+def test_reparar_fecha_tags_e_envolve_em_article():
+    conteudo, reparos = reparar(_conteudo(artigo="<h1>Título</h1><p>Texto cortado", nome_criativo=' "Anki  Turbo" '))
+    assert conteudo.artigo == "<article>\n<h1>Título</h1><p>Texto cortado</p>\n</article>"
+    assert conteudo.nome_criativo == "Anki Turbo"
+    assert len(reparos) == 3
+    assert validar(conteudo) == []
+
+
+def test_normalizar_trunca_e_corrige_literal():
+    dados = _conteudo().model_dump()
+    dados.update(desc_hotmart="palavra " * 400, tipo_material="mapas mentais")
+    normalizados, reparos = normalizar(dados, ConteudoGerado)
+    conteudo = ConteudoGerado.model_validate(normalizados)
+    assert len(conteudo.desc_hotmart) <= 1800 and conteudo.desc_hotmart.endswith("…")
+    assert conteudo.tipo_material == "Mapas Mentais"
+    assert len(reparos) == 2
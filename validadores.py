@@ -0,0 +1,172 @@
+"""
+Validações determinísticas do conteúdo gerado, executadas antes do revisor LLM
+"""
+import re
+import typing
+import unicodedata
+from html.parser import HTMLParser
+
+from pydantic import BaseModel, ValidationError
+
+from models import ConteudoGerado, VeredictoCampo
+
+MAX_PALAVRAS_NOME = 5
+MAX_PALAVRAS_DESC_PV = 25
+
+# Expressões típicas de chamada para ação em legendas (palavras inteiras: "vem" não casa com "provém")
+PADRAO_CTA = re.compile(
+    r"\b(?:link na bio|garanta|acesse|clique|compre|confira|saiba mais|comente|salve|"
+    r"aproveite|inscreva|baixe|adquira|corre|vem|chama|marque|compartilhe)\b",
+    re.IGNORECASE
+)
+PADRAO_HASHTAG = re.compile(r"#\w+")
+
+# Tags HTML que não possuem fechamento
+TAGS_VAZIAS = {"br", "hr", "img", "input", "meta", "link", "source", "wbr", "area", "col", "embed"}
+
+
+class _VerificadorHTML(HTMLParser):
+    """Acompanha a pilha de tags abertas para detectar HTML malformado"""
+
+    def __init__(self):
+        super().__init__()
+        self.pilha: list[str] = []
+        self.erros: list[str] = []
+        self.tags: set[str] = set()
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.add(tag)
+        if tag not in TAGS_VAZIAS:
+            self.pilha.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in TAGS_VAZIAS:
+            return
+        if tag not in self.pilha:
+            self.erros.append(f"</{tag}> sem abertura correspondente")
+            return
+        # Tags abertas depois da que está fechando ficaram sem fechamento
+        while self.pilha:
+            aberta = self.pilha.pop()
+            if aberta == tag:
+                break
+            self.erros.append(f"<{aberta}> fechada fora de ordem")
+
+
+def _analisar_html(html: str) -> _VerificadorHTML:
+    verificador = _VerificadorHTML()
+    verificador.feed(html)
+    verificador.close()
+    return verificador
+
+
+def reparar(conteudo: ConteudoGerado) -> tuple[ConteudoGerado, list[str]]:
+    """Corrige problemas triviais no próprio conteúdo; retorna o conteúdo e os reparos feitos"""
+    reparos = []
+    dados = conteudo.model_dump()
+
+    for campo, valor in dados.items():
+        if isinstance(valor, str) and valor != valor.strip():
+            dados[campo] = valor.strip()
+
+    nome = re.sub(r"\s+", " ", dados["nome_criativo"]).strip("\"'“”")
+    if nome != dados["nome_criativo"]:
+        dados["nome_criativo"] = nome
+        reparos.append("nome_criativo: aspas/espaços extras removidos")
+
+    artigo = dados["artigo"]
+    verificador = _analisar_html(artigo)
+    if not verificador.erros and verificador.pilha:
+        # Resposta truncada: fechar as tags que ficaram abertas
+        artigo += "".join(f"</{tag}>" for tag in reversed(verificador.pilha))
+        reparos.append(f"artigo: {len(verificador.pilha)} tag(s) não fechada(s) completada(s)")
+    if "article" not in verificador.tags and verificador.tags:
+        artigo = f"<article>\n{artigo}\n</article>"
+        reparos.append("artigo: envolvido em <article>")
+    dados["artigo"] = artigo
+
+    return ConteudoGerado.model_validate(dados), reparos
+
+
+def validar(conteudo: ConteudoGerado) -> list[VeredictoCampo]:
+    """Retorna um veredicto reprovado para cada campo com problema mecânico"""
+    problemas = []
+
+    def reprovar(campo: str, feedback: str):
+        problemas.append(VeredictoCampo(campo=campo, aprovado=False, feedback=feedback))
+
+    # O tamanho da desc_hotmart já é garantido pelo schema (max_length) e pelo reparo que trunca
+
+    palavras_nome = len(conteudo.nome_criativo.split())
+    if palavras_nome > MAX_PALAVRAS_NOME:
+        reprovar("nome_criativo", f"Tem {palavras_nome} palavras; use no máximo {MAX_PALAVRAS_NOME}")
+
+    palavras_pv = len(conteudo.desc_pv.split())
+    if palavras_pv > MAX_PALAVRAS_DESC_PV:
+        reprovar("desc_pv", f"Tem {palavras_pv} palavras; use no máximo {MAX_PALAVRAS_DESC_PV}")
+
+    verificador = _analisar_html(conteudo.artigo)
+    if "article" not in verificador.tags:
+        reprovar("artigo", "O artigo deve ser HTML dentro de <article>...</article>")
+    elif verificador.erros or verificador.pilha:
+        erros = verificador.erros + [f"<{tag}> não fechada" for tag in verificador.pilha]
+        reprovar("artigo", "HTML malformado: " + "; ".join(erros[:5]))
+
+    faltando = []
+    if not PADRAO_HASHTAG.search(conteudo.legenda):
+        faltando.append("hashtags relevantes")
+    if not PADRAO_CTA.search(conteudo.legenda):
+        faltando.append("uma chamada para ação (ex: 'link na bio', 'garanta já')")
+    if faltando:
+        reprovar("legenda", "A legenda precisa incluir " + " e ".join(faltando))
+
+    return problemas
+
+
+def _sem_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn").lower().strip()
+
+
+def truncar(texto: str, max_chars: int) -> str:
+    """Corta o texto no limite, preferindo terminar em fim de palavra"""
+    if len(texto) <= max_chars:
+        return texto
+    corte = texto[:max_chars - 1]
+    if " " in corte[int(max_chars * 0.6):]:
+        corte = corte.rsplit(" ", 1)[0]
+    return corte.rstrip(" ,;:-") + "…"
+
+
+def normalizar(dados: dict, schema: type[BaseModel]) -> tuple[dict, list[str]]:
+    """Corrige localmente os erros de validação que não exigem nova chamada ao LLM"""
+    try:
+        schema.model_validate(dados)
+        return dados, []
+    except ValidationError as e:
+        erros = e.errors()
+
+    dados = dict(dados)
+    reparos = []
+    for erro in erros:
+        if len(erro["loc"]) != 1 or erro["loc"][0] not in schema.model_fields:
+            continue
+        campo = erro["loc"][0]
+        valor = dados.get(campo)
+        ctx = erro.get("ctx", {})
+
+        if erro["type"] == "string_too_long" and isinstance(valor, str):
+            dados[campo] = truncar(valor.strip(), ctx["max_length"])
+            reparos.append(f"{campo}: truncado de {len(valor)} para {len(dados[campo])} caracteres")
+
+        elif erro["type"] in ("less_than_equal", "greater_than_equal") and isinstance(valor, (int, float)):
+            dados[campo] = ctx.get("le", ctx.get("ge"))
+            reparos.append(f"{campo}: {valor} ajustado para {dados[campo]}")
+
+        elif erro["type"] == "literal_error" and isinstance(valor, str):
+            opcoes = typing.get_args(schema.model_fields[campo].annotation)
+            equivalente = next((o for o in opcoes if _sem_acentos(o) == _sem_acentos(valor)), None)
+            if equivalente:
+                dados[campo] = equivalente
+                reparos.append(f"{campo}: '{valor}' normalizado para '{equivalente}'")
+
+    return dados, reparos